@@ -25,9 +25,14 @@ if TYPE_CHECKING:  # pragma: no cover
     from pathlib import Path
     import logging
 
+    from pydicom.tag import BaseTag
+
+    from protocol_qc.field_stats import FieldStats
+
 from protocol_qc.classes.acquisition import TemplateAcquisition
 from protocol_qc.classes.protocol import TemplateProtocol
 from protocol_qc.classes.series import TemplateSeries
+from protocol_qc.utils.dicom_fields import field_tags
 
 
 def duplicates_settings(acq_specifications: dict[str, Any]) -> tuple[bool, int]:
@@ -172,11 +177,53 @@ def get_num_files(fields_series: dict[str, Any]) -> tuple[int, ...] | int | None
     return num_files
 
 
+def get_required_tags(templates: list[tuple[str, dict[str, Any]]]) -> set[BaseTag]:
+    """
+    Find the DICOM tags read by the fields and custom tags of the protocol
+    templates. Must be called before the templates are built, as building a
+    template removes its "GENERAL" section.
+
+    Parameters
+    ----------
+    templates
+        List of tuples containing template name and template.
+
+    Returns
+    -------
+        Set of top level DICOM tags.
+    """
+
+    field_names: set[str] = set()
+    for _, template in templates:
+        for label, specs in template.items():
+            if not isinstance(specs, dict):
+                continue
+            field_names.update(specs.get("fields", {}))
+            if label == "GENERAL":
+                for tag_spec in specs.get("tags", {}).values():
+                    if tag_spec.get("type") == "fill_with":
+                        field_names.add(tag_spec["tag"])
+                    elif isinstance(tag_spec.get("tag"), dict):
+                        field_names.update(x["field"] for x in tag_spec["tag"].values())
+                continue
+            for specs_series in specs.get("series", {}).values():
+                field_names.update(specs_series.get("fields", {}))
+
+    tags: set[BaseTag] = set()
+    for field_name in field_names:
+        tags |= field_tags(field_name)
+
+    return tags
+
+
 def build_templates(
     template: tuple[str, dict[str, Any]],
     min_match_score: float,
     patient_id: str,
     logger: logging.Logger,
+    prune_scores: bool = False,
+    field_stats: FieldStats | None = None,
+    memo_scores: bool = False,
 ) -> TemplateProtocol:
     """
     Build a protocol templates from the user defined template file.
@@ -187,6 +234,14 @@ def build_templates(
         Path to to user defined protocol template.
     logger:
         Custom template logger.
+    prune_scores
+        Stop comparing a data series against a series template once it can no
+        longer reach min_match_score.
+    field_stats
+        Comparison statistics used to order the fields of each series template.
+    memo_scores
+        Reuse the score of data series with the same values for every field of
+        a series template.
 
     Returns
     -------
@@ -210,7 +265,8 @@ def build_templates(
         if "series" not in specs_acq:
             raise KeyError(
                 f"Malformed template {template[0]}:"
-                f" no \"series\" nominated for acquisition {label_acq}")
+                f' no "series" nominated for acquisition {label_acq}'
+            )
         for label_series, specs_series in specs_acq["series"].items():
             logger.info(f"   - series: {label_series}")
 
@@ -224,7 +280,12 @@ def build_templates(
                 get_num_files(fields_series),
                 min_match_score,
                 fields=fields_series["fields"],
+                prune_scores=prune_scores,
+                field_stats=field_stats,
+                memo_scores=memo_scores,
             )
+            # Validate the fields and build their comparators once
+            template_series.compile_fields()
 
             templates_series.append(template_series)
 
@@ -18,31 +18,108 @@ A wrapper class for DICOM data built.
 """
 
 import dataclasses
+import logging
 from pathlib import Path
+from typing import Any
 
 import pydicom
 
+from protocol_qc.utils.cust_logging import LogRecords, record_logger
+from protocol_qc.utils.dicom_fields import SeriesFacets, extract_field, series_facets
 
-@dataclasses.dataclass()
+# Keeps the records logged while extracting a field, see extract_cached
+_LOGGER_EXTRACT, _HANDLER_EXTRACT = record_logger("protocol_qc.extract_field")
+
+
+def extract_cached(
+    field_name: str,
+    data: pydicom.dataset.Dataset,
+    extracted: dict[str, Any],
+    extract_records: dict[str, LogRecords],
+    facets: SeriesFacets,
+    logger: logging.Logger,
+) -> Any:
+    """
+    Return the value of a template field, extracting it from 'data' on first
+    access (see utils.dicom_fields.extract_field). The warnings logged while
+    extracting the field are kept with its value, and logged again on each
+    access, so every template reading the field logs them.
+
+    Parameters
+    ----------
+    field_name
+        Name of a template field.
+    data
+        pydicom Dataset of the series.
+    extracted
+        Values already extracted from 'data', keyed by field name.
+    extract_records
+        Records logged while extracting the fields in 'extracted', keyed by
+        field name. Only fields that logged records are present.
+    facets
+        SeriesFacets of 'data'.
+    logger
+        Logger for fields that could not be read.
+
+    Returns
+    -------
+        Value of the field, or None if it is missing.
+    """
+
+    if field_name not in extracted:
+        extracted[field_name] = extract_field(field_name, data, _LOGGER_EXTRACT, facets)
+        if records := _HANDLER_EXTRACT.take():
+            extract_records[field_name] = records
+
+    for level, message in extract_records.get(field_name, []):
+        logger.log(level, message)
+
+    return extracted[field_name]
+
+
+@dataclasses.dataclass(slots=True)
 class DataSeries:
     """
-    Scan class to to wrap a pydicom.dataset.FileDataset object.
+    Scan class to to wrap the header of a single DICOM slice. When built from
+    templates, only the elements referenced by the templates are kept (see
+    utils.dicom_fields.compact_dataset), so the header size does not grow with
+    the size of the image. The kept elements are still held in a pydicom
+    Dataset, with its per-element overhead, rather than as plain values.
 
     Parameters
     ----------
     data
-        pydicom.dataset.FileDataset for a single DICOM slice.
+        pydicom Dataset for a single DICOM slice.
     num_files
         Number of files sharing the same SeriesUID as the single DICOM stored in
         'data'
     path:
         Path to the single DICOM slice used to compare against the use defined
         templates.
+    extracted
+        Field values extracted from 'data', keyed by template field name. Filled
+        on first access and shared by all templates and custom tags.
+    extract_records
+        Records logged while extracting the fields in 'extracted', logged
+        again whenever the field is read. See extract_cached.
+    facets
+        SOPClassUID and private field map of the series, computed once from
+        'data' to select how fields are extracted.
     """
 
-    data: pydicom.dataset.FileDataset
+    data: pydicom.dataset.Dataset
     num_files: int
     path: Path
+    extracted: dict[str, Any] = dataclasses.field(
+        default_factory=dict, repr=False, compare=False
+    )
+    extract_records: dict[str, LogRecords] = dataclasses.field(
+        default_factory=dict, repr=False, compare=False
+    )
+    facets: SeriesFacets = dataclasses.field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        self.facets = series_facets(self.data)
 
     def __str__(self) -> str:
         return (
@@ -53,3 +130,29 @@ class DataSeries:
     def unique_label(self) -> str:
         """Return a unique label to associate with the scan"""
         return f"{self.data.SeriesNumber}:{self.data.SeriesDescription}"
+
+    def get_field(self, field_name: str, logger: logging.Logger) -> Any:
+        """
+        Return the value of a template field, extracting it from 'data' on first
+        access. See extract_cached.
+
+        Parameters
+        ----------
+        field_name
+            Name of a template field.
+        logger
+            Logger for fields that could not be read.
+
+        Returns
+        -------
+            Value of the field, or None if it is missing.
+        """
+
+        return extract_cached(
+            field_name,
+            self.data,
+            self.extracted,
+            self.extract_records,
+            self.facets,
+            logger,
+        )
@@ -0,0 +1,45 @@
+# protocol_qc: An MRI DICOM protocol quality control tool
+# Copyright (C) 2025 The Florey Institute of Neuroscience and Mental Health
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+State kept between incremental scans of a directory.
+"""
+
+import dataclasses
+
+from .dataseries import DataSeries
+
+
+@dataclasses.dataclass()
+class IngestState:
+    """
+    Files and series already ingested from a directory that is still
+    receiving DICOM files.
+
+    Parameters
+    ----------
+    seen
+        Paths of all DICOM files that have already been ingested.
+    series
+        DataSeries built so far, keyed by SeriesInstanceUID.
+    pending
+        Stat signature (size, mtime in nanoseconds) of the representatives of
+        new series on the last scan, keyed by path. A new series is only built
+        once its representative is unchanged between two scans.
+    """
+
+    seen: set[str] = dataclasses.field(default_factory=set)
+    series: dict[str, DataSeries] = dataclasses.field(default_factory=dict)
+    pending: dict[str, tuple[int, int]] = dataclasses.field(default_factory=dict)
@@ -24,8 +24,12 @@ import datetime
 import logging
 from typing import Any
 
+from protocol_qc.match_engine import candidate_templates
 from protocol_qc.match_statuses import MatchStatus
+from protocol_qc.score_matrix import ScoreMatrix
+from protocol_qc.utils.exact_index import ExactFieldIndex
 from protocol_qc.utils.formatting import WIDTH_TOTAL, WIDTHS
+from protocol_qc.utils.patterns import DescriptionIndex
 
 from .acquisition import TemplateAcquisition
 from .dataseries import DataSeries
@@ -76,6 +80,20 @@ class TemplateProtocol:
         0: none were specified
         1: one or more specified and none found
         2: one or more specified and one or more found
+    patient_id
+        PatientID of the data.
+    description_index
+        Index of the SeriesDescription patterns of the series templates, which
+        may be shared with other protocol templates. Built when comparing if
+        not set.
+    exact_index
+        Optional index of the exact comparison fields of the series templates,
+        which may be shared with other protocol templates. If set, series
+        templates are only compared to the data series that can score above
+        min_match_score against them.
+    score_matrix
+        Scores of the series templates against the data series, built after
+        comparing if NumPy is installed.
     """
 
     name: str
@@ -99,6 +117,9 @@ class TemplateProtocol:
     has_issue: bool = False
     optional_scans: int = 0
     patient_id: str | None = None
+    description_index: DescriptionIndex | None = None
+    exact_index: ExactFieldIndex | None = None
+    score_matrix: ScoreMatrix | None = None
 
     def not_empty(self) -> bool:
         """
@@ -197,6 +218,41 @@ class TemplateProtocol:
 
         return list_to_return
 
+    def description_patterns(self) -> list[tuple[int, str]]:
+        """
+        Return the SeriesDescription patterns of the series templates, keyed by
+        the id of each series template, for building a DescriptionIndex.
+
+        Returns
+        -------
+            List of (key, pattern) of the indexable series templates.
+        """
+
+        return [
+            (id(template_series), pattern)
+            for template_series in self.get_template_series()
+            if (pattern := template_series.description_pattern()) is not None
+        ]
+
+    def exact_fields(self) -> list[tuple[int, dict[str, dict[str, Any]], float]]:
+        """
+        Return the fields of the series templates, keyed by the id of each
+        series template, for building an ExactFieldIndex.
+
+        Returns
+        -------
+            List of (key, fields, min_match_score) of the series templates.
+        """
+
+        return [
+            (
+                id(template_series),
+                template_series.fields,
+                template_series.min_match_score,
+            )
+            for template_series in self.get_template_series()
+        ]
+
     def set_general_settings(self, template: dict[str, Any]) -> None:
         """
         Set all general settings for protocol template.
@@ -456,17 +512,21 @@ class TemplateProtocol:
             List of DataSeries classes built from unique DICOM series.
         """
 
-        # Create list of all data series in each templates match list
-        matched_series: list[str] = []
-        for template_series in self.get_template_series():
-            for series in template_series.matches:
-                matched_series.append(series.unique_label)
+        unmatched: list[str]
+        if self.score_matrix is not None:
+            unmatched = self.score_matrix.unmatched()
+        else:
+            # Create list of all data series in each templates match list
+            matched_series: list[str] = []
+            for template_series in self.get_template_series():
+                for series in template_series.matches:
+                    matched_series.append(series.unique_label)
 
-        # Reduce to only unique entries
-        all_series_names: set[str] = {x.unique_label() for x in all_series}
+            # Reduce to only unique entries
+            all_series_names: set[str] = {x.unique_label() for x in all_series}
 
-        # Find series without a match
-        unmatched: list[str] = sorted(all_series_names.difference(set(matched_series)))
+            # Find series without a match
+            unmatched = sorted(all_series_names.difference(set(matched_series)))
 
         self.extra_series = len(unmatched)
 
@@ -480,6 +540,7 @@ class TemplateProtocol:
     def compare_series(
         self,
         all_series: list[DataSeries],
+        matched: bool = False,
     ) -> None:
         """
         Compare the scan data against the user provided templates.
@@ -490,19 +551,29 @@ class TemplateProtocol:
         ----------
         all_series
             List of DataSeries classes built from unique DICOM series.
+        matched
+            The series templates were already compared against the data series
+            (see match_engine.MatchEngine), so only their results and the log
+            records of each comparison are logged.
         """
 
         self.logger.info("-" * WIDTH_TOTAL)
         self.logger.info("Comparing series in protocol template against data...")
         self.logger.info("-" * WIDTH_TOTAL)
 
-        for template_series in self.get_template_series():
-            self.logger.info(f" Comparing series template: {template_series.name}")
-            for series in all_series:
-                if not template_series.similar_series_names(series.data):
-                    continue
-                self.logger.info(f" -> to data series {series.unique_label()}...")
-                template_series.compare_with_data_series(series)
+        if matched:
+            for template_series in self.get_template_series():
+                self.logger.info(f" Comparing series template: {template_series.name}")
+                for series_match, records in zip(
+                    template_series.series_matches, template_series.series_records
+                ):
+                    self.logger.info(
+                        f" -> to data series {series_match.unique_label}..."
+                    )
+                    for level, message in records:
+                        template_series.logger.log(level, message)
+        else:
+            self.match_series(all_series)
 
         self.logger.info("-" * WIDTH_TOTAL)
         self.logger.info(f"{'Summary of series matches': ^{WIDTH_TOTAL}}")
@@ -513,12 +584,55 @@ class TemplateProtocol:
         )
         self.logger.info("-" * WIDTH_TOTAL)
 
+        self.score_matrix = ScoreMatrix.build(self.get_template_series(), all_series)
+        if self.score_matrix is not None:
+            self.score_matrix.calc_match_status()
         for template_series in self.get_template_series():
-            template_series.calc_match_status()
+            if self.score_matrix is None:
+                template_series.calc_match_status()
             template_series.print_match_status()
 
         self.print_extra_series(all_series)
 
+    def match_series(self, all_series: list[DataSeries]) -> None:
+        """
+        Compare each series template against the data series it is a candidate
+        for, see match_engine.candidate_templates.
+
+        Parameters
+        ----------
+        all_series
+            List of DataSeries classes built from unique DICOM series.
+        """
+
+        if self.description_index is None:
+            self.description_index = DescriptionIndex(self.description_patterns())
+
+        # Keyed by id, as in the indexes, which may be shared with other
+        # protocol templates
+        templates: list[tuple[int, TemplateSeries]] = [
+            (id(x), x) for x in self.get_template_series()
+        ]
+        candidates: list[frozenset[int]] = [
+            frozenset(
+                candidate_templates(
+                    series,
+                    templates,
+                    self.description_index,
+                    self.exact_index,
+                    self.logger,
+                )
+            )
+            for series in all_series
+        ]
+
+        for key, template_series in templates:
+            self.logger.info(f" Comparing series template: {template_series.name}")
+            for idx, series in enumerate(all_series):
+                if key in candidates[idx]:
+                    self.logger.info(f" -> to data series {series.unique_label()}...")
+                    template_series.compare_with_data_series(series)
+
     def compare_acquisitions(self) -> None:
         """
         Calculate match at the acquisition level by checking the match
@@ -540,7 +654,9 @@ class TemplateProtocol:
             template_acquisition.calc_match_status(template_acquisition.is_optional)
             template_acquisition.print_match_status()
 
-    def compare_protocol(self, all_series: list[DataSeries]) -> None:
+    def compare_protocol(
+        self, all_series: list[DataSeries], matched: bool = False
+    ) -> None:
         """
         Calculate match of protocol. Invokes matching at series and then acquisition
         level, before calculating match of protocol.
@@ -549,13 +665,16 @@ class TemplateProtocol:
         ----------
         all_series
             List of DataSeries classes to compare against protocol template.
+        matched
+            The series templates were already compared against the data series
+            by a match_engine.MatchEngine.
         """
 
         if not self.scan_dates_in_range(all_series):
             self.logger.warning("Protocol template will not be checked")
             return
 
-        self.compare_series(all_series)
+        self.compare_series(all_series, matched)
         self.compare_acquisitions()
 
         matches: int = 0
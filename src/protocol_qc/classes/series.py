@@ -18,6 +18,7 @@ Series template class.
 """
 
 import dataclasses
+import hashlib
 import json
 import logging
 import re
@@ -25,17 +26,35 @@ from typing import Any, NamedTuple
 
 import pydicom
 
-from protocol_qc.classes.dataseries import DataSeries
+from protocol_qc.classes.dataseries import DataSeries, extract_cached
+from protocol_qc.field_stats import FieldStats
 from protocol_qc.match_statuses import MatchStatus
+from protocol_qc.utils.comparators import (
+    Comparator,
+    ComparisonField,
+    compile_exact,
+    compile_in_range,
+    compile_in_set,
+    compile_regex,
+)
+from protocol_qc.utils.cust_logging import LogRecords
+from protocol_qc.utils.dicom_fields import (
+    SeriesFacets,
+    get_enhanced_field,
+    get_non_keyword_field,
+    series_facets,
+)
 from protocol_qc.utils.formatting import WIDTHS
+from protocol_qc.utils.patterns import compile_pattern
 
-ComparisonField = NamedTuple(
-    "ComparisonField",
+CompiledField = NamedTuple(
+    "CompiledField",
     [
         ("name", str),
-        ("value", Any),
-        ("comparison", str),
         ("compulsory", bool),
+        ("absent", bool),
+        ("compare", Comparator | None),
+        ("comparison", str),
     ],
 )
 
@@ -46,10 +65,25 @@ SeriesMatch = NamedTuple(
         ("score", float),
         ("complete", bool),
         ("series_number", int),
+        ("pruned", bool),
     ],
 )
 
 
+def _memo_value(value: Any) -> Any:
+    """
+    Return a hashable form of an extracted field value for the score memo.
+    Values of different types or text compare differently (e.g. DS "1.0" and
+    "1.00" against a string), so both are kept.
+    """
+
+    if isinstance(value, (list, tuple, pydicom.multival.MultiValue)):
+        return tuple(_memo_value(x) for x in value)
+
+    # The str of a DS or IS is its original text, unlike its repr
+    return (type(value).__name__, str(value))
+
+
 @dataclasses.dataclass()
 class TemplateSeries:
     """
@@ -72,12 +106,32 @@ class TemplateSeries:
         Match status of series template.
     series_matches
         List of all data series compared to this series template.
+    series_records
+        Log records of each comparison in series_matches, when compared by
+        match_engine.MatchEngine. They are logged by
+        TemplateProtocol.compare_series.
     matches
         List of data series that had a match score above the min_match_score.
     num_dupes
         Number of duplicates (multiple matches).
     incomplete_data
         If matched, did the DICOM series have the expected number of files?
+    compiled_fields
+        Validated fields with their comparators. Built by compile_fields.
+    prune_scores
+        Stop comparing the fields of a data series once it can no longer score
+        above min_match_score. The SeriesMatch is then marked as pruned.
+    field_stats
+        Comparison statistics used to order the fields, and updated with each
+        comparison.
+    signature
+        Canonical hash of the series template. Computed by canonical_hash.
+    memo_scores
+        Reuse the score of a previous data series with the same values for
+        every field of the series template.
+    score_memo
+        (score, pruned, unique_label) of the first data series scored, keyed
+        by the values of the fields. Filled when memo_scores is set.
     """
 
     name: str
@@ -87,9 +141,20 @@ class TemplateSeries:
     fields: dict[str, dict[str, Any]] = dataclasses.field(default_factory=dict)
     match_status: MatchStatus = MatchStatus.UNKNOWN
     series_matches: list[SeriesMatch] = dataclasses.field(default_factory=list)
+    series_records: list[LogRecords] = dataclasses.field(
+        default_factory=list, repr=False, compare=False
+    )
     matches: list[SeriesMatch] = dataclasses.field(default_factory=list)
     num_dupes: int = 0
     incomplete_data: bool = False
+    compiled_fields: list[CompiledField] | None = None
+    prune_scores: bool = False
+    field_stats: FieldStats | None = None
+    signature: str | None = dataclasses.field(default=None, repr=False, compare=False)
+    memo_scores: bool = False
+    score_memo: dict[tuple[Any, ...], tuple[float, bool, str]] = dataclasses.field(
+        default_factory=dict, repr=False, compare=False
+    )
 
     def print_match_status(self) -> None:
         """
@@ -166,46 +231,65 @@ class TemplateSeries:
     def calc_match_status(self) -> None:
         """
         Calculate the match status of a series template and set attributes
-        accordingly.
+        accordingly. See also score_matrix.ScoreMatrix.calc_match_status.
         """
 
         # Matches
         matches = [x for x in self.series_matches if x.score == 1]
         if matches:
-            if len(matches) == 1:
-                self.match_status = MatchStatus.MATCH
-            elif len(matches) > 1:
-                self.match_status = MatchStatus.MATCH_DUPES
-                self.num_dupes = len(matches) - 1
-            self.incomplete_data = self.has_missing_files(matches)
-            self.matches = matches
+            self.set_matches(matches, True, self.has_missing_files(matches))
             return
 
         # Partial matches
         no_matches = [
             x for x in self.series_matches if self.min_match_score < x.score < 1.0
         ]
-        if no_matches:
-            if len(no_matches) == 1:
-                self.match_status = MatchStatus.PARTIAL
-            elif len(no_matches) > 1:
-                self.match_status = MatchStatus.PARTIAL_DUPES
-            self.incomplete_data = self.has_missing_files(no_matches)
-            self.matches = no_matches
+        self.set_matches(no_matches, False, self.has_missing_files(no_matches))
+
+    def set_matches(
+        self, matches: list[SeriesMatch], full: bool, incomplete_data: bool
+    ) -> None:
+        """
+        Set the match status of a series template from its matches.
+
+        Parameters
+        ----------
+        matches
+            Full matches if there are any, otherwise partial matches.
+        full
+            Are the matches full matches?
+        incomplete_data
+            Do any of the matches have missing files?
+        """
+
         # No match
-        else:
+        if not matches:
             self.match_status = MatchStatus.NOMATCH
+            return
 
-    def similar_series_names(self, data: pydicom.dataset.FileDataset) -> bool:
+        if full:
+            if len(matches) == 1:
+                self.match_status = MatchStatus.MATCH
+            else:
+                self.match_status = MatchStatus.MATCH_DUPES
+                self.num_dupes = len(matches) - 1
+        elif len(matches) == 1:
+            self.match_status = MatchStatus.PARTIAL
+        else:
+            self.match_status = MatchStatus.PARTIAL_DUPES
+        self.incomplete_data = incomplete_data
+        self.matches = matches
+
+    def similar_series_names(self, data: pydicom.dataset.Dataset) -> bool:
         """
         Check if a DICOM series SeriesDescription matches the SeriesDescription
-        defined in the user template for a series. re.search is used for the
-        match.
+        defined in the user template for a series. The pattern is taken from
+        the pattern registry and searched for.
 
         Parameters
         ----------
         data
-           pydicom FileDataset containing DICOM series header information.
+           pydicom Dataset containing DICOM series header information.
 
         Returns
         -------
@@ -218,22 +302,40 @@ class TemplateSeries:
             except AttributeError as exc:
                 raise AttributeError(
                     "Malformed protocol template:"
-                    " SeriesDescription does not contain \"value\""
+                    ' SeriesDescription does not contain "value"'
                 ) from exc
             attribute: str | None = getattr(data, "SeriesDescription", None)
-            try:
-                if not attribute or re.search(template_regex, attribute):
-                    return True
-            except re.error as exc:
-                raise re.error(
-                    "Malformed template:"
-                    f" series \"{self.name}\","
-                    f" regex \"{template_regex}\""
-                ) from exc
-            return False
+            if not attribute:
+                return True
+            pattern: re.Pattern[str] = compile_pattern(
+                template_regex, f'SeriesDescription of series "{self.name}"'
+            )
+            return pattern.search(attribute) is not None
 
         return True
 
+    def description_pattern(self) -> str | None:
+        """
+        Return the SeriesDescription pattern used to prefilter data series, see
+        similar_series_names and utils.patterns.DescriptionIndex.
+
+        Returns
+        -------
+            Pattern, an empty string if the template does not define a
+            SeriesDescription, or None if the SeriesDescription is not indexable.
+        """
+
+        series_desc_info: Any = self.fields.get("SeriesDescription", None)
+        if not series_desc_info:
+            return ""
+        if not isinstance(series_desc_info, dict):
+            return None
+        pattern: Any = series_desc_info.get("value", "")
+        if not isinstance(pattern, str):
+            return None
+
+        return pattern
+
     def format_header_field(
         self,
         attr: pydicom.dataelem.DataElement,
@@ -256,6 +358,41 @@ class TemplateSeries:
 
         return attr
 
+    def canonical_hash(self) -> str:
+        """
+        Return a hash of everything that determines the SeriesMatches of the
+        series template. The name is excluded and the fields are normalised,
+        so identical series definitions in different protocol templates share
+        the same hash.
+
+        Returns
+        -------
+            SHA-256 hex digest, computed on first use.
+        """
+
+        if self.signature is None:
+            fields: dict[str, list[Any]] = {
+                name: [
+                    details.get("comparison"),
+                    # The value of an "absent" field is never compared
+                    (
+                        None
+                        if details.get("comparison") == "absent"
+                        else details.get("value")
+                    ),
+                    details.get("compulsory", True),
+                ]
+                for name, details in self.fields.items()
+            }
+            canonical: str = json.dumps(
+                [fields, self.num_files, self.min_match_score, self.prune_scores],
+                sort_keys=True,
+                default=str,
+            )
+            self.signature = hashlib.sha256(canonical.encode()).hexdigest()
+
+        return self.signature
+
     # Define main function which accepts pydicom data object and loops over entries
     # Call specific functions based on header field type and comparison level
     def compare_with_data_series(
@@ -264,7 +401,9 @@ class TemplateSeries:
     ) -> None:
         """
         Compare a series template against a DICOM series and write the result,
-        as a SeriesMatch, into the series template' series_matches list.
+        as a SeriesMatch, into the series template' series_matches list. If
+        memo_scores is set, the score of a DICOM series with the same field
+        values is reused.
 
         Parameters
         ----------
@@ -274,11 +413,37 @@ class TemplateSeries:
 
         complete_data: bool = self.is_series_complete(scan)
 
-        frac_correct: float = self.compare_header_fields(scan.data)
+        memo_key: tuple[Any, ...] = ()
+        memo: tuple[float, bool, str] | None = None
+        if self.memo_scores:
+            memo_key = tuple(
+                _memo_value(scan.get_field(x, self.logger)) for x in self.fields
+            )
+            memo = self.score_memo.get(memo_key)
+
+        frac_correct: float
+        pruned: bool
+        if memo is not None:
+            self.logger.debug(f"   same fields as {memo[2]}, score reused")
+            frac_correct, pruned = memo[0], memo[1]
+        else:
+            # The extraction records were already logged for the memo key
+            frac_correct, pruned = self.score_header_fields(
+                scan.data,
+                scan.extracted,
+                scan.facets,
+                None if self.memo_scores else scan.extract_records,
+            )
+            if self.memo_scores:
+                self.score_memo[memo_key] = (frac_correct, pruned, scan.unique_label())
 
         self.series_matches.append(
             SeriesMatch(
-                scan.unique_label(), frac_correct, complete_data, scan.data.SeriesNumber
+                scan.unique_label(),
+                frac_correct,
+                complete_data,
+                scan.data.SeriesNumber,
+                pruned,
             )
         )
 
@@ -300,13 +465,13 @@ class TemplateSeries:
         if num_files := getattr(self, "num_files"):
             if isinstance(num_files, tuple):
                 if not (
-                    len(num_files) == 2 \
-                    and isinstance(num_files[0], int) \
-                    and isinstance(num_files[1], int) \
+                    len(num_files) == 2
+                    and isinstance(num_files[0], int)
+                    and isinstance(num_files[1], int)
                 ):
                     raise TypeError(
                         "Malformed template:"
-                        f" series {self.name} value for \"num_files\" {num_files}"
+                        f' series {self.name} value for "num_files" {num_files}'
                         " being defined as a list"
                         " can only be a pair of integers defining a range"
                     )
@@ -318,7 +483,7 @@ class TemplateSeries:
             if not isinstance(num_files, int):
                 raise TypeError(
                     "Malformed template:"
-                    f" series {self.name} value for \"num_files\" {num_files}"
+                    f' series {self.name} value for "num_files" {num_files}'
                     " is neither an integer,"
                     " nor a list of integers defining a range"
                 )
@@ -329,355 +494,295 @@ class TemplateSeries:
 
         return True
 
-    def compare_header_fields(self, data: pydicom.dataset.FileDataset) -> float:
+    def compile_fields(self) -> None:
         """
-        Compare a set of fields between a series template and a DICOM series.
-
-        Parameters
-        ----------
-        data
-            pydicom FileDataset object from a DICOM series.
-
-        Returns
-        -------
-            Fraction of the header fields that matched the series template.
+        Validate the template fields and build a comparator for each, so that
+        comparisons against data series only extract and compare values.
+        Called once when the template is built. If field_stats is set, the
+        fields are ordered by their expected cost of rejecting a data series.
+
+        Raises
+        ------
+        KeyError
+            If a field is missing "comparison" or "value", sets "absent"
+            together with "compulsory", or uses an unrecognised comparison.
+        TypeError
+            If the value of an "in_range" or "in_set" comparison is malformed.
+        re.error
+            If a "regex" comparison contains an erroneous regular expression.
         """
 
-        num_correct: float = 0
-
-        is_enhanced: bool = False
-        if data["SOPClassUID"].repval == "Enhanced MR Image Storage":
-            is_enhanced = True
-
-        # Loop over all fields and perform comparisons
+        compiled_fields: list[CompiledField] = []
         for field_name, details in self.fields.items():
             try:
                 field: ComparisonField = ComparisonField(
                     name=field_name,
                     value=details.get("value", None),
                     comparison=details["comparison"],
-                    compulsory=details.get("compulsory", True)
+                    compulsory=details.get("compulsory", True),
                 )
             except KeyError as exc:
                 raise KeyError(
-                    "Malformed template \"{self.name}\""
-                    " (require \"comparison\" to be defined):"
-                    f" Series \"{self.name}\";"
-                    f" field \"{field_name}\""
+                    'Malformed template "{self.name}"'
+                    ' (require "comparison" to be defined):'
+                    f' Series "{self.name}";'
+                    f' field "{field_name}"'
                 ) from exc
             if field.comparison == "absent":
                 if field.compulsory:
                     raise KeyError(
-                        f"Malformed template \"{self.name}\""
-                        " (\"comparison\": \"absent\""
-                        " and \"compulsory\": true"
+                        f'Malformed template "{self.name}"'
+                        ' ("comparison": "absent"'
+                        ' and "compulsory": true'
                         " are mutually exclusive):"
-                        f" Series \"{self.name}\";"
-                        f" field \"{field_name}\"")
+                        f' Series "{self.name}";'
+                        f' field "{field_name}"'
+                    )
             elif field.value is None:
                 raise KeyError(
-                    "Malformed template \"{self.name}\""
-                    " (require \"value\" to be defined):"
-                    f" Series \"{self.name}\";"
-                    f" field \"{field_name}\""
+                    'Malformed template "{self.name}"'
+                    ' (require "value" to be defined):'
+                    f' Series "{self.name}";'
+                    f' field "{field_name}"'
                 )
-            attribute: Any = None
-            if is_enhanced is False:
-                if "PRIVATE" in field.name:
-                    attribute = self.get_non_keyword_field(field.name, data)
-                else:
-                    attribute = getattr(data, field.name, None)
-            else:
-                try:
-                    attribute = self.get_enhanced_field(field_name, data)
-                except KeyError:
-                    self.logger.warning(f"Field {field_name} not found.")
-
-            if attribute is None:
-                self.logger.debug(
-                    f"  - {field.name} missing from series"
-                    f" ({'' if field.compulsory else 'non-'}compulsory)"
-                )
-                if not field.compulsory or field.comparison == "absent":
-                    num_correct += 1
-                continue
-
-            attribute = self.format_header_field(attribute)
 
+            compare: Comparator | None
             if field.comparison == "exact":
-                num_correct += self.compare_exact(field, attribute)
+                compare = compile_exact(field)
             elif field.comparison == "regex":
                 try:
-                    num_correct += self.compare_regex(field, str(attribute))
+                    compare = compile_regex(
+                        field, f'field "{field.name}" of series "{self.name}"'
+                    )
                 except re.error as exc:
                     raise re.error(
-                        f"Malformed template \"{self.name}\":"
+                        f'Malformed template "{self.name}":'
                         " Erroneous regular expression"
-                        f" for field \"{field.name}\""
+                        f' for field "{field.name}"'
                     ) from exc
             elif field.comparison == "in_range":
                 try:
-                    num_correct += self.compare_in_range(field, attribute)
+                    compare = compile_in_range(field)
                 except TypeError as exc:
                     raise TypeError(
-                        f"Malformed template \"{self.name}\":"
-                        " Erroneous \"in_range\" comparison"
-                        f" for field \"{field.name}\""
+                        f'Malformed template "{self.name}":'
+                        ' Erroneous "in_range" comparison'
+                        f' for field "{field.name}"'
                     ) from exc
             elif field.comparison == "in_set":
                 try:
-                    num_correct += self.compare_in_set(field, attribute)
+                    compare = compile_in_set(field)
                 except TypeError as exc:
                     raise TypeError(
-                        f"Malformed template \"{self.name}\":"
-                        " Erroneous \"in_set\" comparison"
-                        f" for field \"{field.name}\""
+                        f'Malformed template "{self.name}":'
+                        ' Erroneous "in_set" comparison'
+                        f' for field "{field.name}"'
                     ) from exc
             elif field.comparison == "absent":
-                # Do nothing, this is a mismatch:
-                #   if field were absent, it would have been caught in earlier code
-                pass
+                # Absent fields are caught before comparing, see
+                # score_header_fields
+                compare = None
             else:
                 raise KeyError(
-                    f"Malformed template \"{self.name}\:"
-                    f" unrecognised comparison \"{field.comparison}\""
-                    f" for field \"{field.name}\""
+                    f'Malformed template "{self.name}":'
+                    f' unrecognised comparison "{field.comparison}"'
+                    f' for field "{field.name}"'
                 )
 
-        num_fields: int = len(self.fields)
+            compiled_fields.append(
+                CompiledField(
+                    field.name,
+                    field.compulsory,
+                    field.comparison == "absent",
+                    compare,
+                    field.comparison,
+                )
+            )
+
+        # Compare the fields most likely to reject a data series cheaply first
+        if self.field_stats is not None:
+            field_stats: FieldStats = self.field_stats
+            compiled_fields.sort(
+                key=lambda x: field_stats.priority(x.name, x.comparison)
+            )
+
+        self.compiled_fields = compiled_fields
+
+        # Register the pattern used to prefilter series, see similar_series_names
+        series_desc_info: Any = self.fields.get("SeriesDescription")
+        if isinstance(series_desc_info, dict) and isinstance(
+            series_desc_info.get("value"), str
+        ):
+            compile_pattern(
+                series_desc_info["value"],
+                f'SeriesDescription of series "{self.name}"',
+            )
+
+    def compare_header_fields(
+        self,
+        data: pydicom.dataset.Dataset,
+        extracted: dict[str, Any] | None = None,
+        facets: SeriesFacets | None = None,
+        extract_records: dict[str, LogRecords] | None = None,
+    ) -> float:
+        """
+        Compare a set of fields between a series template and a DICOM series.
+
+        Parameters
+        ----------
+        data
+            pydicom Dataset object from a DICOM series.
+        extracted
+            Values already extracted from 'data', keyed by field name (see
+            DataSeries.extracted). Fields not yet extracted are added.
+        facets
+            SeriesFacets of 'data' (see DataSeries.facets). Computed if not
+            provided.
+        extract_records
+            Records logged while extracting 'extracted' (see
+            DataSeries.extract_records), logged again for the fields compared.
+            Records of fields not yet extracted are added.
+
+        Returns
+        -------
+            Fraction of the header fields that matched the series template.
+        """
+
+        return self.score_header_fields(data, extracted, facets, extract_records)[0]
+
+    def score_header_fields(
+        self,
+        data: pydicom.dataset.Dataset,
+        extracted: dict[str, Any] | None = None,
+        facets: SeriesFacets | None = None,
+        extract_records: dict[str, LogRecords] | None = None,
+    ) -> tuple[float, bool]:
+        """
+        Score the header fields of a DICOM series against the series template.
+        If prune_scores is set, the comparison stops as soon as the score can
+        no longer exceed min_match_score, in which case the returned score is
+        the highest score the series could still have reached.
+
+        Parameters
+        ----------
+        data
+            pydicom Dataset object from a DICOM series.
+        extracted
+            Values already extracted from 'data', keyed by field name (see
+            DataSeries.extracted). Fields not yet extracted are added.
+        facets
+            SeriesFacets of 'data' (see DataSeries.facets). Computed if not
+            provided.
+        extract_records
+            Records logged while extracting 'extracted' (see
+            DataSeries.extract_records), logged again for the fields compared.
+            Records of fields not yet extracted are added.
+
+        Returns
+        -------
+            Fraction of the header fields that matched the series template, and
+            whether the comparison was stopped early.
+        """
+
+        if self.compiled_fields is None:
+            self.compile_fields()
+        assert self.compiled_fields is not None
+
+        if extracted is None:
+            extracted = {}
+        if extract_records is None:
+            extract_records = {}
+        if facets is None:
+            facets = series_facets(data)
+
+        num_correct: float = 0
+        num_fields: int = len(self.compiled_fields)
+
+        # Loop over all fields and perform comparisons
+        for num_compared, field in enumerate(self.compiled_fields, start=1):
+            attribute: Any = extract_cached(
+                field.name, data, extracted, extract_records, facets, self.logger
+            )
+
+            if attribute is None:
+                self.logger.debug(
+                    f"  - {field.name} missing from series"
+                    f" ({'' if field.compulsory else 'non-'}compulsory)"
+                )
+                matched: int = int(not field.compulsory or field.absent)
+            elif field.compare is None:
+                # The field should have been absent
+                matched = 0
+            else:
+                try:
+                    matched = field.compare(attribute, self.logger)
+                except TypeError as exc:
+                    raise TypeError(
+                        f'Malformed template "{self.name}":'
+                        f' Erroneous "{field.comparison}" comparison'
+                        f' for field "{field.name}"'
+                    ) from exc
+            num_correct += matched
+
+            if self.field_stats is not None:
+                self.field_stats.record(field.name, bool(matched))
+
+            if self.prune_scores:
+                # Score if all remaining fields were to match
+                max_score: float = (
+                    num_correct + num_fields - num_compared
+                ) / num_fields
+                if max_score <= self.min_match_score and max_score < 1:
+                    self.logger.debug(
+                        f"            at most {100*max_score:.2f}% match, "
+                        f"{num_fields - num_compared} field(s) not compared"
+                    )
+                    return max_score, True
+
         if num_correct != num_fields:
             self.logger.debug(f"            {100*(num_correct/num_fields):.2f}% match")
 
-        return num_correct / len(self.fields)
+        return num_correct / num_fields, False
 
     def get_non_keyword_field(
-        self, field_name: str, data: pydicom.dataset.FileDataset
+        self, field_name: str, data: pydicom.dataset.Dataset
     ) -> Any:
         """
-        Function to retrieve values of DICOM header fields that are not simple
-        keyword look-ups in classic DICOM series. This includes classic DICOM
-        series produced on XA systems.
-        For example, data.SeriesNumber is a simple keyword
-        lookup, whereas extracting the number of slices from a MOSAIC DICOM
-        series requires investigating a private tag. This function retrieves
-        DICOM header field information based on a mapping between the specified
-        'field_name' and a specific DICOM tag.
-
-
-        Currently available non_keyword maps on Siemen's VE software platform:
-            - 'NumberOfImagesInMosaic' = 0x0019,0x100a
-            - 'GradientMode' = 0x0019,0x100f
-            - 'Orientation' = 0x0051,0x100e
-            - 'AcquisitionDuration' = 0x0051,0x100a
-            - 'CoilElementsUsed' = 0x0051,0x100f
-            - 'ParallelImagingAcceleration' = 0x0051,0x1101
-        Currently available non_keyword maps on Siemen's XA software platform:
-            - 'GradientMode' = 0x0021,0x1008
-            - 'ParallelImagingAcceleration' = 0x0021,0x1009
-            - 'InPlanePhaseEncDirection' = 0x0021,0x111c
-            - 'CoilElementsUsed' = 0x0021,0x114f
-            - 'AcquisitionDuration' = 0x0051,0x100a
+        Retrieve the value of a private DICOM header field. See
+        utils.dicom_fields.get_non_keyword_field.
 
         Parameters
         ----------
         field_name
             Name of private DICOM header field.
         data
-            FileDataset object from a DICOM series.
+            Dataset object from a DICOM series.
         Returns
         -------
             Value of non-keyword field.
         """
 
-        return_value: Any | None = None
-
-        # Check software version of scanner and set private fields accordingly
-        private_fields: dict[str, tuple[int, int]]
-        sop_class_uid: str = data["SOPClassUID"].repval
-        if sop_class_uid == "Enhanced MR Image Storage":
-            private_fields = {
-                "GradientMode": (0x0021, 0x1008),
-                "ParallelImagingAcceleration": (0x0021, 0x1009),
-                "InPlanePhaseEncDirection": (0x0021, 0x111C),
-                "CoilElementsUsed": (0x0021, 0x114F),
-                "AcquisitionDuration": (0x0051, 0x100A),
-            }
-        elif sop_class_uid == "MR Image Storage":
-            private_fields = {
-                "NumberOfImagesInMosaic": (0x0019, 0x100A),
-                "BValue": (0x0019, 0x100C),
-                "GradientMode": (0x0019, 0x100F),
-                "Orientation": (0x0051, 0x100E),
-                "AcquisitionDuration": (0x0051, 0x100A),
-                "CoilElementsUsed": (0x0051, 0x100F),
-                "ParallelImagingAcceleration": (0x0051, 0x1011),
-            }
-        else:
-            # Log error if unknown software version
-            self.logger.error(
-                f"Private fields for SOPClassUID {sop_class_uid} not configured"
-            )
-            return return_value
-
-        for name, tag in private_fields.items():
-            if field_name == "PRIVATE-" + name:
-                try:
-                    return_value = data[tag[0], tag[1]].value
-                except KeyError:
-                    break
-
-        return return_value
+        return get_non_keyword_field(field_name, data, self.logger)
 
     def get_enhanced_field(
-        self, field_name: str, data: pydicom.dataset.FileDataset
+        self, field_name: str, data: pydicom.dataset.Dataset
     ) -> Any | None:
         """
-        Retrieve DICOM header fields from enhanced DICOMS.
+        Retrieve DICOM header fields from enhanced DICOMS. See
+        utils.dicom_fields.get_enhanced_field.
 
         Parameters
         ----------
         field_name
             Name of private DICOM header field.
         data
-            FileDataset object from a DICOM series.
+            Dataset object from a DICOM series.
         Returns
         -------
             Value of non-keyword field.
         """
 
-        # List of fields that can be accessed via keyword
-        if field_name in [
-            "Rows",
-            "Columns",
-            "PulseSequenceName",
-            "VolumetricProperties",
-            "EchoPulseSequence",
-            "SeriesDescription",
-            "NumberOfFrames",
-            "ImageComments",
-            "ComplexImageComponent",
-            "ImageType",
-            "SOPClassUID",
-            "ContentLabel",
-        ]:
-            return getattr(data, field_name, None)
-
-        to_return: Any = None
-
-        # Private fields at the data set level
-        private_fields: dict[str, tuple[int, int]] = {
-            "GradientMode": (0x0021, 0x1008),
-            "ParallelImagingAcceleration": (0x0021, 0x1009),
-            "InPlanePhaseEncDirection": (0x0021, 0x111C),
-            "CoilElementsUsed": (0x0021, 0x114F),
-        }
-        if field_name in private_fields:
-            for tag in private_fields.values():
-                try:
-                    to_return = data[tag[0], tag[1]].value
-                except KeyError:
-                    break
-            return to_return
-
-        # Private fields in the PerFrameFunctionGroupsSequence frames
-        if field_name in [
-            "ImageTypeText",
-            "SliceThickness",
-            "EffectiveEchoTime",
-            "NumberOfAverages",
-        ]:
-            seq_per_frame_groups: pydicom.dataset.Dataset = data[
-                "PerFrameFunctionalGroupsSequence"
-            ][0]
-            # ImageTypeText
-            if field_name == "ImageTypeText":
-                # Account for data that has been resent with modified DICOM header fields
-                try:
-                    to_return = seq_per_frame_groups[0x0021, 0x11FE][0][
-                        0x0021, 0x1175
-                    ].value
-                except KeyError:
-                    to_return = seq_per_frame_groups[0x0021, 0x10FE][0][
-                        0x0021, 0x1075
-                    ].value
-            # Slice Thickness
-            elif field_name == "SliceThickness":
-                to_return = float(
-                    seq_per_frame_groups["PixelMeasuresSequence"][0][
-                        "SliceThickness"
-                    ].value
-                )
-            # EffectiveEchoTime
-            elif field_name == "EffectiveEchoTime":
-                to_return = seq_per_frame_groups["MREchoSequence"][0][
-                    "EffectiveEchoTime"
-                ].value
-            # NumberOfAverages
-            elif field_name == "NumberOfAverages":
-                to_return = seq_per_frame_groups["MRAveragesSequence"][0][
-                    "NumberOfAverages"
-                ].value
-
-            return to_return
-
-        # Private fields in the SharedFunctionalGroupsSequence frames
-        if field_name in [
-            "PercentPhaseFieldOfView",
-            "RepetitionTime",
-            "PixelBandwidth",
-            "FlipAngle",
-            "EchoTrainLength",
-            "MRAcquisitionPhaseEncodingSteps",
-            "MRAcquisitionFrequencyEncodingSteps",
-            "InversionTimes",
-        ]:
-            seq_shared_per_func_group: pydicom.dataset.Dataset = data[
-                "SharedFunctionalGroupsSequence"
-            ][0]
-            # PercentPhaseFieldOfView
-            if field_name == "PercentPhaseFieldOfView":
-                to_return = seq_shared_per_func_group["MRFOVGeometrySequence"][0][
-                    "PercentPhaseFieldOfView"
-                ].value
-            # MRAcquisitionFrequencyEncodingSteps
-            elif field_name == "MRAcquisitionFrequencyEncodingSteps":
-                to_return = seq_shared_per_func_group["MRFOVGeometrySequence"][0][
-                    "MRAcquisitionFrequencyEncodingSteps"
-                ].value
-            # MRAcquisitionPhaseEncodingSteps
-            elif field_name == "MRAcquisitionPhaseEncodingSteps":
-                to_return = seq_shared_per_func_group["MRFOVGeometrySequence"][0][
-                    "MRAcquisitionPhaseEncodingStepsInPlane"
-                ].value
-            # RepetitionTime
-            elif field_name == "RepetitionTime":
-                to_return = seq_shared_per_func_group[
-                    "MRTimingAndRelatedParametersSequence"
-                ][0]["RepetitionTime"].value
-            # PixelBandWidth
-            elif field_name == "PixelBandwidth":
-                to_return = seq_shared_per_func_group["MRImagingModifierSequence"][0][
-                    "PixelBandwidth"
-                ].value
-            # FlipAngle
-            elif field_name == "FlipAngle":
-                to_return = seq_shared_per_func_group[
-                    "MRTimingAndRelatedParametersSequence"
-                ][0]["FlipAngle"].value
-            # EchoTrainLength
-            elif field_name == "EchoTrainLength":
-                to_return = seq_shared_per_func_group[
-                    "MRTimingAndRelatedParametersSequence"
-                ][0]["EchoTrainLength"].value
-            # InversionTimes
-            elif field_name == "InversionTimes":
-                to_return = seq_shared_per_func_group["MRModifierSequence"][0][
-                    "InversionTimes"
-                ].value
-
-            return to_return
-
-        return None
+        return get_enhanced_field(field_name, data)
 
     def compare_exact(self, field: ComparisonField, attribute: Any) -> int:
         """
@@ -695,19 +800,12 @@ class TemplateSeries:
             1 if a match, 0 if not.
         """
 
-        if field.value == attribute:
-            return 1
-
-        self.logger.debug(f"    {field.name}: {field.value} != {attribute}")
-        return 0
+        return compile_exact(field)(attribute, self.logger)
 
     def compare_regex(self, field: ComparisonField, attribute: str) -> int:
         """
         Determine if the DICOM header field matches the regex specified in the
-        template. If the attribute is a list (e.g., ImageType),
-        the individual entries will be compared. The template list can be shorter
-        than the data list, in which case only a portion of the data list will be
-        checked.
+        template. See utils.comparators.compile_regex.
 
         Parameters
         ----------
@@ -721,29 +819,8 @@ class TemplateSeries:
             1 if a match, 0 if not.
         """
 
-        try:
-            if isinstance(field.value, list):
-                if isinstance(attribute, str):
-                    attribute = json.loads(attribute.replace("'", '"'))
-                for val1, val2 in zip(field.value, attribute):
-                    if not re.search(val1, val2):
-                        break
-                else:
-                    return 1
-            else:
-                if re.search(field.value, attribute):
-                    return 1
-        except re.error as exc:
-            raise re.error(
-                "Cannot apply \"regex\" comparison"
-                f" to key \"{field.name}\":"
-                f"Malformed regular expression"
-            ) from exc
-
-        self.logger.debug(
-            f"    {field.name}: {field.value} regex not matched to {attribute}"
-        )
-        return 0
+        context: str = f'field "{field.name}" of series "{self.name}"'
+        return compile_regex(field, context)(attribute, self.logger)
 
     def compare_in_range(self, field: ComparisonField, attribute: Any) -> int:
         """
@@ -762,27 +839,7 @@ class TemplateSeries:
             1 if a match, 0 if not.
         """
 
-        if len(field.value) != 2 \
-            or any(not isinstance(value, (int, float)) for value in field.value):
-            raise TypeError(
-                "Cannot apply \"in_range\" comparison"
-                f" to key \"{field.name}\":"
-                "\"value\" must be a list of two numerical values"
-            )
-        try:
-            if field.value[0] <= float(attribute) <= field.value[1]:
-                return 1
-        except TypeError as exc:
-            raise TypeError(
-                "Cannot apply \"in_range\" comparison"
-                f" to key \"{field.name}\""
-                f" (could not convert \"{attribute}\" to float)"
-            ) from exc
-
-        self.logger.debug(
-            f"    {field.name}: {float(attribute)} not within range ({field.value})"
-        )
-        return 0
+        return compile_in_range(field)(attribute, self.logger)
 
     def compare_in_set(self, field: ComparisonField, attribute: Any) -> int:
         """
@@ -799,15 +856,5 @@ class TemplateSeries:
         -------
             1 if a match, 0 if not.
         """
-        try:
-            if attribute in field.value:
-                return 1
-        except TypeError as exc:
-            raise TypeError(
-                f"Cannot apply \"in_set\" comparison"
-                f" to key \"{field.name}\":"
-                " type of \"value\" is not an iterable"
-            ) from exc
-
-        self.logger.debug(f"    {field.name}: {attribute} not in set ({field.value})")
-        return 0
+
+        return compile_in_set(field)(attribute, self.logger)
@@ -0,0 +1,175 @@
+# protocol_qc: An MRI DICOM protocol quality control tool
+# Copyright (C) 2025 The Florey Institute of Neuroscience and Mental Health
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Persistent statistics of template field comparisons, used to order the
+comparisons of a series template.
+"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Any, Final
+
+from protocol_qc.utils.dicom_fields import PER_FRAME_FIELDS, SHARED_FIELDS
+
+# Increment when the file format changes. Files with another version are ignored.
+STATS_VERSION: Final[int] = 1
+
+# Relative cost of each comparison
+COMPARISON_COSTS: Final[dict[str, float]] = {
+    "absent": 1.0,
+    "exact": 1.0,
+    "in_set": 1.0,
+    "in_range": 2.0,
+    "regex": 4.0,
+}
+
+# Additional cost of reading a field from a private tag, or from the functional
+# group sequences of enhanced DICOMs
+PRIVATE_FIELD_COST: Final[float] = 2.0
+SEQUENCE_FIELD_COST: Final[float] = 4.0
+
+
+def field_cost(field_name: str, comparison: str) -> float:
+    """
+    Estimate the relative cost of extracting and comparing a template field.
+
+    Parameters
+    ----------
+    field_name
+        Name of a template field.
+    comparison
+        Comparison of the field.
+
+    Returns
+    -------
+        Relative cost.
+    """
+
+    cost: float = COMPARISON_COSTS.get(comparison, 1.0)
+    if "PRIVATE" in field_name:
+        cost += PRIVATE_FIELD_COST
+    if field_name in PER_FRAME_FIELDS or field_name in SHARED_FIELDS:
+        cost += SEQUENCE_FIELD_COST
+
+    return cost
+
+
+class FieldStats:
+    """
+    Number of comparisons and mismatches of each template field, persisted
+    as JSON between runs. Fields that reject most data series for the lowest
+    cost are compared first.
+
+    Parameters
+    ----------
+    path_stats
+        Path to the JSON file. It is read if it exists. If None, the statistics
+        are only kept in memory.
+    """
+
+    def __init__(self, path_stats: Path | None) -> None:
+        self.path_stats: Path | None = path_stats
+        # [comparisons, mismatches] keyed by field name
+        self.counts: dict[str, list[int]] = {}
+
+        if path_stats is not None and path_stats.is_file():
+            stored: dict[str, Any] = json.loads(path_stats.read_text())
+            if stored.get("version") == STATS_VERSION:
+                self.counts = stored.get("fields", {})
+
+    def record(self, field_name: str, matched: bool) -> None:
+        """
+        Record the outcome of comparing a field.
+
+        Parameters
+        ----------
+        field_name
+            Name of the compared field.
+        matched
+            Did the field match?
+        """
+
+        counts: list[int] = self.counts.setdefault(field_name, [0, 0])
+        counts[0] += 1
+        if not matched:
+            counts[1] += 1
+
+    def merge(self, counts: dict[str, list[int]]) -> None:
+        """
+        Add statistics recorded elsewhere, e.g. by a worker process.
+
+        Parameters
+        ----------
+        counts
+            [comparisons, mismatches] keyed by field name.
+        """
+
+        for field_name, (compared, mismatched) in counts.items():
+            totals: list[int] = self.counts.setdefault(field_name, [0, 0])
+            totals[0] += compared
+            totals[1] += mismatched
+
+    def mismatch_rate(self, field_name: str) -> float:
+        """
+        Estimate the fraction of comparisons of a field that mismatch. Fields
+        that were never compared are assumed to mismatch half of the time.
+
+        Parameters
+        ----------
+        field_name
+            Name of a template field.
+
+        Returns
+        -------
+            Estimated mismatch rate, between 0 and 1 exclusive.
+        """
+
+        compared, mismatched = self.counts.get(field_name, (0, 0))
+
+        return (mismatched + 1) / (compared + 2)
+
+    def priority(self, field_name: str, comparison: str) -> float:
+        """
+        Expected cost of rejecting a data series with a field. Fields are
+        compared in increasing order of priority.
+
+        Parameters
+        ----------
+        field_name
+            Name of a template field.
+        comparison
+            Comparison of the field.
+
+        Returns
+        -------
+            Cost of the field divided by its estimated mismatch rate.
+        """
+
+        return field_cost(field_name, comparison) / self.mismatch_rate(field_name)
+
+    def save(self) -> None:
+        """
+        Write the statistics to disk, unless they are only kept in memory.
+        """
+
+        if self.path_stats is None:
+            return
+
+        self.path_stats.write_text(
+            json.dumps({"version": STATS_VERSION, "fields": self.counts}, indent=4)
+        )
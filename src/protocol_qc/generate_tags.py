@@ -21,14 +21,47 @@ from __future__ import annotations
 
 import datetime
 import json
-import re
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:  # pragma: no cover
+    import logging
 
 from protocol_qc._version import __version__
 
 from .classes.dataseries import DataSeries
 from .classes.protocol import TemplateProtocol
+from .score_matrix import MIN_TAG_SCORE
+from .utils.patterns import compile_pattern
+
+
+def get_tag_field(
+    data_series: DataSeries, field_name: str, logger: logging.Logger
+) -> Any:
+    """
+    Get the value of a field used by a custom tag, reusing the values already
+    extracted for template comparisons. Fields not found at a template field
+    location (e.g. keywords not mapped for enhanced DICOMs) are looked up by
+    keyword.
+
+    Parameters
+    ----------
+    data_series
+        DataSeries from which the value is taken.
+    field_name
+        DICOM keyword.
+    logger
+        Template logger.
+
+    Returns
+    -------
+        Value of the field, or None if it is missing.
+    """
+
+    if (attr := data_series.get_field(field_name, logger)) is None:
+        attr = getattr(data_series.data, field_name, None)
+
+    return attr
 
 
 def gen_custom_tags(
@@ -58,34 +91,31 @@ def gen_custom_tags(
         if value["type"] == "constant":
             tags_output["custom_tags"][tag_type] = value["tag"]
         elif value["type"] == "fill_with":
-            try:
-                tags_output["custom_tags"][tag_type] = getattr(
-                    data_series.data, value["tag"]
-                )
-            except KeyError:
-                tags_output["custom_tags"][tag_type] = "NOT FOUND"
+            attr: Any = get_tag_field(data_series, value["tag"], protocol.logger)
+            tags_output["custom_tags"][tag_type] = "NOT FOUND" if attr is None else attr
         elif isinstance(value["tag"], dict):
             for tag, to_check in value["tag"].items():
                 if "PRIVATE-" in to_check["field"]:
                     raise KeyError(
                         "Cannot use private DICOM fields when generating tags"
                     )
-                try:
-                    if attr := getattr(data_series.data, to_check["field"]):
-                        if to_check["comparison"] == "exact":
-                            if attr == to_check["value"]:
-                                break
-                        elif to_check["comparison"] == "in_set":
-                            if attr in to_check["value"]:
-                                break
-                        elif to_check["comparison"] == "regex":
-                            if re.search(to_check["value"], attr):
-                                break
-                        elif to_check["comparison"] == "in_range":
-                            if to_check["value"][0] <= float(attr) <= to_check["value"]:
-                                break
-                except AttributeError:
-                    pass
+                if attr := get_tag_field(
+                    data_series, to_check["field"], protocol.logger
+                ):
+                    if to_check["comparison"] == "exact":
+                        if attr == to_check["value"]:
+                            break
+                    elif to_check["comparison"] == "in_set":
+                        if attr in to_check["value"]:
+                            break
+                    elif to_check["comparison"] == "regex":
+                        if compile_pattern(
+                            to_check["value"], f'custom tag "{tag_type}"'
+                        ).search(attr):
+                            break
+                    elif to_check["comparison"] == "in_range":
+                        if to_check["value"][0] <= float(attr) <= to_check["value"]:
+                            break
             else:
                 protocol.logger.warning(f"No match found for tag: {tag_type}")
                 continue
@@ -150,6 +180,10 @@ def gen_protocol_tags(protocol: TemplateProtocol, tags_output: dict[str, Any]) -
             "found": "one_or_more",
         }
 
+    best_matches: dict[str, tuple[float, list[str]]] | None = None
+    if protocol.score_matrix is not None:
+        best_matches = protocol.score_matrix.best_matches()
+
     # Loop over acquisition and series templates and set tags accordingly
     for acq in protocol.get_template_acquisitions():
         tags_output["protocol"]["acquisitions"][acq.name] = {
@@ -174,14 +208,17 @@ def gen_protocol_tags(protocol: TemplateProtocol, tags_output: dict[str, Any]) -
 
                 # Gather matches. Single highest, or list of equally matched
                 matched: list[str] = []
-                highest_match_score: float = 0.01
-                for match in series.matches:
-                    if match.score > highest_match_score:
-                        matched = [match.unique_label]
-                        highest_match_score = match.score
-                    elif match.score == highest_match_score:
-                        matched.append(match.unique_label)
-                        highest_match_score = match.score
+                highest_match_score: float = MIN_TAG_SCORE
+                if best_matches is not None:
+                    highest_match_score, matched = best_matches[series.name]
+                else:
+                    for match in series.matches:
+                        if match.score > highest_match_score:
+                            matched = [match.unique_label]
+                            highest_match_score = match.score
+                        elif match.score == highest_match_score:
+                            matched.append(match.unique_label)
+                            highest_match_score = match.score
 
                 # Check if there were not matches and set values accordingly
                 tags_series: dict[str, Any] = {
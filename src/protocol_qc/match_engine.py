@@ -0,0 +1,406 @@
+# protocol_qc: An MRI DICOM protocol quality control tool
+# Copyright (C) 2025 The Florey Institute of Neuroscience and Mental Health
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Match the data series against the series templates of all protocol templates
+in a single pass.
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import functools
+import logging
+from typing import TYPE_CHECKING, Any, Final, Iterable, NamedTuple
+
+if TYPE_CHECKING:  # pragma: no cover
+    from protocol_qc.classes.dataseries import DataSeries
+    from protocol_qc.classes.protocol import TemplateProtocol
+
+from protocol_qc.classes.series import SeriesMatch, TemplateSeries
+from protocol_qc.field_stats import FieldStats
+from protocol_qc.utils.cust_logging import LogRecords, RecordHandler, record_logger
+from protocol_qc.utils.exact_index import ExactFieldIndex
+from protocol_qc.utils.patterns import DescriptionIndex
+
+# Number of partitions of the data series per worker
+PARTITIONS_PER_WORKER: Final[int] = 4
+
+# Everything needed to rebuild a series template in a worker process
+TemplateSpec = NamedTuple(
+    "TemplateSpec",
+    [
+        ("name", str),
+        ("num_files", tuple[int, ...] | int | None),
+        ("min_match_score", float),
+        ("fields", dict[str, dict[str, Any]]),
+        ("prune_scores", bool),
+        ("field_stats", bool),
+    ],
+)
+
+# Comparisons of a data series in a worker process: records logged while
+# looking up its fields, and (template index, SeriesMatch, records) of each
+# compared series template
+SeriesResult = tuple[LogRecords, list[tuple[int, SeriesMatch, LogRecords]]]
+
+
+def candidate_templates(
+    series: DataSeries,
+    templates: Iterable[tuple[int, TemplateSeries]],
+    description_index: DescriptionIndex,
+    exact_index: ExactFieldIndex | None,
+    logger: logging.Logger,
+) -> list[int]:
+    """
+    Return the series templates a data series is to be compared against.
+
+    Parameters
+    ----------
+    series
+        Data series.
+    templates
+        (key, series template) of the series templates, keyed as in the indexes.
+    description_index
+        Index of the SeriesDescription patterns of the series templates.
+    exact_index
+        Optional index of the exact comparison fields of the series templates.
+    logger
+        Logger for the fields of the data series that could not be read.
+
+    Returns
+    -------
+        Keys of the candidate series templates.
+    """
+
+    candidates: frozenset[int] = description_index.candidates(
+        getattr(series.data, "SeriesDescription", None)
+    )
+    exact_candidates: frozenset[int] = frozenset()
+    if exact_index is not None:
+        exact_candidates = exact_index.candidates(
+            functools.partial(series.get_field, logger=logger)
+        )
+
+    selected: list[int] = []
+    for key, template_series in templates:
+        if key in description_index:
+            if key not in candidates:
+                continue
+        elif not template_series.similar_series_names(series.data):
+            continue
+        if (
+            exact_index is not None
+            and key in exact_index
+            and key not in exact_candidates
+        ):
+            continue
+        selected.append(key)
+
+    return selected
+
+
+# State of a worker process, set once by _init_worker
+_WORKER: dict[str, Any] = {}
+
+
+def _init_worker(
+    specs: list[TemplateSpec], all_series: list[DataSeries], use_exact_index: bool
+) -> None:
+    """
+    Rebuild the series templates and indexes in a worker process, and keep the
+    data series for all tasks.
+    """
+
+    logger, handler = record_logger("protocol_qc.match_worker")
+
+    field_stats: FieldStats = FieldStats(None)
+    templates: list[TemplateSeries] = []
+    for spec in specs:
+        template_series: TemplateSeries = TemplateSeries(
+            spec.name,
+            logger,
+            spec.num_files,
+            spec.min_match_score,
+            fields=spec.fields,
+            prune_scores=spec.prune_scores,
+        )
+        # Compiled without statistics, the fields keep the order of the parent
+        template_series.compile_fields()
+        if spec.field_stats:
+            template_series.field_stats = field_stats
+        templates.append(template_series)
+
+    _WORKER.update(
+        templates=templates,
+        all_series=all_series,
+        handler=handler,
+        logger=logger,
+        field_stats=field_stats,
+        description_index=DescriptionIndex(
+            (key, pattern)
+            for key, x in enumerate(templates)
+            if (pattern := x.description_pattern()) is not None
+        ),
+        exact_index=(
+            ExactFieldIndex(
+                (key, x.fields, x.min_match_score) for key, x in enumerate(templates)
+            )
+            if use_exact_index
+            else None
+        ),
+    )
+
+
+def _match_partition(
+    partition: range,
+) -> tuple[list[SeriesResult], dict[str, list[int]]]:
+    """
+    Compare a partition of the data series in a worker process.
+
+    Returns
+    -------
+        SeriesResult of each data series, and the field statistics recorded.
+    """
+
+    templates: list[TemplateSeries] = _WORKER["templates"]
+    handler: RecordHandler = _WORKER["handler"]
+    field_stats: FieldStats = _WORKER["field_stats"]
+
+    results: list[SeriesResult] = []
+    for idx in partition:
+        series: DataSeries = _WORKER["all_series"][idx]
+        selected: list[int] = candidate_templates(
+            series,
+            enumerate(templates),
+            _WORKER["description_index"],
+            _WORKER["exact_index"],
+            _WORKER["logger"],
+        )
+        series_records: LogRecords = handler.take()
+        compared: list[tuple[int, SeriesMatch, LogRecords]] = []
+        for key in selected:
+            templates[key].compare_with_data_series(series)
+            compared.append((key, templates[key].series_matches.pop(), handler.take()))
+        results.append((series_records, compared))
+
+    counts: dict[str, list[int]] = field_stats.counts
+    field_stats.counts = {}
+
+    return results, counts
+
+
+class MatchEngine:
+    """
+    Matching engine for a set of protocol templates. Identical series templates
+    (see TemplateSeries.canonical_hash) are deduplicated across the protocol
+    templates, every data series is compared against the unique series
+    templates in one pass, and each SeriesMatch is appended to all series
+    templates sharing it. The protocol templates are then scored with
+    TemplateProtocol.compare_protocol, with 'matched' set.
+
+    Parameters
+    ----------
+    protocols
+        Protocol templates to be matched.
+    """
+
+    def __init__(self, protocols: list[TemplateProtocol]) -> None:
+        groups: dict[str, list[TemplateSeries]] = {}
+        for protocol in protocols:
+            for template_series in protocol.get_template_series():
+                groups.setdefault(template_series.canonical_hash(), []).append(
+                    template_series
+                )
+
+        # First series template of each group, compared on behalf of the group
+        self.unique: list[TemplateSeries] = [x[0] for x in groups.values()]
+        # Series templates sharing the SeriesMatch of each unique series template
+        self.duplicates: list[list[TemplateSeries]] = [x[1:] for x in groups.values()]
+
+    def description_patterns(self) -> list[tuple[int, str]]:
+        """
+        Return the SeriesDescription patterns of the unique series templates,
+        keyed by position, for building a DescriptionIndex.
+
+        Returns
+        -------
+            List of (key, pattern) of the indexable series templates.
+        """
+
+        return [
+            (key, pattern)
+            for key, template_series in enumerate(self.unique)
+            if (pattern := template_series.description_pattern()) is not None
+        ]
+
+    def exact_fields(self) -> list[tuple[int, dict[str, dict[str, Any]], float]]:
+        """
+        Return the fields of the unique series templates, keyed by position,
+        for building an ExactFieldIndex.
+
+        Returns
+        -------
+            List of (key, fields, min_match_score) of the series templates.
+        """
+
+        return [
+            (key, template_series.fields, template_series.min_match_score)
+            for key, template_series in enumerate(self.unique)
+        ]
+
+    def _add_match(
+        self, key: int, series_match: SeriesMatch, records: LogRecords
+    ) -> None:
+        """
+        Add a SeriesMatch, and the log records of the comparison, to a unique
+        series template and its duplicates.
+        """
+
+        for template_series in [self.unique[key], *self.duplicates[key]]:
+            template_series.series_matches.append(series_match)
+            template_series.series_records.append(records)
+
+    def match(
+        self,
+        all_series: list[DataSeries],
+        logger: logging.Logger,
+        exact_index: ExactFieldIndex | None = None,
+        workers: int = 1,
+    ) -> None:
+        """
+        Compare every data series against the unique series templates it is a
+        candidate for, and share the results with the duplicate series
+        templates. The log records of each comparison are kept with its
+        SeriesMatch, and logged by every series template of the group.
+
+        Parameters
+        ----------
+        all_series
+            List of DataSeries classes built from unique DICOM series.
+        logger
+            Logger for the fields of the data series that could not be read.
+        exact_index
+            Optional index of the exact comparison fields of the unique series
+            templates, see exact_fields.
+        workers
+            Number of worker processes. If greater than one, see match_parallel.
+        """
+
+        if workers > 1 and len(all_series) > 1:
+            self.match_parallel(all_series, logger, workers, exact_index is not None)
+            return
+
+        description_index: DescriptionIndex = DescriptionIndex(
+            self.description_patterns()
+        )
+
+        # The comparisons are logged by each series template of the group, see
+        # TemplateProtocol.compare_series
+        logger_records, handler = record_logger("protocol_qc.match_engine")
+        loggers: list[logging.Logger] = [x.logger for x in self.unique]
+        for template_series in self.unique:
+            template_series.logger = logger_records
+
+        try:
+            for series in all_series:
+                selected: list[int] = candidate_templates(
+                    series,
+                    enumerate(self.unique),
+                    description_index,
+                    exact_index,
+                    logger,
+                )
+                for level, message in handler.take():
+                    logger.log(level, message)
+                for key in selected:
+                    self.unique[key].compare_with_data_series(series)
+                    self._add_match(
+                        key, self.unique[key].series_matches.pop(), handler.take()
+                    )
+        finally:
+            for template_series, logger_template in zip(self.unique, loggers):
+                template_series.logger = logger_template
+
+    def match_parallel(
+        self,
+        all_series: list[DataSeries],
+        logger: logging.Logger,
+        workers: int,
+        use_exact_index: bool = False,
+    ) -> None:
+        """
+        Compare the data series in a pool of worker processes. Each worker is
+        initialised once with the data series and the unique series templates,
+        and compares partitions of the data series. The SeriesMatches, log
+        records and field statistics are merged back in the order of the data
+        series, so the results and logs are the same as with a single process
+        without memo_scores. The workers do not reuse scores (see
+        TemplateSeries.memo_scores), as which data series a worker has already
+        compared depends on the scheduling of the partitions.
+
+        Parameters
+        ----------
+        all_series
+            List of DataSeries classes built from unique DICOM series.
+        logger
+            Logger for the fields of the data series that could not be read.
+        workers
+            Number of worker processes.
+        use_exact_index
+            Use an index of the exact comparison fields. A discrimination tree
+            gives the same candidates, so the workers always use an
+            ExactFieldIndex.
+        """
+
+        specs: list[TemplateSpec] = [
+            TemplateSpec(
+                x.name,
+                x.num_files,
+                x.min_match_score,
+                # Fields in the order they are compared
+                {y.name: x.fields[y.name] for y in x.compiled_fields or []} or x.fields,
+                x.prune_scores,
+                x.field_stats is not None,
+            )
+            for x in self.unique
+        ]
+
+        # Use more partitions than workers to balance uneven comparisons
+        size: int = max(1, -(-len(all_series) // (workers * PARTITIONS_PER_WORKER)))
+        partitions: list[range] = [
+            range(i, min(i + size, len(all_series)))
+            for i in range(0, len(all_series), size)
+        ]
+
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(specs, all_series, use_exact_index),
+        ) as executor:
+            # map() yields results in submission order, keeping the merge deterministic
+            results = list(executor.map(_match_partition, partitions))
+
+        field_stats: FieldStats | None = next(
+            (x.field_stats for x in self.unique if x.field_stats is not None), None
+        )
+        for series_results, counts in results:
+            for series_records, compared in series_results:
+                for level, message in series_records:
+                    logger.log(level, message)
+                for key, series_match, records in compared:
+                    self._add_match(key, series_match, records)
+            if field_stats is not None:
+                field_stats.merge(counts)
@@ -27,6 +27,8 @@ from typing import TYPE_CHECKING, Any
 if TYPE_CHECKING:  # pragma: no cover
     import argparse
 
+    from pydicom.tag import BaseTag
+
     from protocol_qc.classes.dataseries import DataSeries
     from protocol_qc.classes.protocol import TemplateProtocol
 
@@ -37,7 +39,11 @@ from protocol_qc import (
     read_templates,
     summary,
 )
+from protocol_qc.field_stats import FieldStats
+from protocol_qc.match_engine import MatchEngine
 from protocol_qc.utils import cust_logging
+from protocol_qc.utils.decision_tree import DiscriminationTree
+from protocol_qc.utils.exact_index import ExactFieldIndex
 
 
 def run(
@@ -50,6 +56,20 @@ def run(
     sub_label: str,
     which_tags: str,
     debug_level: int,
+    ingest_workers: int = 1,
+    ingest_executor: str = "thread",
+    series_index: Path | None = None,
+    allow_no_preamble: bool = False,
+    include: list[str] | None = None,
+    exclude: list[str] | None = None,
+    ignore_dicomdir: bool = False,
+    verify_dicomdir: bool = False,
+    prune_scores: bool = False,
+    field_stats: Path | None = None,
+    index_exact_fields: bool = False,
+    template_tree: Path | None = None,
+    template_workers: int = 1,
+    memo_scores: bool = False,
 ) -> int:  # pragma: no cover
     """
     Main function.
@@ -59,11 +79,12 @@ def run(
     template_path
         Path to a template or directory containing template(s).
     acquisitions
-        Path to directory containing DICOMs to be analysed.
+        Path to directory or zip/tar archive containing DICOMs to be analysed.
     logs_dir
         Path to directory where logs should be saved.
     find_first
-        Stop after a perfect template match is found.
+        Stop after a perfect template match is found. The protocol templates
+        are then built and matched one at a time.
     min_match_score
         Minimum fractional match for DICOM header fields for a series to be
         seen as a potential match.
@@ -73,6 +94,40 @@ def run(
         String specifying for which protocols tags should be generated.
     debug_level
         Logging level.
+    ingest_workers
+        Number of concurrent workers used to read the DICOM headers.
+    ingest_executor
+        Type of executor used for the ingestion workers, 'thread' or 'process'.
+    series_index
+        Path to a SQLite index of previously scanned files.
+    allow_no_preamble
+        Also read DICOM files without a preamble and "DICM" prefix.
+    include
+        Glob patterns of files to read.
+    exclude
+        Glob patterns of files or directories to skip.
+    ignore_dicomdir
+        Read every file even if a DICOMDIR is present.
+    verify_dicomdir
+        Check that every file listed in a DICOMDIR exists.
+    prune_scores
+        Stop comparing a series once its match score cannot exceed
+        min_match_score.
+    field_stats
+        Path to a JSON file of field comparison statistics used to order the
+        comparisons. It is updated at the end of the run.
+    index_exact_fields
+        Only compare series templates to the data series that can reach
+        min_match_score given their exact comparison fields.
+    template_tree
+        Directory caching the discrimination tree of the templates. If given,
+        the tree is used instead of the index of exact comparison fields.
+    template_workers
+        Number of worker processes comparing the data series against the
+        series templates.
+    memo_scores
+        Reuse the score of data series with the same values for every field of
+        a series template. Only applies with a single template worker.
 
     Returns
     -------
@@ -89,38 +144,91 @@ def run(
         template_path, logger_main
     )
 
+    # Only the header fields referenced by the templates are kept for each series
+    keep_tags: set[BaseTag] = build_templates.get_required_tags(templates)
+
     # Find all unique series in provided directory
     all_series: list[DataSeries] = read_dicoms.find_unique_series(
-        acquisitions, logger_main
+        acquisitions,
+        logger_main,
+        ingest_workers=ingest_workers,
+        ingest_executor=ingest_executor,
+        series_index=series_index,
+        allow_no_preamble=allow_no_preamble,
+        include=include,
+        exclude=exclude,
+        ignore_dicomdir=ignore_dicomdir,
+        verify_dicomdir=verify_dicomdir,
+        keep_tags=keep_tags,
     )
 
+    stats: FieldStats | None = None
+    if field_stats is not None:
+        stats = FieldStats(field_stats)
+
     # To store each protocol template that has been crossed checked
     protocols: list[TemplateProtocol] = []
 
-    # Loop over all user provided templates and cross check against input DICOM series
-    for template in templates:
-        logger_main.info(f"Comparing data to: {template[0]}")
+    # All protocol templates are matched in a single pass. With find_first,
+    # they are built and matched one at a time instead, so the templates after
+    # an exact match are neither built nor compared.
+    batches: list[list[tuple[str, dict[str, Any]]]] = (
+        [[x] for x in templates] if find_first else [templates]
+    )
+    for batch in batches:
+        # Build acquisition and scan classes from user input
+        built: list[tuple[TemplateProtocol, logging.Logger]] = []
+        for template in batch:
+            logger_template: logging.Logger = cust_logging.custom_logger(
+                template[0], dir_logs, debug_level
+            )
+            built.append(
+                (
+                    build_templates.build_templates(
+                        template,
+                        min_match_score,
+                        all_series[0].data.PatientID,
+                        logger_template,
+                        prune_scores,
+                        stats,
+                        memo_scores=memo_scores,
+                    ),
+                    logger_template,
+                )
+            )
 
-        logger_template: logging.Logger = cust_logging.custom_logger(
-            template[0], dir_logs, debug_level
-        )
+        # Identical series templates are shared across the protocol templates
+        engine: MatchEngine = MatchEngine([x[0] for x in built])
 
-        # Build acquisition and scan classes from user input
-        template_protocol: TemplateProtocol = build_templates.build_templates(
-            template, min_match_score, all_series[0].data.PatientID, logger_template
-        )
+        # Data series are only scored against the series templates their exact
+        # comparison fields allow to reach min_match_score
+        exact_index: ExactFieldIndex | None = None
+        if template_tree is not None:
+            exact_index = DiscriminationTree(engine.exact_fields(), template_tree)
+        elif index_exact_fields:
+            exact_index = ExactFieldIndex(engine.exact_fields())
+
+        # Compare all data series against the series templates in a single pass
+        engine.match(all_series, logger_main, exact_index, template_workers)
+
+        # Loop over the built templates and cross check against input DICOM series
+        for template_protocol, logger_template in built:
+            logger_main.info(f"Comparing data to: {template_protocol.name}")
+
+            template_protocol.compare_protocol(all_series, matched=True)
 
-        template_protocol.compare_protocol(all_series)
+            protocols.append(template_protocol)
 
-        protocols.append(template_protocol)
+            # Clean up log if match is less than min_match_score
+            if template_protocol.score < min_match_score:
+                Path(logger_template.handlers[0].baseFilename).unlink()  # type: ignore
 
-        if find_first and template_protocol.score == 1:
+        if find_first and protocols[-1].score == 1:
             logger_main.info("Exact match found. No further templates will be checked!")
             break
 
-        # Clean up log if match is less than min_match_score
-        if template_protocol.score < min_match_score:
-            Path(logger_template.handlers[0].baseFilename).unlink()  # type: ignore
+    if stats is not None:
+        stats.save()
 
     # Print summaries and set has_issue flags
     ret_val: int = summary.summarise_protocol_matches(
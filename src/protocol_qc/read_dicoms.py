@@ -19,6 +19,7 @@ Module to read in DICOMs and find all unique series.
 
 from __future__ import annotations
 
+import os
 from pathlib import Path
 from typing import TYPE_CHECKING, Any
 
@@ -26,15 +27,25 @@ if TYPE_CHECKING:  # pragma: no cover
     import logging
 
 import pydicom
+from pydicom.tag import BaseTag
 
 from protocol_qc.classes.dataseries import DataSeries
-
-# Set to True to convert the value(s) of elements with a VR of DA, DT
-# and TM to datetime.date, datetime.datetime and datetime.time respectively.
-pydicom.config.datetime_conversion = True
-
-
-def construct_classes(unique: dict[str, dict[str, Any]]) -> list[DataSeries]:
+from protocol_qc.classes.ingest_state import IngestState
+from protocol_qc.scanners import (
+    is_archive,
+    read_headers,
+    scan_archive,
+    scan_dicomdir,
+    scan_files_indexed,
+    walk_files,
+)
+from protocol_qc.series_index import SeriesIndex
+from protocol_qc.utils.dicom_fields import compact_dataset, header_tags
+
+
+def construct_classes(
+    unique: dict[str, dict[str, Any]], keep_tags: set[BaseTag] | None = None
+) -> list[DataSeries]:
     """
     Construct the DataSeries classes from a list of unique DICOM series.
     The returned list is ordered by SeriesNumber.
@@ -42,7 +53,12 @@ def construct_classes(unique: dict[str, dict[str, Any]]) -> list[DataSeries]:
     Parameters
     ----------
     unique
-        Dictionary of unique data series.
+        Dictionary of unique data series. If a series entry contains the
+        representative header under "data" it is used directly, otherwise the
+        header is read from "path".
+    keep_tags
+        Tags referenced by the templates. If provided, each header is reduced to
+        these tags (see compact_dataset) and the full header is released.
 
     Returns
     -------
@@ -51,7 +67,13 @@ def construct_classes(unique: dict[str, dict[str, Any]]) -> list[DataSeries]:
 
     all_series: list[DataSeries] = []
     for series in unique.values():
-        data: pydicom.dataset.FileDataset = pydicom.dcmread(series["path"])
+        # Reuse the representative header kept from discovery where available
+        data: pydicom.dataset.Dataset | None = series.get("data")
+        if data is None:
+            data = pydicom.dcmread(series["path"], stop_before_pixels=True)
+        if keep_tags is not None:
+            data = compact_dataset(data, keep_tags)
+            series.pop("data", None)
 
         in_scan: DataSeries = DataSeries(data, series["files"], Path(series["path"]))
         all_series.append(in_scan)
@@ -81,17 +103,53 @@ def number_of_files(all_series: list[DataSeries], logger: logging.Logger) -> Non
     logger.info(f"Total DICOM files: {num_files}")
 
 
-def find_unique_series(dir_input: Path, logger: logging.Logger) -> list[DataSeries]:
+def find_unique_series(
+    dir_input: Path,
+    logger: logging.Logger,
+    ingest_workers: int = 1,
+    ingest_executor: str = "thread",
+    series_index: Path | None = None,
+    allow_no_preamble: bool = False,
+    include: list[str] | None = None,
+    exclude: list[str] | None = None,
+    ignore_dicomdir: bool = False,
+    verify_dicomdir: bool = False,
+    keep_tags: set[BaseTag] | None = None,
+) -> list[DataSeries]:
     """
     Find all unique series in the input directory by searching for unique
-    SeriesUID fields.
+    SeriesUID fields. If the directory contains a DICOMDIR, the series are
+    taken from its directory records instead of reading every file. A zip or
+    tar archive can be given instead of a directory, in which case its members
+    are read without extraction.
 
     Parameters
     ----------
     dir_input
-        Path to directory containing DICOM series to be analysed.
+        Path to directory or archive containing DICOM series to be analysed.
     logger:
         Custom summary logger.
+    ingest_workers
+        Number of concurrent workers used to read DICOM headers.
+    ingest_executor
+        Type of executor used when ingest_workers is greater than one,
+        'thread' or 'process'.
+    series_index
+        Path to a SQLite index of previously scanned files. If provided, only
+        files that changed since the previous run are read.
+    allow_no_preamble
+        Also accept DICOM files without a preamble and "DICM" prefix.
+    include
+        Glob patterns of files to read. See walk_files.
+    exclude
+        Glob patterns of files or directories to skip. See walk_files.
+    ignore_dicomdir
+        Scan all files even if the directory contains a DICOMDIR.
+    verify_dicomdir
+        Check that every file listed in the DICOMDIR exists.
+    keep_tags
+        Tags referenced by the templates. If provided, only these tags are
+        parsed and kept from each representative header. See construct_classes.
 
     Returns
     -------
@@ -101,40 +159,190 @@ def find_unique_series(dir_input: Path, logger: logging.Logger) -> list[DataSeri
     ------
     FileNotFoundError
         If directory does not exist or if DICOMS can not be located in the
-        provided directory.
+        provided directory or archive.
     """
 
-    if not dir_input.is_dir():
+    # Representatives only need the tags kept by construct_classes
+    specific_tags: list[BaseTag] | None = None
+    if keep_tags is not None:
+        specific_tags = header_tags(keep_tags)
+
+    unique_series: dict[str, dict[str, Any]]
+    path_dicomdir: Path = dir_input / "DICOMDIR"
+    if is_archive(dir_input):
+        logger.info(f"Finding unique series in archive: {dir_input}")
+        unique_series = scan_archive(
+            dir_input, allow_no_preamble, include, exclude, specific_tags
+        )
+    elif not dir_input.is_dir():
         raise FileNotFoundError(f"Could not locate input directory: {dir_input}")
+    elif path_dicomdir.is_file() and not ignore_dicomdir:
+        logger.info(f"Finding unique series in: {dir_input}/")
+        logger.info(f"Using series listed in: {path_dicomdir}")
+        unique_series = scan_dicomdir(
+            path_dicomdir, logger, verify_dicomdir, specific_tags
+        )
+    else:
+        logger.info(f"Finding unique series in: {dir_input}/")
+        files: list[Path] = walk_files(dir_input, include, exclude)
+
+        if ingest_workers > 1:
+            logger.info(
+                f"Reading headers with {ingest_workers} {ingest_executor} workers"
+            )
+
+        if series_index is not None:
+            logger.info(f"Using series index: {series_index}")
+            # The index may be stored within the directory being scanned
+            path_index: Path = series_index.resolve()
+            if path_index.is_relative_to(dir_input.resolve()):
+                path_index = dir_input / path_index.relative_to(dir_input.resolve())
+                files = [x for x in files if x != path_index]
+            with SeriesIndex(series_index) as index:
+                unique_series = scan_files_indexed(
+                    files,
+                    index,
+                    ingest_workers,
+                    ingest_executor,
+                    allow_no_preamble,
+                    specific_tags,
+                )
+        else:
+            unique_series, _ = read_headers(
+                files, ingest_workers, ingest_executor, allow_no_preamble, specific_tags
+            )
 
-    logger.info(f"Finding unique series in: {dir_input}/")
+    if not unique_series:
+        raise FileNotFoundError(f"Could not locate any DICOMS in: {dir_input}")
 
-    unique_series: dict[str, dict[str, Any]] = {}
+    all_series: list[DataSeries] = construct_classes(unique_series, keep_tags)
 
-    for input_file in dir_input.rglob("*"):
-        if not input_file.is_file() or not pydicom.misc.is_dicom(input_file):
-            continue
+    number_of_files(all_series, logger)
 
-        dicom_data: pydicom.dataset.FileDataset = pydicom.dcmread(input_file)
+    logger.info(f"Unique series found: {len(unique_series)}")
 
-        # Extract acquisition UID and series number
-        series_uid: str = dicom_data.SeriesInstanceUID
+    return all_series
 
-        if series_uid not in unique_series:
-            unique_series[series_uid] = {
-                "files": 1,
-                "path": input_file.as_posix(),
-            }
-        else:
-            unique_series[series_uid]["files"] += 1
 
-    if not unique_series:
-        raise FileNotFoundError(f"Could not locate any DICOMS in: {dir_input}")
+def update_unique_series(
+    dir_input: Path,
+    state: IngestState,
+    logger: logging.Logger,
+    ingest_workers: int = 1,
+    ingest_executor: str = "thread",
+    allow_no_preamble: bool = False,
+    include: list[str] | None = None,
+    exclude: list[str] | None = None,
+    keep_tags: set[BaseTag] | None = None,
+) -> list[DataSeries]:
+    """
+    Incrementally find the unique series in a directory that is still receiving
+    files. Files already recorded in 'state' are skipped without being opened,
+    and new files are folded into the existing DataSeries: file counts are
+    increased and the representative of an existing series is kept. The
+    first call with an empty IngestState performs a full scan.
+
+    Non-DICOM files and files whose header cannot be parsed yet are not
+    recorded, so that files still being written when polled are checked again
+    on the next call. A header cut short after its SeriesInstanceUID may still
+    be read without error, so a new series is only built once the size and
+    mtime of its representative are unchanged since the previous call. Until
+    then its files are not recorded and the series is not returned.
+
+    This is a library function for a process polling a landing directory; the
+    state is only kept in memory and run() does not use it. Separate runs can
+    avoid re-reading unchanged files with a SeriesIndex instead.
 
-    all_series: list[DataSeries] = construct_classes(unique_series)
+    Parameters
+    ----------
+    dir_input
+        Path to directory containing DICOM series to be analysed.
+    state
+        Files and series ingested by previous calls. Updated in place.
+    logger:
+        Custom summary logger.
+    ingest_workers
+        Number of concurrent workers used to read DICOM headers.
+    ingest_executor
+        Type of executor used when ingest_workers is greater than one,
+        'thread' or 'process'.
+    allow_no_preamble
+        Also accept DICOM files without a preamble and "DICM" prefix.
+    include
+        Glob patterns of files to read. See walk_files.
+    exclude
+        Glob patterns of files or directories to skip. See walk_files.
+    keep_tags
+        Tags referenced by the templates. If provided, only these tags are
+        parsed and kept from each representative header. See construct_classes.
 
-    number_of_files(all_series, logger)
+    Returns
+    -------
+        List of all DataSeries found so far, ordered by SeriesNumber.
 
-    logger.info(f"Unique series found: {len(unique_series)}")
+    Raises
+    ------
+    FileNotFoundError
+        If directory does not exist.
+    """
+
+    if not dir_input.is_dir():
+        raise FileNotFoundError(f"Could not locate input directory: {dir_input}")
+
+    files: list[Path] = [
+        x
+        for x in walk_files(dir_input, include, exclude)
+        if x.as_posix() not in state.seen
+    ]
+
+    unique_new: dict[str, dict[str, Any]]
+    file_uids: list[str | None]
+    specific_tags: list[BaseTag] | None = None
+    if keep_tags is not None:
+        specific_tags = header_tags(keep_tags)
+
+    # Taken before reading, so that a file changing while read is not stable
+    signatures: dict[str, tuple[int, int]] = {}
+    for path in files:
+        try:
+            stat: os.stat_result = path.stat()
+        except FileNotFoundError:
+            continue
+        signatures[path.as_posix()] = (stat.st_size, stat.st_mtime_ns)
+
+    unique_new, file_uids = read_headers(
+        files,
+        ingest_workers,
+        ingest_executor,
+        allow_no_preamble,
+        specific_tags,
+        skip_unreadable=True,
+    )
+
+    pending: dict[str, tuple[int, int]] = {}
+    for series_uid, series in unique_new.items():
+        if series_uid in state.series:
+            state.series[series_uid].num_files += series["files"]
+            continue
+        signature: tuple[int, int] | None = signatures.get(series["path"])
+        if signature is None or state.pending.get(series["path"]) != signature:
+            # The representative may still be being written
+            if signature is not None:
+                pending[series["path"]] = signature
+            continue
+        state.series[series_uid] = construct_classes({series_uid: series}, keep_tags)[0]
+    state.pending = pending
+
+    ingested: list[str] = [
+        x.as_posix()
+        for x, uid in zip(files, file_uids)
+        if uid is not None and uid in state.series
+    ]
+    state.seen.update(ingested)
+
+    logger.info(f"Ingested {len(ingested)} new DICOM file(s) from: {dir_input}/")
+
+    all_series: list[DataSeries] = list(state.series.values())
+    all_series.sort(key=lambda x: x.data.SeriesNumber)
 
     return all_series
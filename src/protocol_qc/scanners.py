@@ -0,0 +1,788 @@
+# protocol_qc: An MRI DICOM protocol quality control tool
+# Copyright (C) 2025 The Florey Institute of Neuroscience and Mental Health
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Scanners grouping DICOM files into unique series, from a directory, a series
+index, a DICOMDIR or a zip or tar archive.
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import fnmatch
+import functools
+import io
+import os
+import struct
+import tarfile
+import zipfile
+from pathlib import Path, PurePosixPath
+from typing import IO, TYPE_CHECKING, Any, BinaryIO, Callable, Final, Iterable, Iterator
+
+if TYPE_CHECKING:  # pragma: no cover
+    import logging
+
+import pydicom
+from pydicom.tag import BaseTag, Tag
+
+from protocol_qc.series_index import IndexRecord, SeriesIndex
+
+# Set to True to convert the value(s) of elements with a VR of DA, DT
+# and TM to datetime.date, datetime.datetime and datetime.time respectively.
+pydicom.config.datetime_conversion = True
+
+# DICOM header fields required to group files into series during discovery.
+DISCOVERY_TAGS: Final[list[BaseTag]] = [Tag("SeriesInstanceUID")]
+
+# A DICOM file starts with a 128 byte preamble followed by the "DICM" prefix.
+PREAMBLE_LENGTH: Final[int] = 128
+DICOM_PREFIX: Final[bytes] = b"DICM"
+
+# Files with these extensions are never DICOMs and are skipped without being
+# opened, unless explicitly included.
+NON_DICOM_SUFFIXES: Final[tuple[str, ...]] = (
+    ".nii",
+    ".nii.gz",
+    ".json",
+    ".bval",
+    ".bvec",
+    ".tsv",
+    ".csv",
+    ".txt",
+    ".log",
+    ".md",
+    ".html",
+    ".pdf",
+    ".png",
+    ".jpg",
+    ".jpeg",
+    ".gif",
+    ".tif",
+    ".tiff",
+    ".mat",
+    ".zip",
+    ".tar",
+    ".gz",
+    ".tgz",
+    ".bz2",
+    ".xz",
+    ".sqlite",
+)
+
+# Number of bytes read from each archive member to find its SeriesInstanceUID.
+# Members are only read further if the SeriesInstanceUID lies beyond this prefix
+# or if they represent a new series.
+ARCHIVE_PREFIX_LENGTH: Final[int] = 64 * 1024
+
+# Number of file list partitions handed to each worker when scanning in parallel.
+PARTITIONS_PER_WORKER: Final[int] = 4
+
+# Errors raised when parsing a header that is cut short, e.g. while the file is
+# still being written or beyond the prefix read from an archive member.
+TRUNCATED_ERRORS: Final[tuple[type[Exception], ...]] = (
+    pydicom.errors.InvalidDicomError,
+    struct.error,
+    EOFError,
+    OSError,
+)
+
+
+def _past_discovery_tags(tag: BaseTag, _vr: str | None, _length: int) -> bool:
+    """
+    Stop condition for pydicom.filereader.read_partial. Data elements are stored
+    in ascending tag order, so parsing can end once the last tag required for
+    discovery has been passed. As PixelData (7FE0,0010) always follows the
+    discovery tags, pixel data is never read.
+    """
+
+    return tag > DISCOVERY_TAGS[-1]
+
+
+def read_discovery_header(
+    dicom_file: BinaryIO, force: bool = False
+) -> pydicom.dataset.Dataset:
+    """
+    Read only the header fields required to group a DICOM file into a series.
+    Reading stops at the first data element beyond DISCOVERY_TAGS and the values
+    of all other elements are skipped.
+
+    Parameters
+    ----------
+    dicom_file
+        Open binary file object positioned at the start of a DICOM file.
+    force
+        Read the file even if it has no preamble and "DICM" prefix.
+
+    Returns
+    -------
+        Dataset containing only the DISCOVERY_TAGS (and SpecificCharacterSet).
+    """
+
+    return pydicom.filereader.read_partial(
+        dicom_file,
+        stop_when=_past_discovery_tags,
+        force=force,
+        specific_tags=DISCOVERY_TAGS,
+    )
+
+
+def read_series_uid(
+    dicom_file: BinaryIO, allow_no_preamble: bool = False
+) -> str | None:
+    """
+    Classify a file as DICOM and read its SeriesInstanceUID using a single open
+    file. The preamble and "DICM" prefix are checked from the first bytes of the
+    file, which remain in the read buffer for the header parsing that follows.
+
+    Parameters
+    ----------
+    dicom_file
+        Open binary file object positioned at the start of the file.
+    allow_no_preamble
+        If the preamble and prefix are missing, attempt to parse the file
+        anyway and accept it if it contains a SeriesInstanceUID.
+
+    Returns
+    -------
+        SeriesInstanceUID, or None if the file is not a DICOM.
+    """
+
+    prefix: bytes = dicom_file.read(PREAMBLE_LENGTH + len(DICOM_PREFIX))
+    dicom_file.seek(0)
+
+    # DICOMs that are not part of a series (e.g. DICOMDIR) are also skipped
+    if prefix[PREAMBLE_LENGTH:] == DICOM_PREFIX:
+        return read_discovery_header(dicom_file).get("SeriesInstanceUID")
+
+    if not allow_no_preamble:
+        return None
+
+    try:
+        return read_discovery_header(dicom_file, force=True).get("SeriesInstanceUID")
+    except (pydicom.errors.InvalidDicomError, struct.error, EOFError, ValueError):
+        return None
+
+
+def read_representative_header(
+    dicom_file: BinaryIO, specific_tags: list[BaseTag] | None = None
+) -> pydicom.dataset.FileDataset:
+    """
+    Read the header of the DICOM file used to represent a series, stopping
+    before the pixel data.
+
+    Parameters
+    ----------
+    dicom_file
+        Open binary file object of a DICOM file. It is rewound before reading,
+        so it may have already been used for discovery.
+    specific_tags
+        Only parse these top level tags. The values of all other elements, such
+        as large private CSA headers, are skipped. If None, the full header is
+        read.
+
+    Returns
+    -------
+        FileDataset without pixel data.
+    """
+
+    dicom_file.seek(0)
+
+    # Files reaching this point have already been identified as DICOMs, which
+    # may include files without a preamble
+    return pydicom.dcmread(
+        dicom_file, stop_before_pixels=True, force=True, specific_tags=specific_tags
+    )
+
+
+def matches_any(name: str, rel_path: str, patterns: list[str]) -> bool:
+    """
+    Check if a file name or its path relative to the scanned directory matches
+    any of the glob patterns.
+    """
+
+    return any(
+        fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(rel_path, pattern)
+        for pattern in patterns
+    )
+
+
+def walk_files(
+    dir_input: Path,
+    include: list[str] | None = None,
+    exclude: list[str] | None = None,
+) -> list[Path]:
+    """
+    Recursively list the candidate DICOM files in a directory using os.scandir.
+    Entry types are taken from the directory listing, so no file is stat'ed or
+    opened. Entries are sorted by name within each directory so the order is
+    the same on every file system. Symbolic links to directories are not
+    followed.
+
+    Parameters
+    ----------
+    dir_input
+        Directory to be searched.
+    include
+        Glob patterns of files to keep, matched against the file name and the
+        path relative to dir_input. If provided, all other files are skipped.
+        Included files are kept even if their extension is in
+        NON_DICOM_SUFFIXES.
+    exclude
+        Glob patterns of files or directories to skip, matched against the name
+        and the path relative to dir_input.
+
+    Returns
+    -------
+        List of candidate files.
+    """
+
+    files: list[Path] = []
+    directories: list[str] = [dir_input.as_posix()]
+
+    while directories:
+        directory: str = directories.pop()
+        with os.scandir(directory) as entries:
+            sub_directories: list[str] = []
+            for entry in sorted(entries, key=lambda x: x.name):
+                rel_path: str = os.path.relpath(entry.path, dir_input)
+                if exclude and matches_any(entry.name, rel_path, exclude):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    sub_directories.append(entry.path)
+                    continue
+                if not entry.is_file():
+                    continue
+                if include:
+                    if not matches_any(entry.name, rel_path, include):
+                        continue
+                elif entry.name.lower().endswith(NON_DICOM_SUFFIXES):
+                    continue
+                files.append(Path(entry.path))
+            # Depth first, visiting sub-directories in name order
+            directories.extend(reversed(sub_directories))
+
+    return files
+
+
+def scan_files(
+    files: list[Path],
+    allow_no_preamble: bool = False,
+    specific_tags: list[BaseTag] | None = None,
+    skip_unreadable: bool = False,
+) -> tuple[dict[str, dict[str, Any]], list[str | None]]:
+    """
+    Group a list of files into unique series by their SeriesInstanceUID.
+    Non-DICOM files are skipped. The first file found for each series is kept
+    as its representative. Each file is opened once.
+
+    Parameters
+    ----------
+    files
+        Ordered list of files to be scanned.
+    allow_no_preamble
+        Also accept DICOM files without a preamble and "DICM" prefix.
+    specific_tags
+        Tags parsed from the representative headers. See
+        read_representative_header.
+    skip_unreadable
+        Treat files that are removed or whose header cannot be parsed (see
+        TRUNCATED_ERRORS) as non-DICOM files instead of raising.
+
+    Returns
+    -------
+        (Dictionary of unique series keyed by SeriesInstanceUID in order of
+        first appearance, SeriesInstanceUID of each file or None if the file
+        is not a DICOM)
+    """
+
+    unique_series: dict[str, dict[str, Any]] = {}
+    file_uids: list[str | None] = []
+
+    for input_file in files:
+        try:
+            with input_file.open("rb") as in_dicom:
+                # Extract acquisition UID
+                series_uid: str | None = read_series_uid(in_dicom, allow_no_preamble)
+
+                # First file of a new series: parse the full header from the
+                # already open file so each file is opened only once
+                if series_uid is not None and series_uid not in unique_series:
+                    unique_series[series_uid] = {
+                        "files": 0,
+                        "path": input_file.as_posix(),
+                        "data": read_representative_header(in_dicom, specific_tags),
+                    }
+        except TRUNCATED_ERRORS:
+            if not skip_unreadable:
+                raise
+            series_uid = None
+
+        file_uids.append(series_uid)
+        if series_uid is not None:
+            unique_series[series_uid]["files"] += 1
+
+    return unique_series, file_uids
+
+
+def merge_unique_series(
+    partials: Iterable[dict[str, dict[str, Any]]],
+) -> dict[str, dict[str, Any]]:
+    """
+    Merge the unique series found in consecutive partitions of a file list.
+    File counts are summed and the representative of the earliest partition
+    is kept, so the result is identical to scanning the whole list at once.
+
+    Parameters
+    ----------
+    partials
+        Unique series of each partition, in partition order.
+
+    Returns
+    -------
+        Merged dictionary of unique series.
+    """
+
+    unique_series: dict[str, dict[str, Any]] = {}
+
+    for partial in partials:
+        for series_uid, series in partial.items():
+            if series_uid in unique_series:
+                unique_series[series_uid]["files"] += series["files"]
+            else:
+                unique_series[series_uid] = series
+
+    return unique_series
+
+
+def scan_files_parallel(
+    files: list[Path],
+    ingest_workers: int,
+    ingest_executor: str,
+    allow_no_preamble: bool = False,
+    specific_tags: list[BaseTag] | None = None,
+    skip_unreadable: bool = False,
+) -> tuple[dict[str, dict[str, Any]], list[str | None]]:
+    """
+    Scan files concurrently by splitting the file list into contiguous
+    partitions and merging the unique series of each partition in order.
+
+    Parameters
+    ----------
+    files
+        Ordered list of files to be scanned.
+    ingest_workers
+        Number of concurrent workers.
+    ingest_executor
+        Type of executor to use, 'thread' or 'process'.
+    allow_no_preamble
+        Also accept DICOM files without a preamble and "DICM" prefix.
+    specific_tags
+        Tags parsed from the representative headers. See
+        read_representative_header.
+    skip_unreadable
+        Skip files whose header cannot be parsed. See scan_files.
+
+    Returns
+    -------
+        (Dictionary of unique series keyed by SeriesInstanceUID,
+        SeriesInstanceUID of each file)
+
+    Raises
+    ------
+    ValueError
+        If the executor type is unknown.
+    """
+
+    executor_class: Callable[..., concurrent.futures.Executor]
+    if ingest_executor == "thread":
+        executor_class = concurrent.futures.ThreadPoolExecutor
+    elif ingest_executor == "process":
+        executor_class = concurrent.futures.ProcessPoolExecutor
+    else:
+        raise ValueError(f"Unknown ingestion executor: {ingest_executor}")
+
+    # Use more partitions than workers to balance uneven file sizes
+    size: int = max(1, -(-len(files) // (ingest_workers * PARTITIONS_PER_WORKER)))
+    partitions: list[list[Path]] = [
+        files[i : i + size] for i in range(0, len(files), size)
+    ]
+
+    with executor_class(max_workers=ingest_workers) as executor:
+        # map() yields results in submission order, keeping the merge deterministic
+        results = list(
+            executor.map(
+                functools.partial(
+                    scan_files,
+                    allow_no_preamble=allow_no_preamble,
+                    specific_tags=specific_tags,
+                    skip_unreadable=skip_unreadable,
+                ),
+                partitions,
+            )
+        )
+
+    return (
+        merge_unique_series(x[0] for x in results),
+        [uid for x in results for uid in x[1]],
+    )
+
+
+def read_headers(
+    files: list[Path],
+    ingest_workers: int = 1,
+    ingest_executor: str = "thread",
+    allow_no_preamble: bool = False,
+    specific_tags: list[BaseTag] | None = None,
+    skip_unreadable: bool = False,
+) -> tuple[dict[str, dict[str, Any]], list[str | None]]:
+    """
+    Scan files serially, or in parallel if more than one worker is requested.
+    See scan_files and scan_files_parallel.
+
+    Returns
+    -------
+        (Dictionary of unique series keyed by SeriesInstanceUID,
+        SeriesInstanceUID of each file)
+    """
+
+    if ingest_workers > 1:
+        return scan_files_parallel(
+            files,
+            ingest_workers,
+            ingest_executor,
+            allow_no_preamble,
+            specific_tags,
+            skip_unreadable,
+        )
+
+    return scan_files(files, allow_no_preamble, specific_tags, skip_unreadable)
+
+
+def scan_files_indexed(
+    files: list[Path],
+    index: SeriesIndex,
+    ingest_workers: int,
+    ingest_executor: str,
+    allow_no_preamble: bool = False,
+    specific_tags: list[BaseTag] | None = None,
+) -> dict[str, dict[str, Any]]:
+    """
+    Group a list of files into unique series using a persistent SeriesIndex.
+    Only files whose stat signature (size, mtime) differs from the index are
+    opened. The index is updated with the results of the scan.
+
+    Parameters
+    ----------
+    files
+        Ordered list of files to be scanned.
+    index
+        SeriesIndex from previous runs.
+    ingest_workers
+        Number of concurrent workers used to read stale files.
+    ingest_executor
+        Type of executor used when ingest_workers is greater than one.
+    allow_no_preamble
+        Also accept DICOM files without a preamble and "DICM" prefix.
+    specific_tags
+        Tags parsed from the representative headers. Stored headers are only
+        reused if they were read with at least these tags.
+
+    Returns
+    -------
+        Dictionary of unique series keyed by SeriesInstanceUID. Identical to
+        scanning all files without an index.
+    """
+
+    records: dict[str, IndexRecord] = index.records()
+
+    stats: dict[str, tuple[int, int]] = {}
+    file_uids: dict[str, str | None] = {}
+    stale: list[Path] = []
+    for input_file in files:
+        path: str = input_file.as_posix()
+        # Files removed since the directory was walked are left out
+        try:
+            stat: os.stat_result = input_file.stat()
+        except FileNotFoundError:
+            continue
+        stats[path] = (stat.st_size, stat.st_mtime_ns)
+        record: IndexRecord | None = records.get(path)
+        if record is not None and (record.size, record.mtime_ns) == stats[path]:
+            file_uids[path] = record.series_uid
+        else:
+            stale.append(input_file)
+
+    unique_stale: dict[str, dict[str, Any]]
+    uids_stale: list[str | None]
+    unique_stale, uids_stale = read_headers(
+        stale, ingest_workers, ingest_executor, allow_no_preamble, specific_tags
+    )
+
+    for input_file, series_uid in zip(stale, uids_stale):
+        path = input_file.as_posix()
+        file_uids[path] = series_uid
+        index.update(path, stats[path], series_uid)
+
+    index.remove(set(records).difference(stats))
+
+    # Rebuild the series in file order so representatives match a full scan
+    unique_series: dict[str, dict[str, Any]] = {}
+    for input_file in files:
+        series_uid = file_uids.get(input_file.as_posix())
+        if series_uid is None:
+            continue
+        if series_uid in unique_series:
+            unique_series[series_uid]["files"] += 1
+        else:
+            unique_series[series_uid] = {"files": 1, "path": input_file.as_posix()}
+
+    for series_uid, series in unique_series.items():
+        path = series["path"]
+        if series_uid in unique_stale and unique_stale[series_uid]["path"] == path:
+            series["data"] = unique_stale[series_uid]["data"]
+            index.store_header(path, series["data"], specific_tags)
+        elif (header := index.header(path, specific_tags)) is not None:
+            series["data"] = header
+        else:
+            # Representative changed to a file whose header was not stored, or
+            # was stored without all of the required tags
+            with open(path, "rb") as in_dicom:
+                series["data"] = read_representative_header(in_dicom, specific_tags)
+            index.store_header(path, series["data"], specific_tags)
+
+    return unique_series
+
+
+def scan_dicomdir(
+    path_dicomdir: Path,
+    logger: logging.Logger,
+    verify: bool = False,
+    specific_tags: list[BaseTag] | None = None,
+) -> dict[str, dict[str, Any]]:
+    """
+    Group the instances listed in a DICOMDIR into unique series using its
+    directory records, so only the representative of each series is opened.
+    The record hierarchy is followed through the record offsets, and each
+    instance inherits the SeriesInstanceUID of its SERIES record.
+
+    Parameters
+    ----------
+    path_dicomdir
+        Path to the DICOMDIR file.
+    logger:
+        Custom summary logger.
+    verify
+        Check that each referenced file exists. Missing files are reported and
+        not counted.
+    specific_tags
+        Tags parsed from the representative headers. See
+        read_representative_header.
+
+    Returns
+    -------
+        Dictionary of unique series keyed by SeriesInstanceUID.
+    """
+
+    dicomdir: pydicom.dataset.FileDataset = pydicom.dcmread(path_dicomdir)
+
+    # Directory record offsets refer to the start of each sequence item
+    records: dict[int, pydicom.dataset.Dataset] = {
+        x.seq_item_tell: x for x in dicomdir.DirectoryRecordSequence
+    }
+
+    unique_series: dict[str, dict[str, Any]] = {}
+
+    def visit(offset: int, series_uid: str | None) -> None:
+        """Visit a directory entity and its lower level entities in order"""
+        while offset:
+            record: pydicom.dataset.Dataset = records[offset]
+            record_uid: str | None = series_uid
+            if record.DirectoryRecordType == "SERIES":
+                record_uid = record.SeriesInstanceUID
+            elif record_uid and "ReferencedFileID" in record:
+                file_id = record.ReferencedFileID
+                path: Path = path_dicomdir.parent.joinpath(
+                    *([file_id] if isinstance(file_id, str) else file_id)
+                )
+                if verify and not path.is_file():
+                    logger.warning(f"File listed in DICOMDIR not found: {path}")
+                elif record_uid in unique_series:
+                    unique_series[record_uid]["files"] += 1
+                else:
+                    unique_series[record_uid] = {"files": 1, "path": path}
+            visit(record.OffsetOfReferencedLowerLevelDirectoryEntity, record_uid)
+            offset = record.OffsetOfTheNextDirectoryRecord
+
+    visit(dicomdir.OffsetOfTheFirstDirectoryRecordOfTheRootDirectoryEntity, None)
+
+    for series in unique_series.values():
+        with series["path"].open("rb") as in_dicom:
+            series["data"] = read_representative_header(in_dicom, specific_tags)
+        series["path"] = series["path"].as_posix()
+
+    return unique_series
+
+
+def is_archive(path: Path) -> bool:
+    """
+    Check if a path is a zip or tar (optionally compressed) archive.
+    """
+
+    return path.is_file() and (zipfile.is_zipfile(path) or tarfile.is_tarfile(path))
+
+
+def _member_selected(
+    name: str, include: list[str] | None, exclude: list[str] | None
+) -> bool:
+    """
+    Apply the walk_files include and exclude rules to an archive member, with
+    the member name as the relative path and its parent directories matched
+    against the exclude patterns.
+    """
+
+    parts: tuple[str, ...] = PurePosixPath(name).parts
+    if exclude and any(
+        matches_any(parts[i - 1], "/".join(parts[:i]), exclude)
+        for i in range(1, len(parts) + 1)
+    ):
+        return False
+    if include:
+        return matches_any(parts[-1], name, include)
+
+    return not name.lower().endswith(NON_DICOM_SUFFIXES)
+
+
+def _iter_zip(path_archive: Path) -> Iterator[tuple[str, IO[bytes]]]:
+    """Iterate over the regular file members of a zip archive"""
+
+    with zipfile.ZipFile(path_archive) as archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            with archive.open(info) as member:
+                yield PurePosixPath(info.filename).as_posix(), member
+
+
+def _iter_tar(path_archive: Path) -> Iterator[tuple[str, IO[bytes]]]:
+    """Iterate over the regular file members of a tar archive, as a stream"""
+
+    with tarfile.open(path_archive, "r|*") as archive:
+        for info in archive:
+            if not info.isfile():
+                continue
+            member: IO[bytes] | None = archive.extractfile(info)
+            if member is None:
+                continue
+            yield PurePosixPath(info.name).as_posix(), member
+
+
+def iter_archive(path_archive: Path) -> Iterator[tuple[str, IO[bytes]]]:
+    """
+    Iterate over the regular file members of a zip or tar archive in archive
+    order. Tar archives are opened as a stream, so compressed archives are
+    decompressed once from start to end. Each member must be read before
+    advancing to the next.
+
+    Parameters
+    ----------
+    path_archive
+        Path to the archive.
+
+    Yields
+    ------
+        (normalised member path, open binary member)
+    """
+
+    if zipfile.is_zipfile(path_archive):
+        yield from _iter_zip(path_archive)
+    else:
+        yield from _iter_tar(path_archive)
+
+
+def scan_archive(
+    path_archive: Path,
+    allow_no_preamble: bool = False,
+    include: list[str] | None = None,
+    exclude: list[str] | None = None,
+    specific_tags: list[BaseTag] | None = None,
+) -> dict[str, dict[str, Any]]:
+    """
+    Group the members of a zip or tar archive into unique series without
+    extracting them. Only the first ARCHIVE_PREFIX_LENGTH bytes of each member
+    are read to find its SeriesInstanceUID, and only the representative of each
+    series is read in full.
+
+    Parameters
+    ----------
+    path_archive
+        Path to the archive.
+    allow_no_preamble
+        Also accept DICOM files without a preamble and "DICM" prefix.
+    include
+        Glob patterns of members to read. See walk_files.
+    exclude
+        Glob patterns of members or directories to skip. See walk_files.
+    specific_tags
+        Tags parsed from the representative headers. See
+        read_representative_header.
+
+    Returns
+    -------
+        Dictionary of unique series keyed by SeriesInstanceUID. Representative
+        paths are given as the member path within the archive path.
+    """
+
+    unique_series: dict[str, dict[str, Any]] = {}
+
+    for name, member in iter_archive(path_archive):
+        if not _member_selected(name, include, exclude):
+            continue
+
+        prefix: bytes = member.read(ARCHIVE_PREFIX_LENGTH)
+        buffer = io.BytesIO(prefix)
+        partial: bool = len(prefix) == ARCHIVE_PREFIX_LENGTH
+        series_uid: str | None = None
+        try:
+            series_uid = read_series_uid(buffer, allow_no_preamble)
+        except TRUNCATED_ERRORS:
+            # The prefix may end within an element of a large header
+            if not partial:
+                raise
+        if (
+            series_uid is None
+            and partial
+            and (allow_no_preamble or prefix[PREAMBLE_LENGTH:].startswith(DICOM_PREFIX))
+        ):
+            # SeriesInstanceUID may lie beyond the prefix of a large header
+            buffer = io.BytesIO(prefix + member.read())
+            series_uid = read_series_uid(buffer, allow_no_preamble)
+
+        if series_uid is None:
+            continue
+
+        if series_uid in unique_series:
+            unique_series[series_uid]["files"] += 1
+            continue
+
+        # Representative of a new series: read the rest of the member
+        buffer.seek(0, os.SEEK_END)
+        buffer.write(member.read())
+        unique_series[series_uid] = {
+            "files": 1,
+            "path": (path_archive / name).as_posix(),
+            "data": read_representative_header(buffer, specific_tags),
+        }
+
+    return unique_series
@@ -0,0 +1,197 @@
+# protocol_qc: An MRI DICOM protocol quality control tool
+# Copyright (C) 2025 The Florey Institute of Neuroscience and Mental Health
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Score matrix of the series templates of a protocol template against the data
+series. Requires the optional NumPy dependency.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Final
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    HAS_NUMPY: bool = False
+else:
+    HAS_NUMPY = True
+
+if TYPE_CHECKING:  # pragma: no cover
+    import numpy.typing as npt
+
+    from protocol_qc.classes.dataseries import DataSeries
+    from protocol_qc.classes.series import SeriesMatch, TemplateSeries
+
+# Lowest score reported for the best matches of a series template in tags
+MIN_TAG_SCORE: Final[float] = 0.01
+
+
+class ScoreMatrix:
+    """
+    Sparse matrix of the SeriesMatches of the series templates (rows) against
+    the data series (columns) of a protocol template. Only the comparisons that
+    were made are stored, as coordinate arrays ordered by row and then by
+    comparison, so the match status of every series template, the unmatched
+    data series and the best matches are found with vectorised reductions
+    instead of rescanning the SeriesMatches of each series template.
+
+    Parameters
+    ----------
+    templates_series
+        Series templates of the protocol template, after comparison.
+    all_series
+        Data series the series templates were compared against.
+    """
+
+    def __init__(
+        self, templates_series: list[TemplateSeries], all_series: list[DataSeries]
+    ) -> None:
+        self.templates_series: list[TemplateSeries] = templates_series
+        # Columns are keyed by label, like the matches reported for each row
+        self.labels: list[str] = sorted({x.unique_label() for x in all_series})
+        columns: dict[str, int] = {x: i for i, x in enumerate(self.labels)}
+
+        self.series_matches: list[SeriesMatch] = [
+            x
+            for template_series in templates_series
+            for x in template_series.series_matches
+        ]
+        num_entries: int = len(self.series_matches)
+
+        self.rows: npt.NDArray[np.intp] = np.repeat(
+            np.arange(len(templates_series), dtype=np.intp),
+            [len(x.series_matches) for x in templates_series],
+        )
+        self.cols: npt.NDArray[np.intp] = np.fromiter(
+            (columns[x.unique_label] for x in self.series_matches),
+            dtype=np.intp,
+            count=num_entries,
+        )
+        self.scores: npt.NDArray[np.float64] = np.fromiter(
+            (x.score for x in self.series_matches), dtype=np.float64, count=num_entries
+        )
+        self.complete: npt.NDArray[np.bool_] = np.fromiter(
+            (x.complete for x in self.series_matches), dtype=np.bool_, count=num_entries
+        )
+        min_scores: npt.NDArray[np.float64] = np.array(
+            [x.min_match_score for x in templates_series], dtype=np.float64
+        )
+
+        # A series template is matched by its full matches if it has any, and
+        # by its partial matches otherwise. See TemplateSeries.calc_match_status
+        full: npt.NDArray[np.bool_] = self.scores == 1
+        partial: npt.NDArray[np.bool_] = (self.scores > min_scores[self.rows]) & (
+            self.scores < 1
+        )
+        self.has_full: npt.NDArray[np.bool_] = self._count(full) > 0
+        self.selected: npt.NDArray[np.bool_] = full | (
+            partial & ~self.has_full[self.rows]
+        )
+
+    @classmethod
+    def build(
+        cls, templates_series: list[TemplateSeries], all_series: list[DataSeries]
+    ) -> ScoreMatrix | None:
+        """
+        Build the score matrix if NumPy is installed.
+
+        Returns
+        -------
+            ScoreMatrix, or None without NumPy.
+        """
+
+        if not HAS_NUMPY:
+            return None
+
+        return cls(templates_series, all_series)
+
+    def _count(self, mask: npt.NDArray[np.bool_]) -> npt.NDArray[np.intp]:
+        """Number of entries of each row within a mask"""
+
+        return np.bincount(self.rows[mask], minlength=len(self.templates_series))
+
+    def _split(self, mask: npt.NDArray[np.bool_]) -> list[list[SeriesMatch]]:
+        """SeriesMatches of each row within a mask, in comparison order"""
+
+        indices: npt.NDArray[np.intp] = np.flatnonzero(mask)
+        bounds: npt.NDArray[np.intp] = np.searchsorted(
+            self.rows[indices], np.arange(len(self.templates_series) + 1)
+        )
+
+        return [
+            [self.series_matches[x] for x in indices[start:stop]]
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        ]
+
+    def calc_match_status(self) -> None:
+        """
+        Calculate the match status of every series template and set their
+        attributes accordingly.
+        """
+
+        incomplete: npt.NDArray[np.bool_] = (
+            self._count(self.selected & ~self.complete) > 0
+        )
+        for template_series, matches, full, missing_files in zip(
+            self.templates_series,
+            self._split(self.selected),
+            self.has_full,
+            incomplete,
+        ):
+            template_series.set_matches(matches, bool(full), bool(missing_files))
+
+    def unmatched(self) -> list[str]:
+        """
+        Return the labels of the data series not matched by any series template.
+
+        Returns
+        -------
+            Sorted list of unique labels.
+        """
+
+        matched: npt.NDArray[np.bool_] = np.zeros(len(self.labels), dtype=np.bool_)
+        matched[self.cols[self.selected]] = True
+
+        return [self.labels[x] for x in np.flatnonzero(~matched)]
+
+    def best_matches(self) -> dict[str, tuple[float, list[str]]]:
+        """
+        Return the highest score of the matches of each series template, and
+        the labels of the data series with that score.
+
+        Returns
+        -------
+            (score, labels) keyed by series template name. The score is 0 if
+            there are no labels.
+        """
+
+        best: npt.NDArray[np.float64] = np.full(
+            len(self.templates_series), MIN_TAG_SCORE, dtype=np.float64
+        )
+        np.maximum.at(best, self.rows[self.selected], self.scores[self.selected])
+        highest: npt.NDArray[np.bool_] = self.selected & (
+            self.scores == best[self.rows]
+        )
+
+        return {
+            template_series.name: (
+                float(score) if matches else 0.0,
+                [x.unique_label for x in matches],
+            )
+            for template_series, score, matches in zip(
+                self.templates_series, best, self._split(highest)
+            )
+        }
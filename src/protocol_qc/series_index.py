@@ -0,0 +1,205 @@
+# protocol_qc: An MRI DICOM protocol quality control tool
+# Copyright (C) 2025 The Florey Institute of Neuroscience and Mental Health
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Persistent on-disk index of scanned DICOM files.
+"""
+
+from __future__ import annotations
+
+import io
+import sqlite3
+from pathlib import Path
+from typing import Any, Final, NamedTuple
+
+import pydicom
+from pydicom.tag import BaseTag, Tag
+
+# Increment when the schema changes. Indexes with another version are rebuilt.
+SCHEMA_VERSION: Final[int] = 2
+
+IndexRecord = NamedTuple(
+    "IndexRecord",
+    [
+        ("size", int),
+        ("mtime_ns", int),
+        ("series_uid", str | None),
+    ],
+)
+
+
+class SeriesIndex:
+    """
+    SQLite backed index recording the stat signature (size, mtime) and
+    SeriesInstanceUID of every scanned file, plus the header of the files
+    used to represent a series and the tags it was read with. Files whose stat
+    signature is unchanged since the last run do not need to be opened again.
+
+    Parameters
+    ----------
+    path_index
+        Path to the SQLite database. It is created if it does not exist.
+    """
+
+    def __init__(self, path_index: Path) -> None:
+        self.path_index: Path = path_index
+        self.connection: sqlite3.Connection = sqlite3.connect(path_index)
+
+        version: int = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self.connection.execute("DROP TABLE IF EXISTS files")
+            self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " series_uid TEXT,"
+            " header BLOB,"
+            " header_tags TEXT"
+            ")"
+        )
+        self.connection.commit()
+
+    def __enter__(self) -> SeriesIndex:
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Commit any pending changes and close the database.
+        """
+
+        self.connection.commit()
+        self.connection.close()
+
+    def records(self) -> dict[str, IndexRecord]:
+        """
+        Return all indexed files.
+
+        Returns
+        -------
+            Dictionary of IndexRecords keyed by file path.
+        """
+
+        return {
+            path: IndexRecord(size, mtime_ns, series_uid)
+            for path, size, mtime_ns, series_uid in self.connection.execute(
+                "SELECT path, size, mtime_ns, series_uid FROM files"
+            )
+        }
+
+    def header(
+        self, path: str, tags: list[BaseTag] | None = None
+    ) -> pydicom.dataset.FileDataset | None:
+        """
+        Return the stored header of a representative file.
+
+        Parameters
+        ----------
+        path
+            Path of the indexed file.
+        tags
+            Tags the header must contain if present in the file. If None, the
+            full header is required.
+
+        Returns
+        -------
+            Stored header, or None if no header was stored for the file or it
+            was read with fewer tags.
+        """
+
+        row = self.connection.execute(
+            "SELECT header, header_tags FROM files WHERE path = ?", (path,)
+        ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        if row[1] is not None:
+            stored: set[BaseTag] = {Tag(int(x, 16)) for x in row[1].split()}
+            if tags is None or not stored.issuperset(tags):
+                return None
+
+        # Headers of files read with allow_no_preamble are stored without one
+        return pydicom.dcmread(io.BytesIO(row[0]), force=True)
+
+    def update(
+        self,
+        path: str,
+        stat: tuple[int, int],
+        series_uid: str | None,
+    ) -> None:
+        """
+        Record the stat signature and SeriesInstanceUID of a scanned file. Any
+        previously stored header is discarded.
+
+        Parameters
+        ----------
+        path
+            Path of the scanned file.
+        stat
+            (size, mtime in nanoseconds) of the file.
+        series_uid
+            SeriesInstanceUID of the file, or None if it is not a DICOM.
+        """
+
+        self.connection.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, NULL, NULL)",
+            (path, stat[0], stat[1], series_uid),
+        )
+
+    def store_header(
+        self,
+        path: str,
+        data: pydicom.dataset.FileDataset,
+        tags: list[BaseTag] | None = None,
+    ) -> None:
+        """
+        Store the header of a representative file.
+
+        Parameters
+        ----------
+        path
+            Path of the indexed file.
+        data
+            Header of the file, without pixel data.
+        tags
+            Tags the header was read with, or None for the full header.
+        """
+
+        buffer = io.BytesIO()
+        pydicom.dcmwrite(buffer, data, write_like_original=True)
+        header_tags: str | None = None
+        if tags is not None:
+            header_tags = " ".join(f"{int(x):08X}" for x in tags)
+        self.connection.execute(
+            "UPDATE files SET header = ?, header_tags = ? WHERE path = ?",
+            (buffer.getvalue(), header_tags, path),
+        )
+
+    def remove(self, paths: set[str]) -> None:
+        """
+        Remove files that no longer exist from the index.
+
+        Parameters
+        ----------
+        paths
+            Paths of files to be removed.
+        """
+
+        self.connection.executemany(
+            "DELETE FROM files WHERE path = ?", ((path,) for path in paths)
+        )
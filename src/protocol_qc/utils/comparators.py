@@ -0,0 +1,225 @@
+# protocol_qc: An MRI DICOM protocol quality control tool
+# Copyright (C) 2025 The Florey Institute of Neuroscience and Mental Health
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Comparators between the fields of series templates and DICOM header values.
+Each is built once per template field, so comparing a data series only extracts
+and compares values.
+"""
+
+import json
+import logging
+import re
+from typing import Any, Callable, NamedTuple
+
+from protocol_qc.utils.patterns import compile_pattern
+
+ComparisonField = NamedTuple(
+    "ComparisonField",
+    [
+        ("name", str),
+        ("value", Any),
+        ("comparison", str),
+        ("compulsory", bool),
+    ],
+)
+
+# Returns 1 if a DICOM series value is a match, 0 if not. The logger is passed
+# on each call as the template logger can be swapped while matching.
+Comparator = Callable[[Any, logging.Logger], int]
+
+
+def compile_exact(field: ComparisonField) -> Comparator:
+    """
+    Build a comparator determining if the header fields are an exact match.
+
+    Parameters
+    ----------
+    field
+        Value of the user specified field from template procotol.
+
+    Returns
+    -------
+        Comparator of a DICOM series value.
+    """
+
+    value: Any = field.value
+
+    def compare(attribute: Any, logger: logging.Logger) -> int:
+        if value == attribute:
+            return 1
+
+        logger.debug(f"    {field.name}: {value} != {attribute}")
+        return 0
+
+    return compare
+
+
+def compile_regex(field: ComparisonField, context: str) -> Comparator:
+    """
+    Build a comparator determining if the DICOM header field matches the regex
+    specified in the template. The regular expressions are taken from the
+    pattern registry, so each is compiled once. If the template value is a list
+    (e.g., ImageType), the individual entries will be compared. The template
+    list can be shorter than the data list, in which case only a portion of the
+    data list will be checked.
+
+    Parameters
+    ----------
+    field
+        Value of the user specified field from template procotol.
+    context
+        Where the field is defined, used when reporting errors.
+
+    Returns
+    -------
+        Comparator of a DICOM series value.
+
+    Raises
+    ------
+    re.error
+        If the template value is not a valid regular expression.
+    """
+
+    if isinstance(field.value, list):
+        patterns: list[re.Pattern[str]] = [
+            compile_pattern(x, context) for x in field.value
+        ]
+    else:
+        pattern: re.Pattern[str] = compile_pattern(field.value, context)
+
+    def compare(attribute: Any, logger: logging.Logger) -> int:
+        if isinstance(field.value, list):
+            values: list[Any]
+            if isinstance(attribute, list):
+                values = [str(x) for x in attribute]
+            else:
+                values = json.loads(str(attribute).replace("'", '"'))
+            for compiled, val in zip(patterns, values):
+                if not compiled.search(val):
+                    break
+            else:
+                return 1
+        elif pattern.search(str(attribute)):
+            return 1
+
+        logger.debug(
+            f"    {field.name}: {field.value} regex not matched to {attribute}"
+        )
+        return 0
+
+    return compare
+
+
+def compile_in_range(field: ComparisonField) -> Comparator:
+    """
+    Build a comparator determining if the DICOM header field is within a
+    certain range. The bounds are inclusive.
+
+    Parameters
+    ----------
+    field
+        Value of the user specified field from template procotol.
+
+    Returns
+    -------
+        Comparator of a DICOM series value. It raises a TypeError if the value
+        cannot be converted to float.
+
+    Raises
+    ------
+    TypeError
+        If the template value is not a list of two numerical values.
+    """
+
+    if len(field.value) != 2 or any(
+        not isinstance(value, (int, float)) for value in field.value
+    ):
+        raise TypeError(
+            'Cannot apply "in_range" comparison'
+            f' to key "{field.name}":'
+            '"value" must be a list of two numerical values'
+        )
+    lower: float = float(field.value[0])
+    upper: float = float(field.value[1])
+
+    def compare(attribute: Any, logger: logging.Logger) -> int:
+        try:
+            value: float = float(attribute)
+        except TypeError as exc:
+            raise TypeError(
+                'Cannot apply "in_range" comparison'
+                f' to key "{field.name}"'
+                f' (could not convert "{attribute}" to float)'
+            ) from exc
+        if lower <= value <= upper:
+            return 1
+
+        logger.debug(f"    {field.name}: {value} not within range ({field.value})")
+        return 0
+
+    return compare
+
+
+def compile_in_set(field: ComparisonField) -> Comparator:
+    """
+    Build a comparator determining if the DICOM header field is contained
+    within a set of values. Plain string and numeric values are looked up in a
+    frozenset. Other values, such as lists or pydicom value representations
+    which compare equal to strings, are searched for in the template values.
+
+    Parameters
+    ----------
+    field
+        Value of the user specified field from template procotol.
+
+    Returns
+    -------
+        Comparator of a DICOM series value.
+
+    Raises
+    ------
+    TypeError
+        If the template value is not iterable.
+    """
+
+    try:
+        iter(field.value)
+    except TypeError as exc:
+        raise TypeError(
+            'Cannot apply "in_set" comparison'
+            f' to key "{field.name}":'
+            ' type of "value" is not an iterable'
+        ) from exc
+
+    members: frozenset[Any] | None = None
+    if isinstance(field.value, (list, tuple)):
+        try:
+            members = frozenset(field.value)
+        except TypeError:
+            members = None
+
+    def compare(attribute: Any, logger: logging.Logger) -> int:
+        if members is not None and type(attribute) in (str, int, float):
+            found: bool = attribute in members
+        else:
+            found = attribute in field.value
+        if found:
+            return 1
+
+        logger.debug(f"    {field.name}: {attribute} not in set ({field.value})")
+        return 0
+
+    return compare
@@ -23,6 +23,9 @@ import logging
 import sys
 from pathlib import Path
 
+# (level, message) of log records kept to be logged later
+LogRecords = list[tuple[int, str]]
+
 
 def set_logging_dir(log_dir: Path | None) -> Path:
     """
@@ -92,3 +95,45 @@ def custom_logger(
     logger.addHandler(file_handler)
 
     return logger
+
+
+class RecordHandler(logging.Handler):
+    """Keep log records to be logged later, e.g. in the order of the data series"""
+
+    def __init__(self) -> None:
+        super().__init__(logging.DEBUG)
+        self.records: LogRecords = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append((record.levelno, record.getMessage()))
+
+    def take(self) -> LogRecords:
+        """Return and clear the records"""
+
+        records: LogRecords = self.records
+        self.records = []
+        return records
+
+
+def record_logger(name: str) -> tuple[logging.Logger, RecordHandler]:
+    """
+    Return a logger keeping all its records in a RecordHandler instead of
+    writing them.
+
+    Parameters
+    ----------
+    name
+        Name of logger.
+
+    Returns
+    -------
+        Logger and the handler keeping its records.
+    """
+
+    handler: RecordHandler = RecordHandler()
+    logger: logging.Logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+
+    return logger, handler
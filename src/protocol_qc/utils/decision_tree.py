@@ -0,0 +1,323 @@
+# protocol_qc: An MRI DICOM protocol quality control tool
+# Copyright (C) 2025 The Florey Institute of Neuroscience and Mental Health
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Discrimination tree over the exact comparison fields of a template library.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Final, Hashable, NamedTuple, Sequence
+
+from protocol_qc.utils.exact_index import (
+    ExactFieldIndex,
+    attribute_keys,
+    indexed_fields,
+)
+
+# Increment when the cached tree format changes
+TREE_VERSION: Final[int] = 1
+
+# Number of cached trees kept, the least recently used are removed
+MAX_CACHED_TREES: Final[int] = 8
+
+TreeNode = NamedTuple(
+    "TreeNode",
+    [
+        ("field", str | None),
+        ("branches", dict[Hashable, "TreeNode"]),
+        ("other", "TreeNode | None"),
+        ("budget", int),
+        ("templates", tuple[int, ...]),
+    ],
+)
+
+
+def _hashable(value: Any) -> Hashable:
+    """Convert JSON lists back to the tuples used as keys"""
+
+    return tuple(value) if isinstance(value, list) else value
+
+
+def prune_cache(cache_dir: Path, keep: int = MAX_CACHED_TREES) -> None:
+    """
+    Remove all but the most recently used cached trees.
+
+    Parameters
+    ----------
+    cache_dir
+        Directory the trees are cached in.
+    keep
+        Number of cached trees to keep.
+    """
+
+    cached: list[Path] = sorted(
+        cache_dir.glob("tree_*.json"), key=lambda x: x.stat().st_mtime_ns
+    )
+    for path_cache in cached[: max(0, len(cached) - keep)]:
+        path_cache.unlink(missing_ok=True)
+
+
+class DiscriminationTree(ExactFieldIndex):
+    """
+    Discrimination tree over the compulsory exact comparison fields of series
+    templates. Each node tests the field constrained by most of its series
+    templates, with one branch per template value, and another branch for the
+    series templates that do not constrain the field. A data series is
+    classified by walking the branches within the mismatch budget of the
+    series templates below them, so a series template is usually reached
+    after a handful of look-ups. The candidates are the same as those of an
+    ExactFieldIndex; the scores still come from comparing the candidates.
+
+    The tree only depends on the template fields, and is cached in
+    'cache_dir' as tree_<hash of the templates>.json. Only the
+    MAX_CACHED_TREES most recently used trees are kept (see prune_cache).
+    The directory can be deleted at any time to clear the cache.
+
+    Parameters
+    ----------
+    templates
+        (key, fields, min_match_score) of each series template.
+    cache_dir
+        Directory to cache the tree in. Not cached if None.
+    """
+
+    def __init__(
+        self,
+        templates: Sequence[tuple[int, dict[str, dict[str, Any]], float]],
+        cache_dir: Path | None = None,
+    ) -> None:
+        super().__init__(templates)
+
+        # Series templates are identified by position within the tree
+        self._keys: list[int] = [x[0] for x in templates]
+        self._budgets: list[int] = [
+            self.mismatch_budget(key) if key in self else -1 for key in self._keys
+        ]
+
+        path_cache: Path | None = None
+        if cache_dir is not None:
+            digest: str = hashlib.sha256(
+                json.dumps(
+                    [[x[1], x[2]] for x in templates], sort_keys=True, default=str
+                ).encode()
+            ).hexdigest()
+            path_cache = cache_dir / f"tree_{digest}.json"
+
+        self.root: TreeNode | None = None
+        if path_cache is not None and path_cache.is_file():
+            self.root = self._read_cache(path_cache)
+
+        if self.root is None:
+            constraints: dict[int, dict[str, Hashable]] = {
+                idx: indexed_fields(fields)
+                for idx, (key, fields, _) in enumerate(templates)
+                if key in self
+            }
+            self.root = self._build(constraints)
+            if path_cache is not None:
+                self._write_cache(path_cache, self.root)
+                prune_cache(path_cache.parent)
+
+    def _read_cache(self, path_cache: Path) -> TreeNode | None:
+        """
+        Read a cached tree and mark it as recently used.
+
+        Returns
+        -------
+            Root of the tree, or None if the cached tree is from another
+            TREE_VERSION, cannot be decoded, or was removed by a concurrent run.
+        """
+
+        try:
+            cached: dict[str, Any] = json.loads(path_cache.read_text())
+            if cached.get("version") != TREE_VERSION:
+                return None
+            root: TreeNode = self._from_dict(cached["root"])
+            # Mark the tree as recently used
+            os.utime(path_cache)
+        except (FileNotFoundError, ValueError):
+            # json.JSONDecodeError and UnicodeDecodeError are ValueErrors
+            return None
+
+        return root
+
+    def _write_cache(self, path_cache: Path, root: TreeNode) -> None:
+        """
+        Cache a tree. The tree is written to a temporary file in the cache
+        directory and moved into place, so concurrent runs never read a partly
+        written tree.
+        """
+
+        path_cache.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w",
+            dir=path_cache.parent,
+            prefix=f"{path_cache.name}.",
+            suffix=".tmp",
+            delete=False,
+        ) as file_tmp:
+            try:
+                json.dump(
+                    {"version": TREE_VERSION, "root": self._to_dict(root)}, file_tmp
+                )
+            except BaseException:
+                file_tmp.close()
+                os.unlink(file_tmp.name)
+                raise
+        os.replace(file_tmp.name, path_cache)
+
+    def mismatch_budget(self, key: int) -> int:
+        """
+        Return the number of exact fields of an indexed series template that
+        can mismatch while the score can still exceed min_match_score.
+
+        Parameters
+        ----------
+        key
+            Key of an indexed series template.
+
+        Returns
+        -------
+            Number of mismatches allowed.
+        """
+
+        num_fields, num_indexed, min_match_score = self._limits[key]
+        budget: int = 0
+        while (
+            budget < num_indexed
+            and (num_fields - budget - 1) / num_fields > min_match_score
+        ):
+            budget += 1
+
+        return budget
+
+    def _build(self, constraints: dict[int, dict[str, Hashable]]) -> TreeNode:
+        """Build the tree of series templates with the remaining constraints"""
+
+        budget: int = max((self._budgets[x] for x in constraints), default=-1)
+
+        counts: Counter[str] = Counter(
+            field_name for fields in constraints.values() for field_name in fields
+        )
+        if not counts:
+            return TreeNode(None, {}, None, budget, tuple(sorted(constraints)))
+
+        # Split on the field constrained by most series templates, preferring
+        # fields with more distinct values
+        field_name: str = max(
+            counts,
+            key=lambda x: (
+                counts[x],
+                len({y[x] for y in constraints.values() if x in y}),
+                x,
+            ),
+        )
+
+        groups: dict[Hashable, dict[int, dict[str, Hashable]]] = {}
+        other: dict[int, dict[str, Hashable]] = {}
+        for idx, fields in constraints.items():
+            if field_name in fields:
+                remaining: dict[str, Hashable] = dict(fields)
+                value: Hashable = remaining.pop(field_name)
+                groups.setdefault(value, {})[idx] = remaining
+            else:
+                other[idx] = fields
+
+        return TreeNode(
+            field_name,
+            {value: self._build(group) for value, group in groups.items()},
+            self._build(other) if other else None,
+            budget,
+            (),
+        )
+
+    def _to_dict(self, node: TreeNode) -> dict[str, Any]:
+        """Convert a node to a JSON serialisable dictionary"""
+
+        return {
+            "field": node.field,
+            "branches": [
+                [value, self._to_dict(x)] for value, x in node.branches.items()
+            ],
+            "other": None if node.other is None else self._to_dict(node.other),
+            "budget": node.budget,
+            "templates": list(node.templates),
+        }
+
+    def _from_dict(self, node: dict[str, Any]) -> TreeNode:
+        """Convert a cached dictionary back to a node"""
+
+        return TreeNode(
+            node["field"],
+            {_hashable(value): self._from_dict(x) for value, x in node["branches"]},
+            None if node["other"] is None else self._from_dict(node["other"]),
+            node["budget"],
+            tuple(node["templates"]),
+        )
+
+    def candidates(self, get_value: Callable[[str], Any]) -> frozenset[int]:
+        """
+        Return the indexed series templates a data series could score above
+        min_match_score against, by walking the tree.
+
+        Parameters
+        ----------
+        get_value
+            Returns the value of a field of the data series, see
+            DataSeries.get_field.
+
+        Returns
+        -------
+            Keys of the candidate series templates.
+        """
+
+        found: set[int] = set()
+        # Keys of each field of the data series, looked up once
+        keys_field: dict[str, frozenset[Hashable] | None] = {}
+
+        def visit(node: TreeNode | None, mismatches: int) -> None:
+            if node is None or mismatches > node.budget:
+                return
+            if node.field is None:
+                found.update(
+                    x for x in node.templates if mismatches <= self._budgets[x]
+                )
+                return
+
+            if node.field not in keys_field:
+                keys: tuple[Hashable, ...] | None = attribute_keys(
+                    get_value(node.field)
+                )
+                keys_field[node.field] = None if keys is None else frozenset(keys)
+            keys_data: frozenset[Hashable] | None = keys_field[node.field]
+
+            for value, child in node.branches.items():
+                # Values that cannot be looked up are assumed to match
+                visit(
+                    child,
+                    mismatches + int(keys_data is not None and value not in keys_data),
+                )
+            visit(node.other, mismatches)
+
+        visit(self.root, 0)
+
+        return frozenset(self._keys[x] for x in found)
@@ -0,0 +1,495 @@
+# protocol_qc: An MRI DICOM protocol quality control tool
+# Copyright (C) 2025 The Florey Institute of Neuroscience and Mental Health
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Locations of the DICOM header fields that can be referenced in templates.
+"""
+
+import logging
+from typing import Any, Callable, Final, NamedTuple
+
+import pydicom
+from pydicom.datadict import tag_for_keyword
+from pydicom.tag import BaseTag, Tag
+
+# Private fields of classic DICOMs ('PRIVATE-<name>' in templates)
+PRIVATE_FIELDS_CLASSIC: Final[dict[str, tuple[int, int]]] = {
+    "NumberOfImagesInMosaic": (0x0019, 0x100A),
+    "BValue": (0x0019, 0x100C),
+    "GradientMode": (0x0019, 0x100F),
+    "Orientation": (0x0051, 0x100E),
+    "AcquisitionDuration": (0x0051, 0x100A),
+    "CoilElementsUsed": (0x0051, 0x100F),
+    "ParallelImagingAcceleration": (0x0051, 0x1011),
+}
+
+# Private fields of enhanced DICOMs ('PRIVATE-<name>' in templates)
+PRIVATE_FIELDS_ENHANCED: Final[dict[str, tuple[int, int]]] = {
+    "GradientMode": (0x0021, 0x1008),
+    "ParallelImagingAcceleration": (0x0021, 0x1009),
+    "InPlanePhaseEncDirection": (0x0021, 0x111C),
+    "CoilElementsUsed": (0x0021, 0x114F),
+    "AcquisitionDuration": (0x0051, 0x100A),
+}
+
+# Private field map of each supported SOPClassUID
+PRIVATE_FIELD_MAPS: Final[dict[str, dict[str, tuple[int, int]]]] = {
+    "MR Image Storage": PRIVATE_FIELDS_CLASSIC,
+    "Enhanced MR Image Storage": PRIVATE_FIELDS_ENHANCED,
+}
+
+# Fields of enhanced DICOMs that can be accessed via keyword
+ENHANCED_KEYWORD_FIELDS: Final[tuple[str, ...]] = (
+    "Rows",
+    "Columns",
+    "PulseSequenceName",
+    "VolumetricProperties",
+    "EchoPulseSequence",
+    "SeriesDescription",
+    "NumberOfFrames",
+    "ImageComments",
+    "ComplexImageComponent",
+    "ImageType",
+    "SOPClassUID",
+    "ContentLabel",
+)
+
+# Private fields of enhanced DICOMs at the data set level
+ENHANCED_DATASET_PRIVATE_FIELDS: Final[dict[str, tuple[int, int]]] = {
+    "GradientMode": (0x0021, 0x1008),
+    "ParallelImagingAcceleration": (0x0021, 0x1009),
+    "InPlanePhaseEncDirection": (0x0021, 0x111C),
+    "CoilElementsUsed": (0x0021, 0x114F),
+}
+
+# Fields of enhanced DICOMs read from the first PerFrameFunctionalGroupsSequence item
+PER_FRAME_FIELDS: Final[tuple[str, ...]] = (
+    "ImageTypeText",
+    "SliceThickness",
+    "EffectiveEchoTime",
+    "NumberOfAverages",
+)
+
+# Fields of enhanced DICOMs read from the SharedFunctionalGroupsSequence
+SHARED_FIELDS: Final[tuple[str, ...]] = (
+    "PercentPhaseFieldOfView",
+    "RepetitionTime",
+    "PixelBandwidth",
+    "FlipAngle",
+    "EchoTrainLength",
+    "MRAcquisitionPhaseEncodingSteps",
+    "MRAcquisitionFrequencyEncodingSteps",
+    "InversionTimes",
+)
+
+# (functional group sequence, sequence in the first item, keyword) of the fields
+# of enhanced DICOMs stored in functional groups
+FUNCTIONAL_GROUP_PATHS: Final[dict[str, tuple[str, str, str]]] = {
+    "SliceThickness": (
+        "PerFrameFunctionalGroupsSequence",
+        "PixelMeasuresSequence",
+        "SliceThickness",
+    ),
+    "EffectiveEchoTime": (
+        "PerFrameFunctionalGroupsSequence",
+        "MREchoSequence",
+        "EffectiveEchoTime",
+    ),
+    "NumberOfAverages": (
+        "PerFrameFunctionalGroupsSequence",
+        "MRAveragesSequence",
+        "NumberOfAverages",
+    ),
+    "PercentPhaseFieldOfView": (
+        "SharedFunctionalGroupsSequence",
+        "MRFOVGeometrySequence",
+        "PercentPhaseFieldOfView",
+    ),
+    "MRAcquisitionFrequencyEncodingSteps": (
+        "SharedFunctionalGroupsSequence",
+        "MRFOVGeometrySequence",
+        "MRAcquisitionFrequencyEncodingSteps",
+    ),
+    "MRAcquisitionPhaseEncodingSteps": (
+        "SharedFunctionalGroupsSequence",
+        "MRFOVGeometrySequence",
+        "MRAcquisitionPhaseEncodingStepsInPlane",
+    ),
+    "RepetitionTime": (
+        "SharedFunctionalGroupsSequence",
+        "MRTimingAndRelatedParametersSequence",
+        "RepetitionTime",
+    ),
+    "PixelBandwidth": (
+        "SharedFunctionalGroupsSequence",
+        "MRImagingModifierSequence",
+        "PixelBandwidth",
+    ),
+    "FlipAngle": (
+        "SharedFunctionalGroupsSequence",
+        "MRTimingAndRelatedParametersSequence",
+        "FlipAngle",
+    ),
+    "EchoTrainLength": (
+        "SharedFunctionalGroupsSequence",
+        "MRTimingAndRelatedParametersSequence",
+        "EchoTrainLength",
+    ),
+    "InversionTimes": (
+        "SharedFunctionalGroupsSequence",
+        "MRModifierSequence",
+        "InversionTimes",
+    ),
+}
+
+# Fields used outside of template comparisons (labels, sorting, dates, logging)
+BASE_FIELDS: Final[tuple[str, ...]] = (
+    "SpecificCharacterSet",
+    "SOPClassUID",
+    "PatientID",
+    "SeriesDate",
+    "SeriesInstanceUID",
+    "SeriesNumber",
+    "SeriesDescription",
+)
+
+TAG_PER_FRAME: Final[BaseTag] = Tag("PerFrameFunctionalGroupsSequence")
+TAG_SHARED: Final[BaseTag] = Tag("SharedFunctionalGroupsSequence")
+
+SeriesFacets = NamedTuple(
+    "SeriesFacets",
+    [
+        ("sop_class", str | None),
+        ("enhanced", bool),
+        ("private_fields", dict[str, tuple[int, int]] | None),
+    ],
+)
+
+
+def _private_tags(tag: tuple[int, int]) -> set[BaseTag]:
+    """
+    Return a private tag and the private creator tag reserving its block.
+    """
+
+    return {Tag(tag), Tag(tag[0], tag[1] >> 8)}
+
+
+def field_tags(field_name: str) -> set[BaseTag]:
+    """
+    Find the top level tags a template field is read from.
+
+    Parameters
+    ----------
+    field_name
+        Name of a template field, either a DICOM keyword or 'PRIVATE-<name>'.
+
+    Returns
+    -------
+        Set of tags. Empty if the field is unknown.
+    """
+
+    tags: set[BaseTag] = set()
+
+    if field_name.startswith("PRIVATE-"):
+        name: str = field_name.removeprefix("PRIVATE-")
+        for private_fields in (PRIVATE_FIELDS_CLASSIC, PRIVATE_FIELDS_ENHANCED):
+            if name in private_fields:
+                tags |= _private_tags(private_fields[name])
+        return tags
+
+    if (tag := tag_for_keyword(field_name)) is not None:
+        tags.add(Tag(tag))
+    if field_name in ENHANCED_DATASET_PRIVATE_FIELDS:
+        tags |= _private_tags(ENHANCED_DATASET_PRIVATE_FIELDS[field_name])
+    if field_name in PER_FRAME_FIELDS:
+        tags.add(TAG_PER_FRAME)
+    if field_name in SHARED_FIELDS:
+        tags.add(TAG_SHARED)
+
+    return tags
+
+
+def header_tags(tags: set[BaseTag]) -> list[BaseTag]:
+    """
+    Return the tags to be parsed from a representative header, the requested
+    tags and the BASE_FIELDS, in ascending order.
+
+    Parameters
+    ----------
+    tags
+        Tags referenced by the templates.
+
+    Returns
+    -------
+        Sorted list of tags.
+    """
+
+    return sorted(tags | {Tag(x) for x in BASE_FIELDS})
+
+
+def compact_dataset(
+    data: pydicom.dataset.Dataset, tags: set[BaseTag]
+) -> pydicom.dataset.Dataset:
+    """
+    Copy only the requested top level elements, and the BASE_FIELDS, of a
+    header into a new dataset. Only the first item of the
+    PerFrameFunctionalGroupsSequence is kept, as no other item is read.
+
+    Parameters
+    ----------
+    data
+        Full header of a representative DICOM file.
+    tags
+        Tags to be kept.
+
+    Returns
+    -------
+        Compact dataset.
+    """
+
+    compact = pydicom.dataset.Dataset()
+    for tag in header_tags(tags):
+        if tag not in data:
+            continue
+        element: pydicom.dataelem.DataElement = data[tag]
+        if tag == TAG_PER_FRAME and len(element.value) > 1:
+            element = pydicom.dataelem.DataElement(
+                tag, element.VR, pydicom.sequence.Sequence([element.value[0]])
+            )
+        compact.add(element)
+
+    return compact
+
+
+def series_facets(data: pydicom.dataset.Dataset) -> SeriesFacets:
+    """
+    Compute the properties of a DICOM series that select how its fields are
+    extracted.
+
+    Parameters
+    ----------
+    data
+        Dataset object from a DICOM series.
+
+    Returns
+    -------
+        SeriesFacets of the series.
+    """
+
+    sop_class: str | None = None
+    if "SOPClassUID" in data:
+        sop_class = data["SOPClassUID"].repval
+
+    return SeriesFacets(
+        sop_class,
+        sop_class == "Enhanced MR Image Storage",
+        PRIVATE_FIELD_MAPS.get(sop_class) if sop_class else None,
+    )
+
+
+def get_non_keyword_field(
+    field_name: str,
+    data: pydicom.dataset.Dataset,
+    logger: logging.Logger,
+    facets: SeriesFacets | None = None,
+) -> Any:
+    """
+    Function to retrieve values of DICOM header fields that are not simple
+    keyword look-ups in classic DICOM series. This includes classic DICOM
+    series produced on XA systems.
+    For example, data.SeriesNumber is a simple keyword
+    lookup, whereas extracting the number of slices from a MOSAIC DICOM
+    series requires investigating a private tag. This function retrieves
+    DICOM header field information based on a mapping between the specified
+    'field_name' and a specific DICOM tag. The mapping is selected by the
+    SOPClassUID of the series, see PRIVATE_FIELD_MAPS.
+
+    Currently available non_keyword maps on Siemen's VE software platform:
+        - 'NumberOfImagesInMosaic' = 0x0019,0x100a
+        - 'GradientMode' = 0x0019,0x100f
+        - 'Orientation' = 0x0051,0x100e
+        - 'AcquisitionDuration' = 0x0051,0x100a
+        - 'CoilElementsUsed' = 0x0051,0x100f
+        - 'ParallelImagingAcceleration' = 0x0051,0x1101
+    Currently available non_keyword maps on Siemen's XA software platform:
+        - 'GradientMode' = 0x0021,0x1008
+        - 'ParallelImagingAcceleration' = 0x0021,0x1009
+        - 'InPlanePhaseEncDirection' = 0x0021,0x111c
+        - 'CoilElementsUsed' = 0x0021,0x114f
+        - 'AcquisitionDuration' = 0x0051,0x100a
+
+    Parameters
+    ----------
+    field_name
+        Name of private DICOM header field.
+    data
+        Dataset object from a DICOM series.
+    logger
+        Logger for unsupported SOPClassUIDs.
+    facets
+        Precomputed SeriesFacets of the series. Computed if not provided.
+    Returns
+    -------
+        Value of non-keyword field.
+    """
+
+    if facets is None:
+        facets = series_facets(data)
+
+    if facets.private_fields is None:
+        # Log error if unknown software version
+        logger.error(
+            f"Private fields for SOPClassUID {facets.sop_class} not configured"
+        )
+        return None
+
+    if not field_name.startswith("PRIVATE-"):
+        return None
+
+    tag: tuple[int, int] | None = facets.private_fields.get(
+        field_name.removeprefix("PRIVATE-")
+    )
+    if tag is None or tag not in data:
+        return None
+
+    return data[tag].value
+
+
+def _keyword_field(field_name: str, data: pydicom.dataset.Dataset) -> Any:
+    """Enhanced field accessed via keyword"""
+
+    return getattr(data, field_name, None)
+
+
+def _dataset_private_field(field_name: str, data: pydicom.dataset.Dataset) -> Any:
+    """Enhanced private field at the data set level"""
+
+    tag: tuple[int, int] = ENHANCED_DATASET_PRIVATE_FIELDS[field_name]
+    if tag not in data:
+        return None
+
+    return data[tag].value
+
+
+def _image_type_text(_field_name: str, data: pydicom.dataset.Dataset) -> Any:
+    """Private ImageTypeText of the first PerFrameFunctionalGroupsSequence item"""
+
+    seq_per_frame_groups: pydicom.dataset.Dataset = data[TAG_PER_FRAME][0]
+    # Account for data that has been resent with modified DICOM header fields
+    try:
+        return seq_per_frame_groups[0x0021, 0x11FE][0][0x0021, 0x1175].value
+    except KeyError:
+        return seq_per_frame_groups[0x0021, 0x10FE][0][0x0021, 0x1075].value
+
+
+def _functional_group_field(field_name: str, data: pydicom.dataset.Dataset) -> Any:
+    """Enhanced field within a functional group sequence, see FUNCTIONAL_GROUP_PATHS"""
+
+    group, sequence, keyword = FUNCTIONAL_GROUP_PATHS[field_name]
+
+    return data[group][0][sequence][0][keyword].value
+
+
+def _slice_thickness(field_name: str, data: pydicom.dataset.Dataset) -> Any:
+    """SliceThickness of the first PerFrameFunctionalGroupsSequence item"""
+
+    return float(_functional_group_field(field_name, data))
+
+
+# Reads a field from a data set, given the field name
+Extractor = Callable[[str, pydicom.dataset.Dataset], Any]
+
+# Extractor of each field of enhanced DICOMs
+ENHANCED_EXTRACTORS: Final[dict[str, Extractor]] = {
+    **{x: _keyword_field for x in ENHANCED_KEYWORD_FIELDS},
+    **{x: _dataset_private_field for x in ENHANCED_DATASET_PRIVATE_FIELDS},
+    **{x: _functional_group_field for x in FUNCTIONAL_GROUP_PATHS},
+    "ImageTypeText": _image_type_text,
+    "SliceThickness": _slice_thickness,
+}
+
+
+def get_enhanced_field(field_name: str, data: pydicom.dataset.Dataset) -> Any | None:
+    """
+    Retrieve DICOM header fields from enhanced DICOMS, using the extractor of
+    the field in ENHANCED_EXTRACTORS.
+
+    Parameters
+    ----------
+    field_name
+        Name of private DICOM header field.
+    data
+        Dataset object from a DICOM series.
+    Returns
+    -------
+        Value of non-keyword field.
+
+    Raises
+    ------
+    KeyError
+        If a sequence containing the field is missing.
+    """
+
+    if (extractor := ENHANCED_EXTRACTORS.get(field_name)) is None:
+        return None
+
+    return extractor(field_name, data)
+
+
+def extract_field(
+    field_name: str,
+    data: pydicom.dataset.Dataset,
+    logger: logging.Logger,
+    facets: SeriesFacets | None = None,
+) -> Any:
+    """
+    Extract the value of a template field from a DICOM header. Private fields
+    and the fields of enhanced DICOMs are read from their mapped locations, and
+    MultiValue values are converted to lists.
+
+    Parameters
+    ----------
+    field_name
+        Name of a template field, either a DICOM keyword or 'PRIVATE-<name>'.
+    data
+        Dataset object from a DICOM series.
+    logger
+        Logger for fields that could not be read.
+    facets
+        Precomputed SeriesFacets of the series. Computed if not provided.
+
+    Returns
+    -------
+        Value of the field, or None if it is missing.
+    """
+
+    if facets is None:
+        facets = series_facets(data)
+
+    attribute: Any = None
+    if facets.enhanced:
+        try:
+            attribute = get_enhanced_field(field_name, data)
+        except KeyError:
+            logger.warning(f"Field {field_name} not found.")
+    elif "PRIVATE" in field_name:
+        attribute = get_non_keyword_field(field_name, data, logger, facets)
+    else:
+        attribute = getattr(data, field_name, None)
+
+    if isinstance(attribute, pydicom.multival.MultiValue):
+        return list(attribute)
+
+    return attribute
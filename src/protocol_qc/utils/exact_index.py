@@ -0,0 +1,178 @@
+# protocol_qc: An MRI DICOM protocol quality control tool
+# Copyright (C) 2025 The Florey Institute of Neuroscience and Mental Health
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Inverted index of the exact comparison fields of series templates.
+"""
+
+from collections import Counter
+from decimal import Decimal
+from typing import Any, Callable, Final, Hashable, Iterable
+
+import pydicom
+
+# Values hashed as they are, as their hash is consistent with their equality
+_PLAIN_TYPES: Final[tuple[type, ...]] = (str, int, float, bool)
+
+
+def template_key(value: Any) -> Hashable | None:
+    """
+    Return the key of the value of an exact comparison in a template.
+
+    Parameters
+    ----------
+    value
+        Value from a template.
+
+    Returns
+    -------
+        Key, or None if the value cannot be indexed.
+    """
+
+    if type(value) in _PLAIN_TYPES:
+        return value
+    if isinstance(value, list) and all(type(x) in _PLAIN_TYPES for x in value):
+        return tuple(value)
+
+    return None
+
+
+def attribute_keys(attribute: Any) -> tuple[Hashable, ...] | None:
+    """
+    Return the keys under which template values equal to a DICOM header value
+    are indexed. DS, IS and PN values also equal their string representation.
+
+    Parameters
+    ----------
+    attribute
+        Value extracted from a DICOM header.
+
+    Returns
+    -------
+        Keys, or None if the value cannot be looked up.
+    """
+
+    # A missing compulsory field never matches
+    if attribute is None:
+        return ()
+    # Plain values, and lists of them, are keyed as in the templates
+    if (key := template_key(attribute)) is not None:
+        return (key,)
+    if isinstance(attribute, pydicom.valuerep.PersonName):
+        return (str(attribute),)
+    for base in (float, int, Decimal):
+        if isinstance(attribute, base):
+            return (base(attribute), str(attribute))
+
+    return None
+
+
+def indexed_fields(fields: dict[str, dict[str, Any]]) -> dict[str, Hashable]:
+    """
+    Return the compulsory exact comparison fields of a series template that can
+    be indexed.
+
+    Parameters
+    ----------
+    fields
+        Fields of a series template.
+
+    Returns
+    -------
+        Key of the template value, keyed by field name.
+    """
+
+    indexed: dict[str, Hashable] = {}
+    for field_name, details in fields.items():
+        if (
+            isinstance(details, dict)
+            and details.get("comparison") == "exact"
+            and details.get("compulsory", True)
+            and (value := template_key(details.get("value"))) is not None
+        ):
+            indexed[field_name] = value
+
+    return indexed
+
+
+class ExactFieldIndex:
+    """
+    Inverted index of the compulsory exact comparison fields of series
+    templates. Looking up the values of a data series gives the series
+    templates it could still score above their min_match_score against, so
+    only those need to be compared.
+
+    Parameters
+    ----------
+    templates
+        (key, fields, min_match_score) of each series template.
+    """
+
+    def __init__(
+        self, templates: Iterable[tuple[int, dict[str, dict[str, Any]], float]]
+    ) -> None:
+        # Keys of the series templates keyed by field, then by value
+        self._postings: dict[str, dict[Hashable, list[int]]] = {}
+        # Keys of the series templates indexed by each field
+        self._indexed: dict[str, list[int]] = {}
+        # (number of fields, number of indexed fields, min_match_score)
+        self._limits: dict[int, tuple[int, int, float]] = {}
+
+        for key, fields, min_match_score in templates:
+            indexed: dict[str, Hashable] = indexed_fields(fields)
+            for field_name, value in indexed.items():
+                postings: dict[Hashable, list[int]] = self._postings.setdefault(
+                    field_name, {}
+                )
+                postings.setdefault(value, []).append(key)
+                self._indexed.setdefault(field_name, []).append(key)
+            if indexed:
+                self._limits[key] = (len(fields), len(indexed), min_match_score)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self._limits
+
+    def candidates(self, get_value: Callable[[str], Any]) -> frozenset[int]:
+        """
+        Return the indexed series templates a data series could score above
+        min_match_score against.
+
+        Parameters
+        ----------
+        get_value
+            Returns the value of a field of the data series, see
+            DataSeries.get_field.
+
+        Returns
+        -------
+            Keys of the candidate series templates.
+        """
+
+        matched: Counter[int] = Counter()
+        for field_name, postings in self._postings.items():
+            keys: tuple[Hashable, ...] | None = attribute_keys(get_value(field_name))
+            if keys is None:
+                # Cannot be looked up, so assume a match
+                matched.update(self._indexed[field_name])
+                continue
+            for value in set(keys):
+                matched.update(postings.get(value, ()))
+
+        return frozenset(
+            key
+            for key, (num_fields, num_indexed, min_match_score) in self._limits.items()
+            if matched[key] == num_indexed
+            or (num_fields - num_indexed + matched[key]) / num_fields > min_match_score
+        )
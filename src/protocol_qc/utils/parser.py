@@ -25,6 +25,35 @@ from rich_argparse import RawDescriptionRichHelpFormatter
 from protocol_qc._version import __version__
 
 
+def positive_int(value: str) -> int:
+    """
+    Convert a command line argument to an integer of at least 1.
+
+    Parameters
+    ----------
+    value
+        Command line argument.
+
+    Returns
+    -------
+        Integer value.
+
+    Raises
+    ------
+    argparse.ArgumentTypeError
+        If the value is not an integer of at least 1.
+    """
+
+    try:
+        number: int = int(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{value}'") from exc
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1: {number}")
+
+    return number
+
+
 def parse_args(args: list[str] | None = None) -> argparse.Namespace:
     """
     Parse command line arguments.
@@ -65,7 +94,9 @@ def parse_args(args: list[str] | None = None) -> argparse.Namespace:
     parser.add_argument(
         "acquisitions",
         help="A path to the root directory containing the DICOM series which are to "
-        "be compared against the protocol templates.",
+        "be compared against the protocol templates. A zip or tar (.tar, .tar.gz, "
+        ".tgz, ...) archive of the directory can also be given and is read without "
+        "extraction.",
         type=Path,
     )
 
@@ -80,10 +111,68 @@ def parse_args(args: list[str] | None = None) -> argparse.Namespace:
         type=float,
         default=0.8,
     )
+    args_opt.add_argument(
+        "--prune_scores",
+        help="Stop comparing the header fields of a series as soon as its match "
+        "score can no longer exceed --min_match_score. The match results are "
+        "unchanged, but the debug logs do not list every mismatched field of such "
+        "series. (default: False)",
+        action="store_true",
+    )
+    args_opt.add_argument(
+        "--field_stats",
+        help="Path to a JSON file of statistics of previous header field "
+        "comparisons. The fields that most often reject a series at the lowest cost "
+        "are compared first, which is most effective with --prune_scores. The file "
+        "is created if it does not exist and updated at the end of each run. "
+        "(default: None)",
+        type=Path,
+        default=None,
+    )
+    args_opt.add_argument(
+        "--index_exact_fields",
+        help="Index the series templates by the values of their compulsory 'exact' "
+        "comparison fields, and only compare a series to the series templates it "
+        "can score above --min_match_score against. Useful with many protocol "
+        "templates. The match results are unchanged. (default: False)",
+        action="store_true",
+    )
+    args_opt.add_argument(
+        "--template_tree",
+        help="Directory in which to cache a discrimination tree compiled from the "
+        "'exact' comparison fields of all protocol templates. Each series is "
+        "classified by walking the tree and only compared to the series templates "
+        "it reaches. Replaces --index_exact_fields, and the match results are "
+        "unchanged. The tree is rebuilt when the templates change, and the 8 most "
+        "recently used trees are kept. Delete the directory to clear the cache. "
+        "(default: None)",
+        type=Path,
+        default=None,
+    )
+    args_opt.add_argument(
+        "--template_workers",
+        help="Number of worker processes comparing the series against the protocol "
+        "templates. Each worker is given the series once. The results and logs are "
+        "identical to using a single process without --memo_scores. (default: 1)",
+        type=positive_int,
+        default=1,
+    )
+    args_opt.add_argument(
+        "--memo_scores",
+        help="Reuse the match score of a series for the following series with the "
+        "same values for every header field of a series template, e.g. repeated "
+        "runs. The match results are unchanged, but the debug logs and "
+        "--field_stats only cover the first of these series. Ignored when "
+        "--template_workers is greater than 1, as the reused scores would depend "
+        "on the scheduling of the workers. (default: False)",
+        action="store_true",
+    )
     args_opt.add_argument(
         "--find_first",
         help="If providing multiple protocol templates, stop when a perfect protocol "
-        "match is found. (default: False)",
+        "match is found. The templates are then built and matched one at a time, "
+        "so identical series templates are not shared between them. "
+        "(default: False)",
         action="store_true",
     )
     args_opt.add_argument(
@@ -114,6 +203,73 @@ def parse_args(args: list[str] | None = None) -> argparse.Namespace:
         default="highest",
     )
 
+    # Ingestion
+    args_ingest = parser.add_argument_group("ingestion")
+    args_ingest.add_argument(
+        "--ingest_workers",
+        help="Number of concurrent workers used to read the DICOM headers. The "
+        "result is identical to reading with a single worker. (default: 1)",
+        type=positive_int,
+        default=1,
+    )
+    args_ingest.add_argument(
+        "--ingest_executor",
+        help="Use threads or processes for the ingestion workers. Only applies "
+        "when --ingest_workers is greater than 1. (default: thread)",
+        type=str,
+        choices=["thread", "process"],
+        default="thread",
+    )
+    args_ingest.add_argument(
+        "--include",
+        help="Glob pattern of files to read, matched against the file name and the "
+        "path relative to the acquisitions directory (e.g. '*.dcm'). Can be given "
+        "multiple times. If provided, all other files are skipped. (default: None)",
+        type=str,
+        action="append",
+        default=None,
+    )
+    args_ingest.add_argument(
+        "--exclude",
+        help="Glob pattern of files or directories to skip, matched against the "
+        "name and the path relative to the acquisitions directory (e.g. "
+        "'derivatives'). Can be given multiple times. Files with common non-DICOM "
+        "extensions (.nii, .json, .png, ...) are always skipped unless matched by "
+        "--include. (default: None)",
+        type=str,
+        action="append",
+        default=None,
+    )
+    args_ingest.add_argument(
+        "--allow_no_preamble",
+        help="Also read files that lack the 128 byte preamble and 'DICM' prefix, "
+        "as written by some older systems. Such files are only included if they "
+        "contain a SeriesInstanceUID. (default: False)",
+        action="store_true",
+    )
+    args_ingest.add_argument(
+        "--ignore_dicomdir",
+        help="By default, if the acquisitions directory contains a DICOMDIR, the "
+        "series are taken from its records and only one file per series is read. "
+        "Set this flag to read every file instead. (default: False)",
+        action="store_true",
+    )
+    args_ingest.add_argument(
+        "--verify_dicomdir",
+        help="Check that every file listed in a DICOMDIR exists. Missing files are "
+        "reported and not counted. (default: False)",
+        action="store_true",
+    )
+    args_ingest.add_argument(
+        "--series_index",
+        help="Path to a SQLite file used to index the scanned DICOM files. On "
+        "repeated runs over the same directory only files that were added or "
+        "modified since the previous run are read. The file is created if it does "
+        "not exist. (default: None)",
+        type=Path,
+        default=None,
+    )
+
     # General
     args_info = parser.add_argument_group("information arguments")
     args_info.add_argument(
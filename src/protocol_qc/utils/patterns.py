@@ -0,0 +1,196 @@
+# protocol_qc: An MRI DICOM protocol quality control tool
+# Copyright (C) 2025 The Florey Institute of Neuroscience and Mental Health
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+Registry of the regular expressions used in templates, and an index of the
+SeriesDescription patterns of series templates.
+"""
+
+import re
+from typing import Iterable
+
+# Compiled patterns keyed by pattern string. Unlike the re module cache, the
+# registry is never purged, so each pattern is compiled once per process.
+_PATTERNS: dict[str, re.Pattern[str]] = {}
+
+
+def compile_pattern(pattern: str, context: str) -> re.Pattern[str]:
+    """
+    Return the compiled regular expression for a template pattern, compiling it
+    on first use.
+
+    Parameters
+    ----------
+    pattern
+        Regular expression from a template.
+    context
+        Where the pattern is defined, used when reporting errors.
+
+    Returns
+    -------
+        Compiled pattern.
+
+    Raises
+    ------
+    re.error
+        If the pattern is not a valid regular expression.
+    """
+
+    if (compiled := _PATTERNS.get(pattern)) is not None:
+        return compiled
+
+    try:
+        compiled = re.compile(pattern)
+    except re.error as exc:
+        raise re.error(
+            f'Malformed regular expression "{pattern}" in {context}: {exc.msg}',
+            pattern,
+            exc.pos,
+        ) from exc
+
+    _PATTERNS[pattern] = compiled
+
+    return compiled
+
+
+# Characters with a special meaning in regular expressions
+_METACHARACTERS: frozenset[str] = frozenset("\\.^$*+?{}[]|()")
+
+# Backreferences change meaning once patterns are combined into one alternation
+_BACKREFERENCE: re.Pattern[str] = re.compile(r"\\\d|\(\?P=")
+
+
+def literal_prefix(pattern: str) -> str:
+    """
+    Return the literal text any string matched by an anchored pattern starts
+    with.
+
+    Parameters
+    ----------
+    pattern
+        Regular expression from a template.
+
+    Returns
+    -------
+        Literal prefix, or an empty string if the pattern is not anchored with
+        '^' or contains an alternation.
+    """
+
+    if not pattern.startswith("^") or "|" in pattern:
+        return ""
+
+    prefix: list[str] = []
+    for char in pattern[1:]:
+        if char in _METACHARACTERS:
+            # The preceding character is optional
+            if char in "*?{":
+                prefix = prefix[:-1]
+            break
+        prefix.append(char)
+
+    return "".join(prefix)
+
+
+class DescriptionIndex:
+    """
+    Index of the SeriesDescription patterns of series templates. The series
+    templates a SeriesDescription is a candidate for are found in one pass:
+    anchored patterns are bucketed by the first character of their literal
+    prefix and only searched if the prefix matches, and the remaining patterns
+    are first checked together as a single alternation. Each distinct pattern
+    is searched at most once per distinct SeriesDescription.
+
+    Parameters
+    ----------
+    patterns
+        (key, pattern) of each series template. An empty pattern matches every
+        SeriesDescription.
+    """
+
+    def __init__(self, patterns: Iterable[tuple[int, str]]) -> None:
+        # Keys of the series templates sharing each pattern
+        self._keys_pattern: dict[str, list[int]] = {}
+        for key, pattern in patterns:
+            self._keys_pattern.setdefault(pattern, []).append(key)
+        self.keys: frozenset[int] = frozenset(
+            key for keys in self._keys_pattern.values() for key in keys
+        )
+
+        self._always: frozenset[int] = frozenset(self._keys_pattern.pop("", []))
+
+        # (literal prefix, pattern) keyed by the first character of the prefix
+        self._buckets: dict[str, list[tuple[str, str]]] = {}
+        unanchored: list[str] = []
+        for pattern in self._keys_pattern:
+            if prefix := literal_prefix(pattern):
+                self._buckets.setdefault(prefix[0], []).append((prefix, pattern))
+            else:
+                unanchored.append(pattern)
+        self._unanchored: tuple[str, ...] = tuple(unanchored)
+
+        self._combined: re.Pattern[str] | None = None
+        if unanchored and not any(_BACKREFERENCE.search(x) for x in unanchored):
+            try:
+                self._combined = re.compile("|".join(f"(?:{x})" for x in unanchored))
+            except re.error:
+                pass
+
+        self._candidates: dict[str, frozenset[int]] = {}
+
+    def __contains__(self, key: int) -> bool:
+        return key in self.keys
+
+    def candidates(self, description: str | None) -> frozenset[int]:
+        """
+        Return the keys of the series templates whose pattern is found in a
+        SeriesDescription.
+
+        Parameters
+        ----------
+        description
+            SeriesDescription of a data series. Every series template is a
+            candidate if it is empty or missing.
+
+        Returns
+        -------
+            Keys of the candidate series templates.
+        """
+
+        if not description:
+            return self.keys
+        if (candidates := self._candidates.get(description)) is not None:
+            return candidates
+
+        matched: list[str] = [
+            pattern
+            for prefix, pattern in self._buckets.get(description[0], ())
+            if description.startswith(prefix)
+            and compile_pattern(pattern, "SeriesDescription").search(description)
+        ]
+        if self._unanchored and (
+            self._combined is None or self._combined.search(description)
+        ):
+            matched += [
+                pattern
+                for pattern in self._unanchored
+                if compile_pattern(pattern, "SeriesDescription").search(description)
+            ]
+
+        candidates = self._always.union(
+            *(self._keys_pattern[pattern] for pattern in matched)
+        )
+        self._candidates[description] = candidates
+
+        return candidates
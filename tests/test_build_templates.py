@@ -5,6 +5,8 @@ Tests for build_templates.py
 import json
 import logging
 
+from pydicom.tag import Tag
+
 from protocol_qc import build_templates
 
 logger = logging.getLogger()
@@ -128,3 +130,30 @@ def test_build_templates(config_file_t1):
     assert temp_prot.duplicates_unexpected is False
     assert temp_prot.duplicates_expected is False
     assert temp_prot.has_issue is False
+
+
+def test_get_required_tags(config_t1):
+    """Test the tags referenced by fields and custom tags are found"""
+
+    config_t1["GENERAL"] = {
+        "fields": {"PRIVATE-GradientMode": {"value": "F", "comparison": "exact"}},
+        "tags": {
+            "site": {"type": "fill_with", "tag": "InstitutionName"},
+            "scanner": {
+                "type": "dict",
+                "tag": {"prisma": {"field": "ManufacturerModelName"}},
+            },
+        },
+    }
+    config_t1["T1w"]["fields"]["SliceThickness"] = {"value": 1, "comparison": "exact"}
+
+    tags = build_templates.get_required_tags([("config_t1.json", config_t1)])
+
+    assert {Tag("SeriesDescription"), Tag("SAR"), Tag("ImageType")} <= tags
+    assert {Tag("InstitutionName"), Tag("ManufacturerModelName")} <= tags
+    # Classic and enhanced locations, with their private creators
+    assert {Tag(0x0019, 0x100F), Tag(0x0019, 0x0010)} <= tags
+    assert {Tag(0x0021, 0x1008), Tag(0x0021, 0x0010)} <= tags
+    # Enhanced DICOMs read SliceThickness from the per-frame sequence
+    assert Tag("PerFrameFunctionalGroupsSequence") in tags
+    assert Tag("PatientName") not in tags
@@ -3,12 +3,20 @@ Tests for classes.
 """
 
 import logging
+import re
+from pathlib import Path
 
 import pydicom
 import pytest
 
+from protocol_qc import build_templates, read_dicoms
+from protocol_qc.classes import dataseries as dataseries_module
 from protocol_qc.classes.dataseries import DataSeries
+from protocol_qc.classes.series import TemplateSeries
+from protocol_qc.field_stats import FieldStats
 from protocol_qc.match_statuses import MatchStatus
+from protocol_qc.utils.exact_index import ExactFieldIndex
+from protocol_qc.utils.patterns import DescriptionIndex
 
 logger = logging.getLogger()
 
@@ -70,6 +78,245 @@ def test_template_series_methods(dicom_dir, t1_protocol):
     )
 
 
+def test_compile_fields():
+    """Test template fields are validated and compiled before comparing"""
+
+    template_series = TemplateSeries(
+        "T1w:mag",
+        logger,
+        None,
+        0.9,
+        fields={
+            "SeriesDescription": {"value": "^T1w", "comparison": "regex"},
+            "ImageType": {"value": ["ORIG", "PRIM"], "comparison": "regex"},
+            "SliceThickness": {"value": [0.9, 1.1], "comparison": "in_range"},
+            "Manufacturer": {"value": ["SIEMENS", "GE"], "comparison": "in_set"},
+            "RepetitionTime": {"value": ["2300"], "comparison": "in_set"},
+            "EchoTime": {"comparison": "absent", "compulsory": False},
+        },
+    )
+    template_series.compile_fields()
+
+    data = pydicom.dataset.Dataset()
+    data.SOPClassUID = "1.2.840.10008.5.1.4.1.1.4"
+    data.SeriesDescription = "T1w_Sag"
+    data.ImageType = ["ORIGINAL", "PRIMARY", "M"]
+    data.SliceThickness = "1.0"
+    data.Manufacturer = "SIEMENS"
+    # Decimal strings compare equal to their string values
+    data.RepetitionTime = "2300"
+
+    assert template_series.compare_header_fields(data) == 1.0
+
+    data.Manufacturer = "Philips"
+    data.EchoTime = 3
+    assert template_series.compare_header_fields(data) == pytest.approx(4 / 6)
+
+
+def test_score_header_fields_pruned():
+    """Test comparison stops once min_match_score can no longer be exceeded"""
+
+    fields = {
+        "Manufacturer": {"value": "SIEMENS", "comparison": "exact"},
+        "SliceThickness": {"value": 1.0, "comparison": "exact"},
+        "EchoTime": {"value": 3, "comparison": "exact"},
+        "SeriesDescription": {"value": "^T1w", "comparison": "regex"},
+    }
+    data = pydicom.dataset.Dataset()
+    data.SOPClassUID = "1.2.840.10008.5.1.4.1.1.4"
+    data.Manufacturer = "Philips"
+    data.SliceThickness = 1.0
+    data.EchoTime = 3
+    data.SeriesDescription = "T1w_Sag"
+
+    template_series = TemplateSeries("T1w:mag", logger, None, 0.7, fields=fields)
+    assert template_series.score_header_fields(data) == (0.75, False)
+
+    template_series = TemplateSeries(
+        "T1w:mag", logger, None, 0.8, fields=fields, prune_scores=True
+    )
+    extracted: dict = {}
+    assert template_series.score_header_fields(data, extracted) == (0.75, True)
+    assert list(extracted) == ["Manufacturer"]
+
+    # Perfect matches are never pruned
+    template_series = TemplateSeries(
+        "T1w:mag", logger, None, 1.0, fields=fields, prune_scores=True
+    )
+    assert template_series.score_header_fields(data) == (0.75, True)
+    data.Manufacturer = "SIEMENS"
+    assert template_series.score_header_fields(data) == (1.0, False)
+
+
+def test_canonical_hash():
+    """Test identical series definitions share a hash regardless of name"""
+
+    fields = {
+        "EchoTime": {"value": 3, "comparison": "exact"},
+        "FlipAngle": {"comparison": "absent", "compulsory": False},
+    }
+    template_series = TemplateSeries("T1w:mag", logger, 192, 0.9, fields=fields)
+    same = TemplateSeries(
+        "MPRAGE:mag",
+        logger,
+        192,
+        0.9,
+        fields={
+            "FlipAngle": {"comparison": "absent", "compulsory": False, "value": 9},
+            "EchoTime": {"value": 3, "comparison": "exact", "compulsory": True},
+        },
+    )
+    other = TemplateSeries("T1w:mag", logger, 176, 0.9, fields=fields)
+
+    assert template_series.canonical_hash() == same.canonical_hash()
+    assert template_series.canonical_hash() != other.canonical_hash()
+
+
+def test_memo_scores(mocker):
+    """Test data series with the same field values are scored once"""
+
+    template_series = TemplateSeries(
+        "fMRI:mag",
+        logger,
+        None,
+        0.9,
+        fields={
+            "EchoTime": {"value": 30, "comparison": "exact"},
+            "SliceThickness": {"value": "2.0", "comparison": "exact"},
+        },
+        memo_scores=True,
+    )
+
+    all_series = []
+    for number, thickness in enumerate(["2.0", "2.0", "2.00"], start=1):
+        data = pydicom.dataset.Dataset()
+        data.SOPClassUID = "1.2.840.10008.5.1.4.1.1.4"
+        data.SeriesNumber = number
+        data.SeriesDescription = "fMRI"
+        data.EchoTime = 30
+        data.SliceThickness = thickness
+        all_series.append(DataSeries(data, 1, Path(f"{number}.dcm")))
+
+    spy_score = mocker.spy(TemplateSeries, "score_header_fields")
+    for series in all_series:
+        template_series.compare_with_data_series(series)
+
+    # "2.00" differs from the template value as a string
+    assert spy_score.call_count == 2
+    assert [x.unique_label for x in template_series.series_matches] == [
+        "1:fMRI",
+        "2:fMRI",
+        "3:fMRI",
+    ]
+    assert [x.score for x in template_series.series_matches] == [1.0, 1.0, 0.5]
+
+
+def test_extraction_warnings_shared(caplog):
+    """Test every logger reading a field logs the warnings of its extraction"""
+
+    data = pydicom.dataset.Dataset()
+    data.SOPClassUID = "1.2.3"
+    data.SeriesNumber = 1
+    data.SeriesDescription = "fMRI"
+    data.EchoTime = 30
+    series = DataSeries(data, 1, Path("1.dcm"))
+    fields = {
+        "PRIVATE-GradientMode": {"value": "Normal", "comparison": "exact"},
+        "EchoTime": {"value": 30, "comparison": "exact"},
+    }
+
+    # An index reads the field first, with the main logger
+    series.get_field("PRIVATE-GradientMode", logging.getLogger("test_extract_main"))
+    for name in ("test_extract_first", "test_extract_second"):
+        template_series = TemplateSeries(
+            "fMRI:mag", logging.getLogger(name), None, 0.9, fields=fields
+        )
+        template_series.compare_with_data_series(series)
+
+    message = "Private fields for SOPClassUID 1.2.3 not configured"
+    for name in ("test_extract_main", "test_extract_first", "test_extract_second"):
+        assert [x.getMessage() for x in caplog.records if x.name == name] == [message]
+
+
+def test_compile_fields_ordered(tmp_path):
+    """Test fields are compared in order of expected cost of a mismatch"""
+
+    stats = FieldStats(tmp_path / "field_stats.json")
+    for _ in range(10):
+        stats.record("EchoTime", False)
+        stats.record("Manufacturer", True)
+
+    template_series = TemplateSeries(
+        "T1w:mag",
+        logger,
+        None,
+        0.9,
+        fields={
+            "SeriesDescription": {"value": "^T1w", "comparison": "regex"},
+            "Manufacturer": {"value": "SIEMENS", "comparison": "exact"},
+            "EchoTime": {"value": 3, "comparison": "exact"},
+        },
+        field_stats=stats,
+    )
+    template_series.compile_fields()
+
+    assert [x.name for x in template_series.compiled_fields] == [
+        "EchoTime",
+        "SeriesDescription",
+        "Manufacturer",
+    ]
+
+    data = pydicom.dataset.Dataset()
+    data.SOPClassUID = "1.2.840.10008.5.1.4.1.1.4"
+    data.SeriesDescription = "T1w_Sag"
+    data.Manufacturer = "SIEMENS"
+    data.EchoTime = 3
+    assert template_series.compare_header_fields(data) == 1.0
+    assert stats.counts["EchoTime"] == [11, 10]
+    assert stats.counts["SeriesDescription"] == [1, 0]
+
+
+@pytest.mark.parametrize(
+    "details, error",
+    [
+        ({"value": "T1w"}, KeyError),
+        ({"comparison": "absent"}, KeyError),
+        ({"comparison": "exact"}, KeyError),
+        ({"value": "T1w", "comparison": "close"}, KeyError),
+        ({"value": "(T1w", "comparison": "regex"}, re.error),
+        ({"value": [1], "comparison": "in_range"}, TypeError),
+        ({"value": 1, "comparison": "in_set"}, TypeError),
+    ],
+)
+def test_compile_fields_malformed(details, error):
+    """Test malformed template fields are rejected when compiled"""
+
+    template_series = TemplateSeries(
+        "T1w:mag", logger, None, 0.9, fields={"SeriesDescription": details}
+    )
+
+    with pytest.raises(error):
+        template_series.compile_fields()
+
+
+def test_compare_in_range_malformed():
+    """Test values which cannot be compared to a range are reported"""
+
+    template_series = TemplateSeries(
+        "T1w:mag",
+        logger,
+        None,
+        0.9,
+        fields={"ImageType": {"value": [0, 1], "comparison": "in_range"}},
+    )
+    data = pydicom.dataset.Dataset()
+    data.SOPClassUID = "1.2.840.10008.5.1.4.1.1.4"
+    data.ImageType = ["ORIGINAL", "PRIMARY", "M"]
+
+    with pytest.raises(TypeError, match="Malformed template"):
+        template_series.compare_header_fields(data)
+
+
 def test_prot_match(data_series, protocol_all):
     """Test protocol match. Only use T1w series"""
 
@@ -88,6 +335,120 @@ def test_prot_match(data_series, protocol_all):
     assert protocol_all.extra_series == 0
 
 
+def test_prot_match_compact(
+    dicom_list, protocol_all, config_t1, config_flair, config_fmri
+):
+    """Test matching against headers reduced to the template fields"""
+
+    keep_tags = build_templates.get_required_tags(
+        [("config_all.json", {**config_t1, **config_flair, **config_fmri})]
+    )
+    data_series = read_dicoms.construct_classes(dicom_list, keep_tags)
+
+    assert all(not isinstance(x.data, pydicom.dataset.FileDataset) for x in data_series)
+    assert not hasattr(data_series[0], "__dict__")
+
+    protocol_all.compare_protocol(data_series)
+
+    assert protocol_all.score == 1.0
+    assert protocol_all.extra_series == 0
+
+
+def test_prot_match_extraction_shared(
+    mocker, data_series, protocol_all, protocol_missing_fmri
+):
+    """Test fields are extracted once per series across templates"""
+
+    spy_extract = mocker.spy(dataseries_module, "extract_field")
+
+    protocol_all.compare_protocol(data_series)
+    num_extracted = spy_extract.call_count
+
+    assert num_extracted == sum(len(x.extracted) for x in data_series)
+
+    # All fields of the second protocol were extracted for the first
+    protocol_missing_fmri.compare_protocol(data_series)
+
+    assert spy_extract.call_count == num_extracted
+    assert protocol_missing_fmri.score == 1.0
+
+
+def test_prot_match_pruned(data_series, config_t1, config_flair, config_fmri):
+    """Test pruned comparisons give the same match results"""
+
+    template = ("config_all.json", {**config_t1, **config_flair, **config_fmri})
+    protocol = build_templates.build_templates(template, 0.9, "mock_id", logger)
+    protocol_pruned = build_templates.build_templates(
+        template, 0.9, "mock_id", logger, prune_scores=True
+    )
+
+    protocol.compare_protocol(data_series)
+    protocol_pruned.compare_protocol(data_series)
+
+    assert protocol_pruned.score == protocol.score == 1.0
+    for acq, acq_pruned in zip(
+        protocol.get_template_acquisitions(),
+        protocol_pruned.get_template_acquisitions(),
+    ):
+        assert acq_pruned.match_status is acq.match_status
+        for series, series_pruned in zip(
+            acq.template_series, acq_pruned.template_series
+        ):
+            assert series_pruned.matches == series.matches
+            assert not any(x.pruned for x in series.series_matches)
+
+    assert any(
+        x.pruned
+        for acq in protocol_pruned.get_template_acquisitions()
+        for series in acq.template_series
+        for x in series.series_matches
+    )
+
+
+def test_prot_match_shared_index(data_series, protocol_all, protocol_missing_fmri):
+    """Test protocols sharing a SeriesDescription index"""
+
+    index = DescriptionIndex(
+        protocol_all.description_patterns()
+        + protocol_missing_fmri.description_patterns()
+    )
+    protocol_all.description_index = index
+    protocol_missing_fmri.description_index = index
+
+    protocol_all.compare_protocol(data_series)
+    protocol_missing_fmri.compare_protocol(data_series)
+
+    assert protocol_all.score == 1.0
+    assert protocol_all.extra_series == 0
+    assert protocol_missing_fmri.score == 1.0
+    assert protocol_missing_fmri.extra_series == 4
+
+
+def test_prot_match_exact_index(
+    mocker, data_series, config_t1, config_flair, config_fmri
+):
+    """Test the exact field index skips comparisons without changing matches"""
+
+    template = ("config_all.json", {**config_t1, **config_flair, **config_fmri})
+    protocol = build_templates.build_templates(template, 0.9, "mock_id", logger)
+    protocol_indexed = build_templates.build_templates(template, 0.9, "mock_id", logger)
+    protocol_indexed.exact_index = ExactFieldIndex(protocol_indexed.exact_fields())
+
+    spy_compare = mocker.spy(TemplateSeries, "compare_with_data_series")
+    protocol.compare_protocol(data_series)
+    num_compared = spy_compare.call_count
+    spy_compare.reset_mock()
+    protocol_indexed.compare_protocol(data_series)
+
+    assert spy_compare.call_count < num_compared
+    assert protocol_indexed.score == protocol.score == 1.0
+    assert protocol_indexed.extra_series == protocol.extra_series
+    for series, series_indexed in zip(
+        protocol.get_template_series(), protocol_indexed.get_template_series()
+    ):
+        assert series_indexed.matches == series.matches
+
+
 def test_prot_match_extra_series(data_series, protocol_missing_fmri):
     """Test protocol match when extra series present"""
 
@@ -0,0 +1,154 @@
+"""
+Tests for the discrimination tree of a template library
+"""
+
+import logging
+import os
+import random
+
+from pydicom.valuerep import IS, DSfloat
+
+from protocol_qc import build_templates
+from protocol_qc.utils import decision_tree
+from protocol_qc.utils.decision_tree import DiscriminationTree
+from protocol_qc.utils.exact_index import ExactFieldIndex
+
+logger = logging.getLogger()
+
+VALUES = {
+    "ScanningSequence": [["GR", "IR"], ["SE"], ["EP"]],
+    "MRAcquisitionType": ["2D", "3D"],
+    "Rows": [256, 512, "256"],
+    "RepetitionTime": [2300, 3000.0],
+    "SequenceName": ["tfl3d1", "spc3d1", "epfid2d1"],
+}
+
+
+def random_templates(rng, num_templates):
+    """Return series templates with random exact fields"""
+
+    templates = []
+    for key in range(num_templates):
+        fields = {"SeriesDescription": {"value": "T1w", "comparison": "regex"}}
+        for field_name in rng.sample(sorted(VALUES), rng.randint(0, len(VALUES))):
+            fields[field_name] = {
+                "value": rng.choice(VALUES[field_name]),
+                "comparison": "exact",
+                "compulsory": rng.random() > 0.2,
+            }
+        templates.append((key, fields, rng.choice([0.5, 0.8, 0.9])))
+
+    return templates
+
+
+def random_values(rng):
+    """Return random header values"""
+
+    values = {}
+    for field_name, choices in VALUES.items():
+        if rng.random() < 0.2:
+            continue
+        value = rng.choice(choices)
+        if field_name == "Rows":
+            value = IS(str(value))
+        elif field_name == "RepetitionTime":
+            value = DSfloat(str(value))
+        values[field_name] = value
+
+    return values
+
+
+def test_tree_candidates():
+    """Test the tree gives the same candidates as the exact field index"""
+
+    rng = random.Random(0)
+    templates = random_templates(rng, 60)
+
+    tree = DiscriminationTree(templates)
+    index = ExactFieldIndex(templates)
+
+    for _ in range(200):
+        values = random_values(rng)
+        assert tree.candidates(values.get) == index.candidates(values.get)
+
+
+def test_tree_cached(mocker, tmp_path):
+    """Test the tree is read from the cache while the templates are unchanged"""
+
+    rng = random.Random(1)
+    templates = random_templates(rng, 20)
+
+    tree = DiscriminationTree(templates, tmp_path)
+    assert len(list(tmp_path.glob("tree_*.json"))) == 1
+
+    spy_build = mocker.spy(DiscriminationTree, "_build")
+    cached = DiscriminationTree(templates, tmp_path)
+    assert spy_build.call_count == 0
+    assert cached.root == tree.root
+
+    for _ in range(50):
+        values = random_values(rng)
+        assert cached.candidates(values.get) == tree.candidates(values.get)
+
+    templates[0][1]["Rows"] = {"value": 128, "comparison": "exact"}
+    DiscriminationTree(templates, tmp_path)
+    assert spy_build.call_count > 0
+    assert len(list(tmp_path.glob("tree_*.json"))) == 2
+
+
+def test_tree_cache_corrupt(mocker, tmp_path):
+    """Test a partly written cached tree is rebuilt and replaced"""
+
+    templates = random_templates(random.Random(3), 10)
+    tree = DiscriminationTree(templates, tmp_path)
+    (path_cache,) = tmp_path.glob("tree_*.json")
+    path_cache.write_text(path_cache.read_text()[:20])
+
+    spy_build = mocker.spy(DiscriminationTree, "_build")
+    rebuilt = DiscriminationTree(templates, tmp_path)
+    assert spy_build.call_count > 0
+    assert rebuilt.root == tree.root
+
+    spy_build.reset_mock()
+    DiscriminationTree(templates, tmp_path)
+    assert spy_build.call_count == 0
+    assert list(tmp_path.iterdir()) == [path_cache]
+
+
+def test_tree_cache_pruned(tmp_path):
+    """Test only the most recently used cached trees are kept"""
+
+    rng = random.Random(2)
+    all_templates = [
+        random_templates(rng, 5) for _ in range(decision_tree.MAX_CACHED_TREES + 1)
+    ]
+
+    for templates in all_templates[:-1]:
+        DiscriminationTree(templates, tmp_path)
+        for path_cache in tmp_path.glob("tree_*.json"):
+            os.utime(path_cache, ns=(0, path_cache.stat().st_mtime_ns - 10**9))
+    oldest = min(tmp_path.glob("tree_*.json"), key=lambda x: x.stat().st_mtime_ns)
+
+    # Reusing the oldest tree marks it as recently used
+    DiscriminationTree(all_templates[0], tmp_path)
+    DiscriminationTree(all_templates[-1], tmp_path)
+
+    cached = list(tmp_path.glob("tree_*.json"))
+    assert len(cached) == decision_tree.MAX_CACHED_TREES
+    assert oldest in cached
+
+
+def test_prot_match_tree(data_series, config_t1, config_flair, config_fmri):
+    """Test matching a protocol with the discrimination tree"""
+
+    protocol = build_templates.build_templates(
+        ("config_all.json", {**config_t1, **config_flair, **config_fmri}),
+        0.9,
+        "mock_id",
+        logger,
+    )
+    protocol.exact_index = DiscriminationTree(protocol.exact_fields())
+    protocol.compare_protocol(data_series)
+
+    assert protocol.score == 1.0
+    assert protocol.extra_series == 0
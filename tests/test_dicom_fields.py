@@ -0,0 +1,125 @@
+"""
+Tests for DICOM field locations
+"""
+
+import logging
+
+import pydicom
+from pydicom.tag import Tag
+
+from protocol_qc.utils import dicom_fields
+
+
+def test_field_tags():
+    """Test template fields are resolved to the tags they are read from"""
+
+    assert dicom_fields.field_tags("EchoTime") == {Tag("EchoTime")}
+    assert dicom_fields.field_tags("PRIVATE-BValue") == {
+        Tag(0x0019, 0x100C),
+        Tag(0x0019, 0x0010),
+    }
+    assert dicom_fields.field_tags("RepetitionTime") == {
+        Tag("RepetitionTime"),
+        Tag("SharedFunctionalGroupsSequence"),
+    }
+    assert dicom_fields.field_tags("PRIVATE-Unknown") == set()
+
+
+def test_compact_dataset():
+    """Test only requested and base fields, and the first frame, are kept"""
+
+    data = pydicom.dataset.Dataset()
+    data.SeriesNumber = 3
+    data.SeriesDescription = "fMRI"
+    data.EchoTime = 30
+    data.PatientName = "Anon"
+    data.add_new((0x0019, 0x0010), "LO", "SIEMENS MR HEADER")
+    data.add_new((0x0019, 0x100C), "IS", 1000)
+    data.PerFrameFunctionalGroupsSequence = [
+        pydicom.dataset.Dataset() for _ in range(100)
+    ]
+
+    compact = dicom_fields.compact_dataset(
+        data,
+        dicom_fields.field_tags("EchoTime")
+        | dicom_fields.field_tags("PRIVATE-BValue")
+        | dicom_fields.field_tags("SliceThickness"),
+    )
+
+    assert compact.SeriesNumber == 3
+    assert compact.SeriesDescription == "fMRI"
+    assert compact.EchoTime == 30
+    assert compact[0x0019, 0x100C].value == 1000
+    assert "PatientName" not in compact
+    assert len(compact.PerFrameFunctionalGroupsSequence) == 1
+
+
+def test_series_facets():
+    """Test the private field map is selected once per series"""
+
+    data = pydicom.dataset.Dataset()
+    data.SOPClassUID = "1.2.840.10008.5.1.4.1.1.4.1"
+
+    facets = dicom_fields.series_facets(data)
+
+    assert facets.enhanced
+    assert facets.private_fields is dicom_fields.PRIVATE_FIELDS_ENHANCED
+
+    unknown = dicom_fields.series_facets(pydicom.dataset.Dataset())
+    assert unknown.sop_class is None
+    assert not unknown.enhanced
+    assert unknown.private_fields is None
+
+
+def test_extract_enhanced_fields():
+    """Test enhanced fields are read through their extractors"""
+
+    data = pydicom.dataset.Dataset()
+    data.SOPClassUID = "1.2.840.10008.5.1.4.1.1.4.1"
+    data.add_new((0x0021, 0x0010), "LO", "SIEMENS MR SDS 01")
+    data.add_new((0x0021, 0x1008), "SH", "Performance")
+    timing = pydicom.dataset.Dataset()
+    timing.RepetitionTime = 2000
+    shared = pydicom.dataset.Dataset()
+    shared.MRTimingAndRelatedParametersSequence = [timing]
+    data.SharedFunctionalGroupsSequence = [shared]
+    measures = pydicom.dataset.Dataset()
+    measures.SliceThickness = "1.5"
+    per_frame = pydicom.dataset.Dataset()
+    per_frame.PixelMeasuresSequence = [measures]
+    data.PerFrameFunctionalGroupsSequence = [per_frame]
+
+    logger = logging.getLogger("test_extract_enhanced_fields")
+
+    assert dicom_fields.extract_field("RepetitionTime", data, logger) == 2000
+    assert dicom_fields.extract_field("SliceThickness", data, logger) == 1.5
+    assert dicom_fields.extract_field("GradientMode", data, logger) == "Performance"
+    assert dicom_fields.extract_field("CoilElementsUsed", data, logger) is None
+    assert dicom_fields.extract_field("FlipAngle", data, logger) is None
+
+
+def test_extract_enhanced_private_fields():
+    """Test each enhanced private field returns its own tag"""
+
+    data = pydicom.dataset.Dataset()
+    data.SOPClassUID = "1.2.840.10008.5.1.4.1.1.4.1"
+    data.add_new((0x0021, 0x0010), "LO", "SIEMENS MR SDS 01")
+    data.add_new((0x0021, 0x1008), "SH", "Performance")
+    data.add_new((0x0021, 0x1009), "SH", "p2")
+    data.add_new((0x0021, 0x111C), "CS", "ROW")
+
+    logger = logging.getLogger("test_extract_enhanced_private_fields")
+
+    values = {
+        x: dicom_fields.extract_field(x, data, logger)
+        for x in dicom_fields.ENHANCED_DATASET_PRIVATE_FIELDS
+    }
+
+    # Previously every field returned the last consecutive private field present,
+    # here InPlanePhaseEncDirection
+    assert values == {
+        "GradientMode": "Performance",
+        "ParallelImagingAcceleration": "p2",
+        "InPlanePhaseEncDirection": "ROW",
+        "CoilElementsUsed": None,
+    }
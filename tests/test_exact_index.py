@@ -0,0 +1,58 @@
+"""
+Tests for the index of exact comparison fields
+"""
+
+from pydicom.valuerep import IS, DSfloat, PersonName
+
+from protocol_qc.utils import exact_index
+
+
+def test_attribute_keys():
+    """Test header values are looked up under every value they equal"""
+
+    assert exact_index.attribute_keys("GR") == ("GR",)
+    assert exact_index.attribute_keys(["GR", "IR"]) == (("GR", "IR"),)
+    assert exact_index.attribute_keys(DSfloat("2300")) == (2300.0, "2300")
+    assert exact_index.attribute_keys(IS("192")) == (192, "192")
+    assert exact_index.attribute_keys(PersonName("Anon")) == ("Anon",)
+    assert exact_index.attribute_keys(None) == ()
+    assert exact_index.attribute_keys([DSfloat("1.0"), DSfloat("1.0")]) is None
+
+    assert exact_index.template_key(["GR", "IR"]) == ("GR", "IR")
+    assert exact_index.template_key({"GR": "IR"}) is None
+
+
+def test_exact_field_index():
+    """Test series templates are excluded once their exact fields mismatch"""
+
+    fields = {
+        "SeriesDescription": {"value": "T1w", "comparison": "regex"},
+        "ScanningSequence": {"value": ["GR", "IR"], "comparison": "exact"},
+        "RepetitionTime": {"value": 2300, "comparison": "exact"},
+        "Rows": {"value": "256", "comparison": "exact"},
+        "EchoTime": {"value": 3, "comparison": "exact", "compulsory": False},
+    }
+    index = exact_index.ExactFieldIndex([(0, fields, 0.7), (1, fields, 0.5)])
+
+    assert 0 in index
+    assert 2 not in index
+
+    values = {
+        "ScanningSequence": ["GR", "IR"],
+        "RepetitionTime": DSfloat("2300"),
+        "Rows": IS("256"),
+    }
+    assert index.candidates(values.get) == {0, 1}
+
+    # One mismatch gives at most 4/5
+    values["Rows"] = IS("512")
+    assert index.candidates(values.get) == {0, 1}
+
+    # Two mismatches give at most 3/5
+    del values["RepetitionTime"]
+    assert index.candidates(values.get) == {1}
+
+    # Values that cannot be looked up are assumed to match
+    values["RepetitionTime"] = DSfloat("2300")
+    values["ScanningSequence"] = [DSfloat("1.0")]
+    assert index.candidates(values.get) == {0, 1}
@@ -0,0 +1,46 @@
+"""
+Tests for field comparison statistics
+"""
+
+import json
+
+from protocol_qc.field_stats import STATS_VERSION, FieldStats, field_cost
+
+
+def test_field_cost():
+    """Test regex and enhanced sequence look-ups are the most costly"""
+
+    assert field_cost("EchoTime", "exact") < field_cost("EchoTime", "regex")
+    assert field_cost("EchoTime", "exact") < field_cost("PRIVATE-BValue", "exact")
+    assert field_cost("PRIVATE-BValue", "exact") < field_cost("RepetitionTime", "exact")
+
+
+def test_field_stats_persisted(tmp_path):
+    """Test statistics are recorded, saved and read back"""
+
+    path_stats = tmp_path / "field_stats.json"
+    stats = FieldStats(path_stats)
+
+    assert stats.mismatch_rate("EchoTime") == 0.5
+
+    for matched in (False, False, False, True):
+        stats.record("EchoTime", matched)
+    stats.record("Manufacturer", True)
+    stats.save()
+
+    stats = FieldStats(path_stats)
+
+    assert stats.counts == {"EchoTime": [4, 3], "Manufacturer": [1, 0]}
+    assert stats.mismatch_rate("EchoTime") == 4 / 6
+    assert stats.priority("EchoTime", "exact") < stats.priority("Manufacturer", "exact")
+
+
+def test_field_stats_version(tmp_path):
+    """Test statistics from another version are ignored"""
+
+    path_stats = tmp_path / "field_stats.json"
+    path_stats.write_text(
+        json.dumps({"version": STATS_VERSION + 1, "fields": {"EchoTime": [4, 3]}})
+    )
+
+    assert not FieldStats(path_stats).counts
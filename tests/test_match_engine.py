@@ -0,0 +1,144 @@
+"""
+Tests for the single pass matching engine
+"""
+
+import copy
+import logging
+
+import pytest
+
+from protocol_qc import build_templates
+from protocol_qc.classes.series import TemplateSeries
+from protocol_qc.field_stats import FieldStats
+from protocol_qc.match_engine import MatchEngine
+from protocol_qc.utils.exact_index import ExactFieldIndex
+
+logger = logging.getLogger()
+
+
+def build(name, template):
+    """Build a protocol template"""
+
+    return build_templates.build_templates((name, template), 0.9, "mock_id", logger)
+
+
+def test_match_engine(mocker, data_series, config_t1, config_flair, config_fmri):
+    """Test the engine gives the same results as matching protocols one by one"""
+
+    templates = [
+        ("config_all.json", {**config_t1, **config_flair, **config_fmri}),
+        ("config_t1_flair.json", {**config_t1, **config_flair}),
+        ("config_t1.json", config_t1),
+    ]
+    protocols = [build(*x) for x in templates]
+    protocols_engine = [build(*x) for x in templates]
+
+    for protocol in protocols:
+        protocol.compare_protocol(data_series)
+
+    engine = MatchEngine(protocols_engine)
+    num_series = sum(len(x.get_template_series()) for x in protocols_engine)
+    assert len(engine.unique) == len(protocols_engine[0].get_template_series())
+    assert len(engine.unique) < num_series
+
+    spy_compare = mocker.spy(TemplateSeries, "compare_with_data_series")
+    engine.match(data_series, logger, ExactFieldIndex(engine.exact_fields()))
+    num_compared = spy_compare.call_count
+    for protocol in protocols_engine:
+        protocol.compare_protocol(data_series, matched=True)
+
+    assert spy_compare.call_count == num_compared
+    for protocol, protocol_engine in zip(protocols, protocols_engine):
+        assert protocol_engine.score == protocol.score
+        assert protocol_engine.extra_series == protocol.extra_series
+        for series, series_engine in zip(
+            protocol.get_template_series(), protocol_engine.get_template_series()
+        ):
+            assert series_engine.match_status is series.match_status
+            assert series_engine.matches == series.matches
+
+
+def test_match_engine_parallel(data_series, config_t1, config_flair, config_fmri):
+    """Test matching in worker processes gives the same results as one process"""
+
+    template = ("config_all.json", {**config_t1, **config_flair, **config_fmri})
+    results = []
+    for workers in (1, 2):
+        field_stats = FieldStats(None)
+        protocol = build_templates.build_templates(
+            copy.deepcopy(template), 0.9, "mock_id", logger, True, field_stats
+        )
+        engine = MatchEngine([protocol])
+        exact_index = ExactFieldIndex(engine.exact_fields())
+        engine.match(data_series, logger, exact_index, workers)
+        protocol.compare_protocol(data_series, matched=True)
+        results.append(
+            (
+                protocol.score,
+                [x.series_matches for x in protocol.get_template_series()],
+                field_stats.counts,
+            )
+        )
+
+    assert results[0][0] == 1.0
+    assert results[1] == results[0]
+
+
+def test_match_engine_parallel_memo(data_series, config_t1, config_flair):
+    """Test worker processes compare every series even with memo_scores"""
+
+    template = ("config_t1_flair.json", {**config_t1, **config_flair})
+    # Repeated series would reuse the score of whichever copy a worker compared
+    all_series = data_series * 2
+    results = []
+    for workers, memo_scores in ((1, False), (2, True)):
+        field_stats = FieldStats(None)
+        protocol = build_templates.build_templates(
+            copy.deepcopy(template),
+            0.9,
+            "mock_id",
+            logger,
+            field_stats=field_stats,
+            memo_scores=memo_scores,
+        )
+        engine = MatchEngine([protocol])
+        engine.match(all_series, logger, workers=workers)
+        results.append(
+            (
+                [x.series_matches for x in protocol.get_template_series()],
+                [x.series_records for x in protocol.get_template_series()],
+                field_stats.counts,
+            )
+        )
+
+    assert results[1] == results[0]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_match_engine_logs_duplicates(
+    caplog, workers, data_series, config_t1, config_flair, config_fmri
+):
+    """Test every protocol template sharing a series template logs its comparisons"""
+
+    template = ("config_all.json", {**config_t1, **config_flair, **config_fmri})
+    protocols = [
+        build_templates.build_templates(
+            copy.deepcopy(template), 0.9, "mock_id", logging.getLogger(name)
+        )
+        for name in ("test_logs_first", "test_logs_duplicate")
+    ]
+    engine = MatchEngine(protocols)
+    assert all(engine.duplicates)
+
+    caplog.set_level(logging.DEBUG)
+    engine.match(data_series, logger, workers=workers)
+    assert not [x for x in caplog.records if x.name.startswith("test_logs")]
+
+    for protocol in protocols:
+        protocol.compare_protocol(data_series, matched=True)
+
+    for name in ("test_logs_first", "test_logs_duplicate"):
+        messages = [x.getMessage() for x in caplog.records if x.name == name]
+        header = messages.index(" Comparing series template: fMRI:SBref")
+        assert "   files: 6 != 606" in messages[header:]
+        assert any(x.strip().endswith("% match") for x in messages[header:])
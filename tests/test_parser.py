@@ -13,6 +13,9 @@ from protocol_qc.utils import parser
         ([], "error: the following arguments are required"),
         (["arg1", "arg2", "arg3"], "unrecognized arguments: arg3"),
         (["arg1", "arg2", "--arg3"], "unrecognized arguments: --arg3"),
+        (["arg1", "arg2", "--ingest_workers", "0"], "must be at least 1: 0"),
+        (["arg1", "arg2", "--ingest_workers", "two"], "invalid int value: 'two'"),
+        (["arg1", "arg2", "--template_workers", "-1"], "must be at least 1: -1"),
     ],
 )
 def test_parser_fail(capsys, inputs, error_message):
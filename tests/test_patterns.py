@@ -0,0 +1,81 @@
+"""
+Tests for the pattern registry
+"""
+
+import re
+
+import pytest
+
+from protocol_qc.utils import patterns
+
+
+def test_compile_pattern(mocker):
+    """Test each pattern is compiled once"""
+
+    spy_compile = mocker.spy(patterns.re, "compile")
+
+    first = patterns.compile_pattern("^T1w_(MPRAGE|SPACE)$", "test")
+    second = patterns.compile_pattern("^T1w_(MPRAGE|SPACE)$", "another test")
+
+    assert first is second
+    assert spy_compile.call_count == 1
+    assert first.search("T1w_SPACE")
+
+
+def test_compile_pattern_malformed():
+    """Test malformed patterns are reported with their context"""
+
+    with pytest.raises(re.error) as error:
+        patterns.compile_pattern("(T1w", 'field "SeriesDescription"')
+
+    assert '"(T1w" in field "SeriesDescription"' in error.value.msg
+
+
+@pytest.mark.parametrize(
+    "pattern, prefix",
+    [
+        ("^T1w_MPR", "T1w_MPR"),
+        ("^T1w.*", "T1w"),
+        ("^T1w?", "T1"),
+        ("^T1w{2}", "T1"),
+        ("^T1w+", "T1w"),
+        ("^(T1w)", ""),
+        ("^T1w|T2w", ""),
+        ("T1w", ""),
+    ],
+)
+def test_literal_prefix(pattern, prefix):
+    """Test the literal prefix of anchored patterns"""
+
+    assert patterns.literal_prefix(pattern) == prefix
+
+
+def test_description_index():
+    """Test the index returns the same candidates as searching every pattern"""
+
+    templates = [
+        "^T1w_MPR",
+        "^T1w_MPR",
+        "^T2w",
+        "FLAIR",
+        "(fMRI|BOLD)",
+        "(?i)^dwi",
+        r"(b)\1",
+        "",
+    ]
+    descriptions = ["T1w_MPR", "T2w_SPC", "T2w_FLAIR", "bold_rest", "DWI", "abb", ""]
+
+    index = patterns.DescriptionIndex(enumerate(templates))
+
+    for description in descriptions:
+        expected = {
+            key
+            for key, pattern in enumerate(templates)
+            if not description or re.search(pattern, description)
+        }
+        assert index.candidates(description) == expected
+
+    assert index.candidates("T1w_MPR") is index.candidates("T1w_MPR")
+    assert index.candidates(None) == set(range(len(templates)))
+    assert 0 in index
+    assert len(templates) not in index
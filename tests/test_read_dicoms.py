@@ -3,14 +3,44 @@ Tests for read_dicoms.py
 """
 
 import logging
+import os
+import shutil
+from pathlib import Path
 
+import pydicom
 import pytest
+from pydicom.fileset import FileSet
+from pydicom.tag import Tag
 
-from protocol_qc import read_dicoms
+from protocol_qc import read_dicoms, scanners
+from protocol_qc.classes.ingest_state import IngestState
 
 logger = logging.getLogger()
 
 
+def write_sequence_dicom(name_dicom, num_items):
+    """Write a DICOM with an undefined length sequence before SeriesInstanceUID"""
+
+    file_meta = pydicom.dataset.FileMetaDataset()
+    file_meta.MediaStorageSOPClassUID = pydicom.uid.UID("1.2.840.10008.5.1.4.1.1.4")
+    file_meta.MediaStorageSOPInstanceUID = pydicom.uid.UID("1.2.3")
+    file_meta.TransferSyntaxUID = pydicom.uid.ExplicitVRLittleEndian
+
+    dicom = pydicom.dataset.FileDataset(
+        name_dicom.name, {}, file_meta=file_meta, preamble=b"\0" * 128
+    )
+    dicom.SOPClassUID = "1.2.840.10008.5.1.4.1.1.4"
+    item = pydicom.dataset.Dataset()
+    item.ReferencedSOPClassUID = "1.2.840.10008.5.1.4.1.1.4"
+    item.ReferencedSOPInstanceUID = "1.2.3.4.5.6.7.8.9"
+    dicom.ReferencedImageSequence = [item] * num_items
+    dicom["ReferencedImageSequence"].is_undefined_length = True
+    dicom.SeriesDescription = "localizer"
+    dicom.SeriesInstanceUID = "1.2.3.4"
+    dicom.SeriesNumber = 20
+    dicom.save_as(name_dicom, write_like_original=False)
+
+
 def test_construct_classes(dicom_list):
     """Test constructing classes"""
 
@@ -58,3 +88,306 @@ def test_find_unique_series_no_dicoms(tmp_path):
     assert "Could not locate any DICOMS in: " in error.value.args[0]
 
     (dir_no_dicoms / "not_dicom.jpeg").unlink()
+
+
+def test_find_unique_series_single_read(mocker, dicom_dir):
+    """Test representatives are parsed from the discovery file handle only"""
+
+    spy_dcmread = mocker.spy(read_dicoms.pydicom, "dcmread")
+
+    series = read_dicoms.find_unique_series(dicom_dir, logger)
+
+    # One full header parse per series, none by construct_classes
+    assert spy_dcmread.call_count == len(series) == 8
+    assert all(not isinstance(call.args[0], str) for call in spy_dcmread.call_args_list)
+    assert all("PixelData" not in x.data for x in series)
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_find_unique_series_parallel(dicom_dir, executor):
+    """Test parallel ingestion gives the same series as the serial path"""
+
+    serial = read_dicoms.find_unique_series(dicom_dir, logger)
+    parallel = read_dicoms.find_unique_series(
+        dicom_dir, logger, ingest_workers=3, ingest_executor=executor
+    )
+
+    assert [(x.unique_label(), x.num_files, x.path) for x in parallel] == [
+        (x.unique_label(), x.num_files, x.path) for x in serial
+    ]
+
+
+def test_find_unique_series_index(mocker, tmp_path, dicom_dir_duplicates):
+    """Test a warm run with a series index only reads changed files"""
+
+    path_index = tmp_path / "index.sqlite"
+
+    cold = read_dicoms.find_unique_series(
+        dicom_dir_duplicates, logger, series_index=path_index
+    )
+
+    spy_sniff = mocker.spy(scanners, "read_series_uid")
+    warm = read_dicoms.find_unique_series(
+        dicom_dir_duplicates, logger, series_index=path_index
+    )
+
+    assert spy_sniff.call_count == 0
+    assert [(x.unique_label(), x.num_files, x.path) for x in warm] == [
+        (x.unique_label(), x.num_files, x.path) for x in cold
+    ]
+    assert warm[0].data.SeriesDescription == "T1w_Sag_AP-REPEAT"
+
+    # Removing a file and touching another only re-reads the touched file
+    sorted(dicom_dir_duplicates.glob("*.dcm"))[0].unlink()
+    touched = sorted(dicom_dir_duplicates.glob("*.dcm"))[0]
+    os.utime(touched, ns=(0, 0))
+
+    updated = read_dicoms.find_unique_series(
+        dicom_dir_duplicates, logger, series_index=path_index
+    )
+
+    assert spy_sniff.call_count == 1
+    assert sum(x.num_files for x in updated) == 383
+
+
+def test_find_unique_series_index_removed(mocker, tmp_path, dicom_dir):
+    """Test files removed after the directory is walked are left out"""
+
+    path_index = tmp_path / "index.sqlite"
+    walk_files = scanners.walk_files
+
+    def walk_then_remove(*args):
+        files = walk_files(*args)
+        files[0].unlink()
+        return files
+
+    mocker.patch.object(read_dicoms, "walk_files", side_effect=walk_then_remove)
+    series = read_dicoms.find_unique_series(dicom_dir, logger, series_index=path_index)
+
+    assert sum(x.num_files for x in series) == len(list(dicom_dir.glob("*.dcm")))
+
+
+def test_find_unique_series_index_no_preamble(tmp_path, dicom_dir):
+    """Test headers of files without a preamble are reused on a warm run"""
+
+    dir_input = tmp_path / "dicoms"
+    dir_input.mkdir()
+    dicom = pydicom.dcmread(sorted(dicom_dir.glob("t1_mag_*.dcm"))[0])
+    dicom.preamble = None
+    dicom.file_meta = pydicom.dataset.FileMetaDataset()
+    dicom.save_as(dir_input / "no_preamble.dcm", write_like_original=True)
+    path_index = tmp_path / "index.sqlite"
+
+    cold = read_dicoms.find_unique_series(
+        dir_input, logger, allow_no_preamble=True, series_index=path_index
+    )
+    warm = read_dicoms.find_unique_series(
+        dir_input, logger, allow_no_preamble=True, series_index=path_index
+    )
+
+    assert len(cold) == 1
+    assert warm[0].data.Rows == cold[0].data.Rows == 256
+
+
+def test_find_unique_series_keep_tags(mocker, tmp_path, dicom_dir):
+    """Test representatives only parse the tags referenced by the templates"""
+
+    path_index = tmp_path / "index.sqlite"
+    spy_dcmread = mocker.spy(read_dicoms.pydicom, "dcmread")
+
+    series = read_dicoms.find_unique_series(
+        dicom_dir, logger, series_index=path_index, keep_tags={Tag("Rows")}
+    )
+
+    assert all(call.kwargs["specific_tags"] for call in spy_dcmread.call_args_list)
+    assert series[0].data.Rows == 256
+    assert "SAR" not in series[0].data
+
+    # Headers stored in the index are only reused if they hold the required tags
+    spy_representative = mocker.spy(scanners, "read_representative_header")
+    read_dicoms.find_unique_series(
+        dicom_dir, logger, series_index=path_index, keep_tags={Tag("Rows")}
+    )
+    assert spy_representative.call_count == 0
+
+    series = read_dicoms.find_unique_series(
+        dicom_dir, logger, series_index=path_index, keep_tags={Tag("SAR")}
+    )
+    assert spy_representative.call_count == len(series)
+    assert "SAR" in series[0].data
+
+
+def test_update_unique_series(mocker, tmp_path, dicom_dir_duplicates):
+    """Test incremental scans only read new files"""
+
+    dir_landing = tmp_path / "landing"
+    dir_landing.mkdir()
+    dicoms = sorted(dicom_dir_duplicates.glob("*.dcm"))
+
+    for dicom in dicoms[:100]:
+        (dir_landing / dicom.name).write_bytes(dicom.read_bytes())
+
+    # New series are only built once their representative is unchanged
+    state = IngestState()
+    assert not read_dicoms.update_unique_series(dir_landing, state, logger)
+    first = read_dicoms.update_unique_series(dir_landing, state, logger)
+    assert sum(x.num_files for x in first) == 100
+
+    # A file still being written is not recorded and is checked again
+    (dir_landing / "partial.dcm").touch()
+    for dicom in dicoms[100:]:
+        (dir_landing / dicom.name).write_bytes(dicom.read_bytes())
+
+    spy_sniff = mocker.spy(scanners, "read_series_uid")
+    read_dicoms.update_unique_series(dir_landing, state, logger)
+    assert spy_sniff.call_count == len(dicoms) - 100 + 1
+    assert "partial.dcm" not in {Path(x).name for x in state.seen}
+
+    second = read_dicoms.update_unique_series(dir_landing, state, logger)
+    assert [(x.unique_label(), x.num_files) for x in second] == [
+        (x.unique_label(), x.num_files)
+        for x in read_dicoms.find_unique_series(dicom_dir_duplicates, logger)
+    ]
+    # Existing DataSeries are updated in place
+    assert first[0] is second[0]
+
+
+def test_update_unique_series_truncated(tmp_path, dicom_dir):
+    """Test a representative cut short while being written is not kept"""
+
+    dir_landing = tmp_path / "landing"
+    dir_landing.mkdir()
+    name_dicom = sorted(dicom_dir.glob("t1_mag_*.dcm"))[0]
+    content = name_dicom.read_bytes()
+    name_landing = dir_landing / name_dicom.name
+    name_landing.write_bytes(content[:-10])
+
+    state = IngestState()
+    assert not read_dicoms.update_unique_series(dir_landing, state, logger)
+
+    name_landing.write_bytes(content)
+    os.utime(name_landing, ns=(0, 1))
+    assert not read_dicoms.update_unique_series(dir_landing, state, logger)
+
+    all_series = read_dicoms.update_unique_series(dir_landing, state, logger)
+    assert len(all_series[0].data) == len(pydicom.dcmread(name_dicom))
+
+
+def test_find_unique_series_dicomdir(mocker, tmp_path, dicom_dir_duplicates):
+    """Test series are taken from a DICOMDIR without reading every file"""
+
+    file_set = FileSet()
+    dicoms = (
+        sorted(dicom_dir_duplicates.glob("t1_mag_duplicate_*.dcm"))[:5]
+        + sorted(dicom_dir_duplicates.glob("t1_mag_prenorm_duplicate_*.dcm"))[:5]
+    )
+    for dicom in dicoms:
+        data = pydicom.dcmread(dicom)
+        data.SOPInstanceUID = pydicom.uid.generate_uid()
+        data.file_meta.MediaStorageSOPInstanceUID = data.SOPInstanceUID
+        data.file_meta.TransferSyntaxUID = pydicom.uid.ExplicitVRLittleEndian
+        data.Modality = "MR"
+        data.PatientID = "mock_id"
+        data.PatientName = "mock"
+        data.StudyInstanceUID = "1.1"
+        data.StudyDate = "20250101"
+        data.StudyTime = "120000"
+        data.StudyID = "1"
+        data.AccessionNumber = "1"
+        data.InstanceNumber = 1
+        file_set.add(data)
+    dir_export = tmp_path / "export"
+    file_set.write(dir_export)
+
+    spy_read_uid = mocker.spy(scanners, "read_series_uid")
+    spy_dcmread = mocker.spy(read_dicoms.pydicom, "dcmread")
+
+    series = read_dicoms.find_unique_series(dir_export, logger)
+
+    assert spy_read_uid.call_count == 0
+    # DICOMDIR plus one representative per series
+    assert spy_dcmread.call_count == 1 + len(series)
+    assert [(x.unique_label(), x.num_files) for x in series] == [
+        ("9:T1w_Sag_AP-REPEAT", 5),
+        ("10:T1w_Sag_AP-REPEAT", 5),
+    ]
+
+    # Files missing from the export are only dropped when verifying
+    next(x for x in dir_export.rglob("IM*") if x.name != "IM000000").unlink()
+    series = read_dicoms.find_unique_series(dir_export, logger, verify_dicomdir=True)
+    assert sum(x.num_files for x in series) == 9
+
+    # Ignoring the DICOMDIR reads all files, skipping the DICOMDIR itself
+    series = read_dicoms.find_unique_series(dir_export, logger, ignore_dicomdir=True)
+    assert sum(x.num_files for x in series) == 9
+
+
+@pytest.mark.parametrize("archive_format", ["zip", "gztar"])
+def test_find_unique_series_archive(mocker, tmp_path, dicom_dir, archive_format):
+    """Test archives give the same series as their extracted directory"""
+
+    path_archive = Path(
+        shutil.make_archive(tmp_path / "session", archive_format, dicom_dir)
+    )
+    spy_representative = mocker.spy(scanners, "read_representative_header")
+
+    serial = read_dicoms.find_unique_series(dicom_dir, logger)
+    spy_representative.reset_mock()
+    archived = read_dicoms.find_unique_series(path_archive, logger)
+
+    assert [(x.unique_label(), x.num_files) for x in archived] == [
+        (x.unique_label(), x.num_files) for x in serial
+    ]
+    # Only representatives are parsed in full and nothing is extracted
+    assert spy_representative.call_count == len(archived)
+    assert all(x.path.is_relative_to(path_archive) for x in archived)
+    assert list(tmp_path.iterdir()) == [path_archive]
+
+    # Include and exclude patterns are applied to member paths
+    excluded = read_dicoms.find_unique_series(path_archive, logger, exclude=["t1_*"])
+    assert [x.unique_label() for x in excluded] == [
+        x.unique_label() for x in archived[2:]
+    ]
+
+
+def test_update_unique_series_truncated_header(tmp_path, dicom_dir):
+    """Test a file cut short within its header is checked again on the next call"""
+
+    dir_landing = tmp_path / "landing"
+    dir_landing.mkdir()
+    name_dicom = sorted(dicom_dir.glob("t1_mag_*.dcm"))[0]
+    (dir_landing / name_dicom.name).write_bytes(name_dicom.read_bytes())
+
+    state = IngestState()
+    read_dicoms.update_unique_series(dir_landing, state, logger)
+    assert len(read_dicoms.update_unique_series(dir_landing, state, logger)) == 1
+
+    name_sequence = tmp_path / "localizer.dcm"
+    write_sequence_dicom(name_sequence, 100)
+    content = name_sequence.read_bytes()
+    name_landing = dir_landing / name_sequence.name
+    name_landing.write_bytes(content[:1000])
+
+    assert len(read_dicoms.update_unique_series(dir_landing, state, logger)) == 1
+    assert name_landing.as_posix() not in state.seen
+
+    name_landing.write_bytes(content)
+    read_dicoms.update_unique_series(dir_landing, state, logger)
+    all_series = read_dicoms.update_unique_series(dir_landing, state, logger)
+    assert [x.unique_label() for x in all_series] == ["1:T1w_Sag_AP-", "20:localizer"]
+    assert name_landing.as_posix() in state.seen
+
+
+def test_find_unique_series_archive_large_header(tmp_path):
+    """Test a SeriesInstanceUID beyond the prefix read from an archive member"""
+
+    dir_session = tmp_path / "session"
+    dir_session.mkdir()
+    write_sequence_dicom(dir_session / "localizer.dcm", 2000)
+    raw = (dir_session / "localizer.dcm").read_bytes()
+    assert raw.index(b"\x20\x00\x0e\x00") > scanners.ARCHIVE_PREFIX_LENGTH
+
+    path_archive = Path(shutil.make_archive(tmp_path / "session", "tar", dir_session))
+    series = read_dicoms.find_unique_series(path_archive, logger)
+
+    assert [(x.unique_label(), x.num_files) for x in series] == [("20:localizer", 1)]
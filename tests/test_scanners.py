@@ -0,0 +1,124 @@
+"""
+Tests for scanners.py
+"""
+
+import io
+
+import pydicom
+
+from protocol_qc import scanners
+
+
+def test_read_discovery_header(tmp_path):
+    """Test discovery reads the SeriesInstanceUID without touching pixel data"""
+
+    file_meta = pydicom.dataset.FileMetaDataset()
+    file_meta.MediaStorageSOPClassUID = pydicom.uid.UID("1.2.840.10008.5.1.4.1.1.4")
+    file_meta.MediaStorageSOPInstanceUID = pydicom.uid.UID("1.2.3")
+    file_meta.TransferSyntaxUID = pydicom.uid.ExplicitVRLittleEndian
+
+    name_dicom = tmp_path / "pixels.dcm"
+    dicom = pydicom.dataset.FileDataset(
+        name_dicom.name, {}, file_meta=file_meta, preamble=b"\0" * 128
+    )
+    dicom.SeriesInstanceUID = "1.2.3.4"
+    dicom.SeriesDescription = "T1w"
+    dicom.ImageComments = "after discovery tags"
+    dicom.PixelData = b"\1" * 4096
+    dicom["PixelData"].VR = "OB"
+    dicom.save_as(name_dicom, write_like_original=False)
+
+    raw = name_dicom.read_bytes()
+    offset_comments = raw.index(b"after discovery tags")
+
+    class TrackedBytesIO(io.BytesIO):
+        """BytesIO recording the furthest byte read"""
+
+        furthest = 0
+
+        def read(self, size=-1):
+            data = super().read(size)
+            self.furthest = max(self.furthest, self.tell())
+            return data
+
+    in_dicom = TrackedBytesIO(raw)
+    header = scanners.read_discovery_header(in_dicom)
+
+    assert header.SeriesInstanceUID == "1.2.3.4"
+    assert "SeriesDescription" not in header
+    assert "PixelData" not in header
+    # Only the tag header of the first element after discovery tags is read
+    assert in_dicom.furthest <= offset_comments
+
+
+def test_merge_unique_series():
+    """Test merging keeps the representative of the earliest partition"""
+
+    merged = scanners.merge_unique_series(
+        [
+            {"1": {"files": 2, "path": "a"}},
+            {"2": {"files": 1, "path": "b"}, "1": {"files": 3, "path": "c"}},
+        ]
+    )
+
+    assert list(merged) == ["1", "2"]
+    assert merged["1"] == {"files": 5, "path": "a"}
+
+
+def test_read_series_uid_no_preamble(tmp_path, dicom_dir):
+    """Test the fallback for DICOM files without a preamble"""
+
+    name_dicom = sorted(dicom_dir.glob("t1_mag_*.dcm"))[0]
+    name_no_preamble = tmp_path / "no_preamble.dcm"
+    dicom = pydicom.dcmread(name_dicom)
+    dicom.preamble = None
+    dicom.file_meta = pydicom.dataset.FileMetaDataset()
+    dicom.save_as(name_no_preamble, write_like_original=True)
+    name_text = tmp_path / "notes.txt"
+    name_text.write_text("not a DICOM\n" * 20)
+
+    with name_no_preamble.open("rb") as in_dicom:
+        assert scanners.read_series_uid(in_dicom) is None
+        assert scanners.read_series_uid(in_dicom, allow_no_preamble=True) == "1"
+        assert scanners.read_representative_header(in_dicom).Rows == 256
+
+    with name_text.open("rb") as in_text:
+        assert scanners.read_series_uid(in_text, allow_no_preamble=True) is None
+
+
+def test_walk_files(tmp_path):
+    """Test walking a mixed BIDS and sourcedata tree"""
+
+    (tmp_path / "sourcedata" / "ses-01").mkdir(parents=True)
+    (tmp_path / "sub-01" / "anat").mkdir(parents=True)
+    (tmp_path / "derivatives").mkdir()
+    for name in [
+        "sourcedata/ses-01/b.dcm",
+        "sourcedata/ses-01/a.dcm",
+        "sourcedata/ses-01/IM0001",
+        "sub-01/anat/sub-01_T1w.nii.gz",
+        "sub-01/anat/sub-01_T1w.json",
+        "derivatives/c.dcm",
+    ]:
+        (tmp_path / name).touch()
+
+    def names(files):
+        return [x.relative_to(tmp_path).as_posix() for x in files]
+
+    assert names(scanners.walk_files(tmp_path)) == [
+        "derivatives/c.dcm",
+        "sourcedata/ses-01/IM0001",
+        "sourcedata/ses-01/a.dcm",
+        "sourcedata/ses-01/b.dcm",
+    ]
+    assert names(scanners.walk_files(tmp_path, exclude=["derivatives"])) == [
+        "sourcedata/ses-01/IM0001",
+        "sourcedata/ses-01/a.dcm",
+        "sourcedata/ses-01/b.dcm",
+    ]
+    assert names(scanners.walk_files(tmp_path, include=["*.dcm", "*.json"])) == [
+        "derivatives/c.dcm",
+        "sourcedata/ses-01/a.dcm",
+        "sourcedata/ses-01/b.dcm",
+        "sub-01/anat/sub-01_T1w.json",
+    ]
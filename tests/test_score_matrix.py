@@ -0,0 +1,80 @@
+"""
+Tests for score_matrix.py
+"""
+
+import copy
+import logging
+
+import pytest
+
+from protocol_qc import build_templates, generate_tags, score_matrix
+from protocol_qc.match_statuses import MatchStatus
+
+logger = logging.getLogger()
+
+pytest.importorskip("numpy")
+
+
+def match_results(protocol):
+    """Results of the series templates of a compared protocol"""
+
+    return [
+        (x.match_status, x.matches, x.num_dupes, x.incomplete_data)
+        for x in protocol.get_template_series()
+    ]
+
+
+@pytest.mark.parametrize(
+    "name_config, name_data",
+    [
+        ("config_t1", "data_series"),
+        ("config_t1_partial", "data_series"),
+        ("config_t1", "data_series_duplicates"),
+        ("config_t1_duplicates_allow", "data_series_duplicates"),
+    ],
+)
+def test_score_matrix(monkeypatch, request, config_flair, name_config, name_data):
+    """Test the score matrix gives the same results as the series templates"""
+
+    # fMRI templates are left out, so there are extra series
+    template = (
+        "config_t1_flair.json",
+        {**request.getfixturevalue(name_config), **config_flair},
+    )
+    all_series = request.getfixturevalue(name_data)
+
+    protocol = build_templates.build_templates(
+        copy.deepcopy(template), 0.9, "mock_id", logger
+    )
+    protocol.compare_protocol(all_series)
+    assert protocol.score_matrix is not None
+
+    monkeypatch.setattr(score_matrix, "HAS_NUMPY", False)
+    protocol_lists = build_templates.build_templates(
+        copy.deepcopy(template), 0.9, "mock_id", logger
+    )
+    protocol_lists.compare_protocol(all_series)
+    assert protocol_lists.score_matrix is None
+
+    assert match_results(protocol) == match_results(protocol_lists)
+    assert protocol.extra_series == protocol_lists.extra_series > 0
+    assert protocol.score == protocol_lists.score
+
+    tags, tags_lists = {}, {}
+    generate_tags.gen_protocol_tags(protocol, tags)
+    generate_tags.gen_protocol_tags(protocol_lists, tags_lists)
+    assert tags == tags_lists
+
+
+def test_score_matrix_empty(data_series, config_t1):
+    """Test a protocol without comparisons matches nothing"""
+
+    protocol = build_templates.build_templates(
+        ("config_t1.json", config_t1), 0.9, "mock_id", logger
+    )
+    matrix = score_matrix.ScoreMatrix(protocol.get_template_series(), data_series)
+    matrix.calc_match_status()
+
+    assert all(x.match_status == MatchStatus.NOMATCH for x in matrix.templates_series)
+    assert len(matrix.unmatched()) == len(data_series)
+    assert all(x == (0.0, []) for x in matrix.best_matches().values())